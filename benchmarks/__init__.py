@@ -0,0 +1,31 @@
+"""
+Micro-benchmarks for onedrived. Every module is runnable on its own, e.g. `python3 -m benchmarks.bench_items_db`, and
+prints a table of results. They are not part of the test suite.
+"""
+
+import time
+
+
+def time_per_call(func, args_list):
+    """
+    :param func: The function to measure.
+    :param list[tuple] args_list: Positional arguments of each call.
+    :return float: Average wall time of one call, in seconds.
+    """
+    start = time.perf_counter()
+    for args in args_list:
+        func(*args)
+    return (time.perf_counter() - start) / max(len(args_list), 1)
+
+
+def print_table(header, rows):
+    """
+    :param [str] header: Column names.
+    :param [list] rows: Rows of values. Floats are printed with 2 decimals.
+    """
+    cells = [list(header)] + [[('%.2f' % v) if isinstance(v, float) else str(v) for v in row] for row in rows]
+    widths = [max(len(row[i]) for row in cells) for i in range(len(header))]
+    for i, row in enumerate(cells):
+        print('  '.join(c.rjust(w) for c, w in zip(row, widths)))
+        if i == 0:
+            print('  '.join('-' * w for w in widths))
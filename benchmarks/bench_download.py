@@ -0,0 +1,58 @@
+"""
+Measure download throughput of DriveObject.download_file against a local range-serving stub whose connections are
+throttled, as connections to the service are.
+
+    python3 -m benchmarks.bench_download [SIZE_MB] [CONNECTION_MB_PER_SEC]
+
+Each row downloads the same file into a temporary file with a different config.max_get_concurrency. With more than
+one connection, "read back MB" is how much of the file was read back to hash it rather than hashed as it arrived.
+"""
+
+import sys
+import tempfile
+import time
+
+from benchmarks import print_table
+from onedrived.common import drive_config, hasher
+from tests.factory import drive_factory, server_factory
+
+DEFAULT_SIZE_MB = 64
+DEFAULT_CONNECTION_MB_PER_SEC = 16
+FRAGMENT_BYTES = 4 << 20
+CONCURRENCY = [1, 2, 4, 8]
+
+
+class RecordingRangeHasher(hasher.OrderedRangeHasher):
+    # Instances created by the last download.
+    instances = []
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.instances.append(self)
+
+
+def run(server, size, concurrency):
+    drive = drive_factory.get_sample_drive_object()
+    drive.root.account.session.session.trust_env = False
+    drive.drive_uri = server.url
+    drive.config = drive_config.DriveConfig({'max_get_size_bytes': FRAGMENT_BYTES, 'max_get_concurrency': concurrency})
+    RecordingRangeHasher.instances = []
+    with tempfile.TemporaryFile(mode='w+b') as f:
+        start = time.perf_counter()
+        drive.download_file(file=f, size=size, item_id='bench')
+        elapsed = time.perf_counter() - start
+    read_back = sum(h.bytes_read_back for h in RecordingRangeHasher.instances)
+    return [concurrency, size >> 20, elapsed, size / elapsed / (1 << 20), read_back / (1 << 20)]
+
+
+def main():
+    size = (int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_SIZE_MB) << 20
+    rate = (int(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_CONNECTION_MB_PER_SEC) << 20
+    hasher.OrderedRangeHasher = RecordingRangeHasher
+    with server_factory.ContentServer(size, bytes_per_sec=rate) as server:
+        rows = [run(server, size, n) for n in CONCURRENCY]
+    print_table(['concurrency', 'MB', 'seconds', 'MB/sec', 'read back MB'], rows)
+
+
+if __name__ == '__main__':
+    main()
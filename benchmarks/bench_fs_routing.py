@@ -0,0 +1,58 @@
+"""
+Measure how fast FileSystemMonitor routes event paths to drives, with the drive roots in a PathTrie, against the loop
+over all drives with str.startswith() and str.replace() it replaced.
+
+    python3 -m benchmarks.bench_fs_routing [NUM_EVENTS]
+
+Drive roots are siblings, e.g., '/home/user/OneDrive 0012', and events are spread evenly over them at depths of 1 to 4
+below their roots. Root names are of equal length, so that no root is a string prefix of another and the loop finds
+the right drive.
+"""
+
+import random
+import sys
+
+from benchmarks import print_table, time_per_call
+from onedrived.common.fsmonitor import FileSystemMonitor
+from tests import mock
+
+DEFAULT_NUM_EVENTS = 100000
+
+
+class FakeConfig:
+    def __init__(self, local_root):
+        self.local_root = local_root
+
+
+class FakeDrive:
+    def __init__(self, local_root):
+        self.config = FakeConfig(local_root)
+
+NUM_DRIVES = [1, 10, 100, 1000]
+
+
+def loop_route(all_drives, local_path):
+    for d in all_drives:
+        if local_path.startswith(d.config.local_root):
+            return d, local_path.replace(d.config.local_root, '', 1)
+    return None, None
+
+
+def main():
+    num_events = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_NUM_EVENTS
+    rand = random.Random(0)
+    rows = []
+    for num_drives in NUM_DRIVES:
+        all_drives = [FakeDrive('/home/user/OneDrive %04d' % i) for i in range(num_drives)]
+        drive_store = mock.Mock(get_all_drives=mock.Mock(return_value={i: d for i, d in enumerate(all_drives)}))
+        monitor = FileSystemMonitor(drive_store, mock.Mock(), mock.Mock())
+        paths = [(rand.choice(all_drives).config.local_root + '/dir' * rand.randint(0, 3) + '/file',)
+                 for _ in range(num_events)]
+        trie_sec = time_per_call(monitor._route, paths)
+        loop_sec = time_per_call(lambda p: loop_route(all_drives, p), paths)
+        rows.append([num_drives, num_events, loop_sec * 1e6, trie_sec * 1e6, 1 / trie_sec])
+    print_table(['drives', 'events', 'loop us/event', 'trie us/event', 'trie events/sec'], rows)
+
+
+if __name__ == '__main__':
+    main()
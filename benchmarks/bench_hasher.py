@@ -0,0 +1,58 @@
+"""
+Measure hashing throughput of a file: each digest alone, all digests in the single pass of hasher.hash_file, the two
+passes of hash_value and crc32_value used before, and the aggregate of several files hashed by the process pool.
+
+    python3 -m benchmarks.bench_hasher [SIZE_MB] [FILES]
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from benchmarks import print_table
+from onedrived.common import hasher
+
+DEFAULT_SIZE_MB = 256
+DEFAULT_FILES = os.cpu_count()
+
+
+def measure(name, func, size):
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    return [name, size >> 20, elapsed, size / elapsed / (1 << 20)]
+
+
+def main():
+    size = (int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_SIZE_MB) << 20
+    files = int(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_FILES
+    tmpdir = tempfile.mkdtemp()
+    try:
+        paths = [os.path.join(tmpdir, str(i)) for i in range(files)]
+        block = os.urandom(1 << 20)
+        for path in paths:
+            with open(path, 'wb') as f:
+                for _ in range(size >> 20):
+                    f.write(block)
+        path = paths[0]
+        # Read the file once so that every measurement finds it in page cache.
+        hasher.hash_file(path, digests=())
+        rows = [measure(digest, lambda: hasher.hash_file(path, digests=[digest]), size)
+                for digest in (hasher.SHA1, hasher.CRC32, hasher.QUICK_XOR)]
+        rows.append(measure('sha1+crc32, 2 passes', lambda: (hasher.hash_value(path), hasher.crc32_value(path)), size))
+        rows.append(measure('sha1+crc32, 1 pass', lambda: hasher.hash_file(path), size))
+        all_digests = (hasher.SHA1, hasher.CRC32, hasher.QUICK_XOR)
+        rows.append(measure('all, 1 pass', lambda: hasher.hash_file(path, digests=all_digests), size))
+        # Start the workers before measuring.
+        hasher.submit_hash_file(path, digests=()).result()
+        rows.append(measure('sha1+crc32, %d files in pool' % files,
+                            lambda: [f.result() for f in [hasher.submit_hash_file(p) for p in paths]], size * files))
+    finally:
+        shutil.rmtree(tmpdir)
+    print_table(['digests', 'MB', 'seconds', 'MB/sec'], rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+"""
+Compare the write throughput of ItemStorage.update_item under different commit policies on a file-backed database.
+
+    python3 -m benchmarks.bench_item_writes [NUM_WRITES]
+
+"per-write" commits every statement, which is what ItemStorage did before group commit. "group" uses the default
+WriteBatcher settings and "batch" wraps all writes in one ItemStorage.batch() block.
+"""
+
+import copy
+import os
+import sys
+import tempfile
+import time
+
+from benchmarks import print_table
+from onedrived.api import items
+from onedrived.store import items_db
+from tests import get_data
+from tests.factory import drive_factory, mock_factory
+
+DEFAULT_NUM_WRITES = 5000
+
+
+def make_items(drive, n):
+    template = get_data('image_item.json')
+    ret = []
+    for i in range(n):
+        data = copy.deepcopy(template)
+        data['id'] = 'id!%d' % i
+        data['name'] = 'file%d.jpg' % i
+        ret.append(items.OneDriveItem(drive, data))
+    return ret
+
+
+def run(policy, all_items):
+    fd, db_path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    store = items_db.ItemStorage(db_path, drive_factory.get_sample_drive_object())
+    if policy == 'per-write':
+        store._batcher.max_rows = 1
+    start = time.perf_counter()
+    if policy == 'batch':
+        with store.batch():
+            for item in all_items:
+                store.update_item(item)
+    else:
+        for item in all_items:
+            store.update_item(item)
+    store.flush()
+    elapsed = time.perf_counter() - start
+    num_commits = store._batcher.num_commits
+    store.close()
+    os.remove(db_path)
+    return [policy, len(all_items), num_commits, elapsed, len(all_items) / elapsed]
+
+
+def main():
+    mock_factory.mock_register()
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_NUM_WRITES
+    all_items = make_items(drive_factory.get_sample_drive_object(), n)
+    print_table(['policy', 'writes', 'commits', 'seconds', 'writes/sec'],
+                [run(policy, all_items) for policy in ['per-write', 'group', 'batch']])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""
+Measure item lookups of ItemStorage as the items table grows.
+
+    python3 -m benchmarks.bench_items_db [--without-indexes] [SIZE ...]
+
+Records are laid out as directories of 100 files grouped ten per parent, the shape MergeDirTask and FileSystemMonitor
+query. With indexes the time per lookup stays flat from 10k to 1M records; --without-indexes drops them to show the
+full-scan baseline.
+"""
+
+import random
+import sys
+
+from benchmarks import print_table, time_per_call
+from onedrived.store import items_db
+from tests.factory import drive_factory, mock_factory
+
+DEFAULT_SIZES = [10000, 100000, 1000000]
+ENTRIES_PER_DIR = 100
+NUM_LOOKUPS = 2000
+
+
+def fill_storage(store, size):
+    rows = []
+    for i in range(size):
+        d = i // ENTRIES_PER_DIR
+        rows.append(('id!%d' % i, 'file', 'file%d' % i, 'dir!%d' % d, '/drive/root:/g%d/dir%d' % (d // 10, d), 'e', 'c',
+                     i, '2015-01-01T00:00:00Z', '2015-01-01T00:00:00Z', 'OK', 'crc%d' % i, 'sha%d' % i))
+    store._conn.execute('BEGIN')
+    store._conn.executemany('INSERT INTO items (item_id, type, item_name, parent_id, parent_path, etag, ctag, size, '
+                            'created_time, modified_time, status, crc32_hash, sha1_hash) '
+                            'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+    store._conn.execute('COMMIT')
+    return rows
+
+
+def count_descendants(store, path):
+    return store._conn.execute('SELECT COUNT(*) FROM items WHERE parent_path>=? AND parent_path<?',
+                               items_db.get_descendant_range(path)).fetchone()[0]
+
+
+def run(size, with_indexes):
+    store = items_db.ItemStorage(':memory:', drive_factory.get_sample_drive_object())
+    if not with_indexes:
+        for name in ['items_by_parent_path', 'items_by_parent_id', 'items_by_crc32_hash', 'items_by_sha1_hash']:
+            store._conn.execute('DROP INDEX ' + name)
+    rows = fill_storage(store, size)
+    sample = random.sample(rows, min(NUM_LOOKUPS, size))
+    result = [size,
+              time_per_call(lambda r: store.get_items_by_id(parent_path=r[4], item_name=r[2]), [(r,) for r in sample]),
+              time_per_call(lambda r: store.get_items({'parent_id': r[3]}), [(r,) for r in sample]),
+              time_per_call(lambda r: store.get_items_by_hash(crc32_hash=r[11], sha1_hash=r[12]),
+                            [(r,) for r in sample]),
+              time_per_call(lambda r: count_descendants(store, r[4].rsplit('/', 1)[0]), [(r,) for r in sample[:100]])]
+    store.close()
+    return [result[0]] + [t * 1e6 for t in result[1:]]
+
+
+def main():
+    mock_factory.mock_register()
+    args = sys.argv[1:]
+    with_indexes = '--without-indexes' not in args
+    sizes = [int(a) for a in args if not a.startswith('--')] or DEFAULT_SIZES
+    print('Lookup time per call in microseconds (%s indexes).' % ('with' if with_indexes else 'without'))
+    print_table(['records', 'path+name', 'parent_id', 'hash', 'subtree'], [run(n, with_indexes) for n in sizes])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+"""
+Count the syscalls MergeDirTask makes to examine local entries, with os.scandir() and the cached stat results of
+LocalDir, against os.listdir() and the os.path calls it replaced, and time both.
+
+    python3 -m benchmarks.bench_merge_listing [NUM_ENTRIES]
+
+Each scenario is a directory whose entries all exist remotely too, as when merging a directory that is in sync. The
+directory is listed and every entry is checked for existence and type, and files for size and mtime. Syscalls are
+counted by wrapping os.stat(), os.listdir() and os.scandir(). os.DirEntry makes its stat syscall on the first call of
+stat() and caches it, and takes the type from the listing, so the first stat() of each entry counts as one syscall.
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+
+from benchmarks import print_table, time_per_call
+from onedrived.common.tasks import utils
+from tests import mock
+
+DEFAULT_NUM_ENTRIES = 10000
+
+
+def old_merge_local(path):
+    """ The checks of MergeDirTask before LocalDir, in the same order. """
+    names = os.listdir(path)
+    for name in names:
+        os.path.isdir(path + '/' + name)
+    for name in names:
+        p = path + '/' + name
+        if os.path.exists(p) and not os.path.isdir(p):
+            os.path.getsize(p), os.path.getmtime(p)
+
+
+def new_merge_local(path):
+    local_dir = utils.LocalDir(path)
+    names = local_dir.list()
+    for name in names:
+        utils.is_dir_entry(local_dir.get(name))
+    for name in names:
+        ent = local_dir.get(name)
+        if not utils.is_dir_entry(ent):
+            st = utils.stat_entry(ent)
+            if st is not None:
+                st.st_size, st.st_mtime
+
+
+class _CountedEntry:
+    """ Wraps os.DirEntry to count the syscall of its first stat(). """
+
+    def __init__(self, ent, counts):
+        self._ent = ent
+        self._counts = counts
+        self._statted = False
+        self.name = ent.name
+
+    def is_dir(self):
+        return self._ent.is_dir()
+
+    def stat(self):
+        if not self._statted:
+            self._statted = True
+            self._counts[0] += 1
+        return self._ent.stat()
+
+
+class _CountedScandir:
+    def __init__(self, it, counts):
+        self._it = it
+        self._counts = counts
+
+    def __enter__(self):
+        self._it.__enter__()
+        return self
+
+    def __exit__(self, *args):
+        return self._it.__exit__(*args)
+
+    def __iter__(self):
+        return (_CountedEntry(ent, self._counts) for ent in self._it)
+
+
+def count_syscalls(func, path):
+    counts = [0]
+    real_stat, real_listdir, real_scandir = os.stat, os.listdir, os.scandir
+
+    def counted(f):
+        def wrapper(*args, **kwargs):
+            counts[0] += 1
+            return f(*args, **kwargs)
+        return wrapper
+
+    with mock.patch('os.stat', counted(real_stat)), mock.patch('os.listdir', counted(real_listdir)), \
+            mock.patch('os.scandir', counted(lambda p: _CountedScandir(real_scandir(p), counts))):
+        func(path)
+    return counts[0]
+
+
+def make_dir(path, num_files, num_dirs):
+    os.mkdir(path)
+    for i in range(num_files):
+        with open('%s/file%06d' % (path, i), 'wb') as f:
+            f.write(b'x')
+    for i in range(num_dirs):
+        os.mkdir('%s/dir%06d' % (path, i))
+
+
+def main():
+    num_entries = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_NUM_ENTRIES
+    tmpdir = tempfile.mkdtemp()
+    try:
+        rows = []
+        for name, num_files, num_dirs in [('files', num_entries, 0), ('dirs', 0, num_entries),
+                                          ('half and half', num_entries // 2, num_entries - num_entries // 2)]:
+            path = tmpdir + '/' + name.replace(' ', '_')
+            make_dir(path, num_files, num_dirs)
+            row = [name, num_entries]
+            for func in (old_merge_local, new_merge_local):
+                row.append(count_syscalls(func, path) / num_entries)
+            for func in (old_merge_local, new_merge_local):
+                row.append(time_per_call(func, [(path,)] * 5) / num_entries * 1e6)
+            rows.append(row)
+        print_table(['entries', 'count', 'old syscalls/entry', 'new syscalls/entry', 'old us/entry', 'new us/entry'],
+                    rows)
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""
+Measure how long it takes to go through a paged listing whose pages each take time to analyze, as MergeDirTask does,
+fetching pages ahead at several depths with items.iter_pages().
+
+    python3 -m benchmarks.bench_page_prefetch [RTT_MS] [NUM_PAGES]
+
+Fetching a page takes one round trip of RTT_MS (default 50). Analyzing a page takes a fraction of that.
+"""
+
+import sys
+import time
+
+from benchmarks import print_table
+from onedrived.api import items
+
+DEFAULT_RTT_MS = 50
+
+DEFAULT_NUM_PAGES = 20
+
+DEPTHS = [0, 1, 2, 4]
+
+# Time to analyze a page, relative to the round trip.
+WORK_RATIOS = [0.25, 1, 2]
+
+
+class FakeCollection:
+    def __init__(self, num_pages, rtt_sec):
+        self.num_pages = num_pages
+        self.rtt_sec = rtt_sec
+        self.fetched = 0
+
+    @property
+    def has_next(self):
+        return self.fetched < self.num_pages
+
+    def get_next(self):
+        time.sleep(self.rtt_sec)
+        self.fetched += 1
+        return [self.fetched]
+
+
+def walk(num_pages, rtt_sec, work_sec, depth):
+    """
+    :return float: Seconds until every page is analyzed.
+    """
+    start = time.perf_counter()
+    for _ in items.iter_pages(FakeCollection(num_pages, rtt_sec), depth):
+        time.sleep(work_sec)
+    return time.perf_counter() - start
+
+
+def main():
+    rtt_sec = (int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_RTT_MS) / 1000
+    num_pages = int(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_NUM_PAGES
+    rows = []
+    for ratio in WORK_RATIOS:
+        row = ['%.2f x RTT' % ratio]
+        for depth in DEPTHS:
+            row.append(walk(num_pages, rtt_sec, rtt_sec * ratio, depth))
+        rows.append(row)
+    print('RTT %d ms, %d pages.' % (rtt_sec * 1000, num_pages))
+    print_table(['analysis per page'] + ['depth %d sec' % d for d in DEPTHS], rows)
+
+
+if __name__ == '__main__':
+    main()
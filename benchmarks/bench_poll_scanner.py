@@ -0,0 +1,106 @@
+"""
+Measure how long PollingScanner takes to scan a tree, and how big its snapshot is.
+
+    python3 -m benchmarks.bench_poll_scanner [NUM_FILES] [DIR]
+
+The tree is made in a temporary directory under DIR, with 100 empty files per directory and 10 subdirectories per
+directory. Scans measured:
+
+ * baseline: the first scan, which lists every directory and stats every file.
+ * unchanged: no directory changed, so none is listed.
+ * check files: no directory changed, and every file is statted to find files written in place.
+ * 1 dir changed: a file is added to one directory, so only that directory is listed.
+ * reload: a new scanner on the snapshot saved on disk, including the load of the snapshot. The directory changed
+   before is listed again, as its mtime was too recent to trust.
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from benchmarks import print_table
+from onedrived.common.metrics import MetricSet
+from onedrived.common.poll_scanner import PollingScanner
+from onedrived.store.snapshot_db import SnapshotIndex
+
+DEFAULT_NUM_FILES = 100000
+
+FILES_PER_DIR = 100
+
+SUBDIRS_PER_DIR = 10
+
+
+def make_tree(root, num_files):
+    """
+    :return [str]: Paths of all directories, in the order they were made.
+    """
+    dirs = [root]
+    made = 0
+    i = 0
+    while made < num_files:
+        parent = dirs[i]
+        for j in range(FILES_PER_DIR):
+            open('%s/file%03d' % (parent, j), 'w').close()
+        made += FILES_PER_DIR
+        for j in range(SUBDIRS_PER_DIR):
+            if len(dirs) * FILES_PER_DIR >= num_files:
+                break
+            path = '%s/dir%02d' % (parent, j)
+            os.mkdir(path)
+            dirs.append(path)
+        i += 1
+    return dirs
+
+
+def timed_scan(name, scanner, check_files=False, start=None):
+    """
+    :return list: A row of results.
+    """
+    events = []
+    scanner.metrics = MetricSet()
+    if start is None:
+        start = time.perf_counter()
+    scanner.scan(lambda *args: events.append(args), check_files=check_files)
+    sec = time.perf_counter() - start
+    counters = scanner.metrics.snapshot()
+    return [name, sec, counters.get('dirs_listed', 0), counters.get('dirs_skipped', 0),
+            counters.get('files_statted', 0), len(events)]
+
+
+def main():
+    num_files = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_NUM_FILES
+    tmpdir = tempfile.mkdtemp(dir=sys.argv[2] if len(sys.argv) > 2 else None)
+    try:
+        root = tmpdir + '/tree'
+        os.mkdir(root)
+        dirs = make_tree(root, num_files)
+        # Directories changed within a tick of a scan are listed again by the next one, so make them older, as
+        # directories of a tree in use mostly are.
+        t = time.time() - 60
+        for path in dirs:
+            os.utime(path, (t, t))
+        db_path = tmpdir + '/snapshot.db'
+        rows = []
+        scanner = PollingScanner([root], SnapshotIndex(db_path))
+        for name, prepare, check_files in [('baseline', None, False), ('unchanged', None, False),
+                                           ('check files', None, True),
+                                           ('1 dir changed', lambda: open(dirs[-1] + '/new', 'w').close(), False)]:
+            if prepare is not None:
+                prepare()
+            rows.append(timed_scan(name, scanner, check_files))
+        scanner.index.close()
+        start = time.perf_counter()
+        scanner = PollingScanner([root], SnapshotIndex(db_path))
+        rows.append(timed_scan('reload', scanner, start=start))
+        scanner.index.close()
+        print('%d files in %d directories. Snapshot is %.1f MiB.' % (
+            len(dirs) * FILES_PER_DIR, len(dirs), os.path.getsize(db_path) / 2 ** 20))
+        print_table(['scan', 'sec', 'dirs listed', 'dirs skipped', 'files statted', 'events'], rows)
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    main()
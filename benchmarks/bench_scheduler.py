@@ -0,0 +1,66 @@
+"""
+Measure delayed calls run by the shared Scheduler against a sleeping thread per call, as AsyncCopyMonitorTask.put_back
+did, and a threading.Timer per call, as WriteBatcher did.
+
+    python3 -m benchmarks.bench_scheduler [NUM_CALLS] [DELAY_SEC]
+
+Each row reports the time to schedule all calls, the peak number of threads while they were pending, and how late
+the calls ran on average and at most.
+"""
+
+import sys
+import threading
+import time
+
+from benchmarks import print_table
+from onedrived.common.scheduler import Scheduler
+
+DEFAULT_NUM_CALLS = 2000
+DEFAULT_DELAY_SEC = 1.0
+
+
+def sleeping_thread(delay_sec, func, *args):
+    def run():
+        time.sleep(delay_sec)
+        func(*args)
+
+    t = threading.Thread(target=run, daemon=True)
+    t.start()
+
+
+def timer_thread(delay_sec, func, *args):
+    t = threading.Timer(delay_sec, func, args)
+    t.daemon = True
+    t.start()
+
+
+def measure(name, call_later, num_calls, delay_sec):
+    lateness = []
+    done = threading.Event()
+
+    def on_call(due):
+        lateness.append(time.monotonic() - due)
+        if len(lateness) == num_calls:
+            done.set()
+
+    start = time.monotonic()
+    for _ in range(num_calls):
+        call_later(delay_sec, on_call, time.monotonic() + delay_sec)
+    schedule_sec = time.monotonic() - start
+    peak_threads = threading.active_count()
+    done.wait()
+    return [name, num_calls, schedule_sec * 1000, peak_threads, sum(lateness) / num_calls * 1000,
+            max(lateness) * 1000]
+
+
+def main():
+    num_calls = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_NUM_CALLS
+    delay_sec = float(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_DELAY_SEC
+    rows = [measure('Scheduler', Scheduler.get_instance().call_later, num_calls, delay_sec),
+            measure('threading.Timer', timer_thread, num_calls, delay_sec),
+            measure('thread + sleep()', sleeping_thread, num_calls, delay_sec)]
+    print_table(['method', 'calls', 'schedule ms', 'peak threads', 'mean late ms', 'max late ms'], rows)
+
+
+if __name__ == '__main__':
+    main()
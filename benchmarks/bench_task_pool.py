@@ -0,0 +1,126 @@
+"""
+Measure TaskPool operations with a large queue, against the list-backed pool it replaced.
+
+    python3 -m benchmarks.bench_task_pool [NUM_TASKS]
+
+Tasks are spread over directories of 100 files and alternate between two task classes. Each row reports the
+microseconds per add, per pop of any class, per pop of a given class, and the milliseconds to remove the tasks under
+one directory. The list-backed pool is measured only up to LEGACY_MAX_TASKS tasks, because its pops are linear in the
+queue length.
+"""
+
+import sys
+import threading
+import time
+
+from benchmarks import print_table
+from onedrived.store.task_pool import TaskPool
+
+DEFAULT_NUM_TASKS = [10000, 100000, 1000000]
+LEGACY_MAX_TASKS = 100000
+NUM_POPS = 10000
+
+
+class ListTaskPool(TaskPool):
+    """ The list-backed TaskPool before per-class queues. """
+
+    def __init__(self):
+        self.tasks_by_path = {}
+        self.queued_tasks = []
+        self.semaphore = threading.Semaphore(0)
+        self._lock = threading.Lock()
+
+    def add_task(self, task):
+        self._lock.acquire()
+        if task.local_path in self.tasks_by_path:
+            self._lock.release()
+            return
+        self.queued_tasks.append(task)
+        self.tasks_by_path[task.local_path] = task
+        self._lock.release()
+        self.semaphore.release()
+
+    def pop_task(self, task_class=None):
+        self._lock.acquire()
+        ret = None
+        if len(self.queued_tasks) > 0:
+            if task_class is None:
+                ret = self.queued_tasks.pop(0)
+            else:
+                for t in self.queued_tasks:
+                    if isinstance(t, task_class):
+                        ret = t
+                        self.queued_tasks.remove(t)
+                        break
+        if ret is not None and not ret.should_hold:
+            del self.tasks_by_path[ret.local_path]
+        self._lock.release()
+        return ret
+
+    def remove_children_tasks(self, local_parent_path):
+        with self._lock:
+            for t in self.queued_tasks[:]:
+                if t.local_path.startswith(local_parent_path):
+                    self.queued_tasks.remove(t)
+                    del self.tasks_by_path[t.local_path]
+
+
+class FakeTask:
+    should_hold = False
+    priority = (0.0, 'metadata')
+
+    def __init__(self, local_path):
+        self.local_path = local_path
+
+    def discard(self):
+        pass
+
+
+class FakeDownloadTask(FakeTask):
+    pass
+
+
+class FakeMergeTask(FakeTask):
+    pass
+
+
+def make_tasks(n):
+    return [(FakeDownloadTask if i % 2 == 0 else FakeMergeTask)('/home/u/OneDrive/d%d/f%d' % (i // 100, i))
+            for i in range(n)]
+
+
+def run(pool_class, tasks):
+    pool = pool_class()
+    start = time.perf_counter()
+    for t in tasks:
+        pool.add_task(t)
+    add_us = (time.perf_counter() - start) / len(tasks) * 1e6
+    # Remove a directory in the middle of the queue.
+    start = time.perf_counter()
+    pool.remove_children_tasks('/home/u/OneDrive/d%d' % (len(tasks) // 200))
+    remove_ms = (time.perf_counter() - start) * 1e3
+    num_pops = min(NUM_POPS, len(tasks) // 4)
+    start = time.perf_counter()
+    for i in range(num_pops):
+        pool.pop_task()
+    pop_us = (time.perf_counter() - start) / num_pops * 1e6
+    start = time.perf_counter()
+    for i in range(num_pops):
+        pool.pop_task(FakeMergeTask)
+    pop_class_us = (time.perf_counter() - start) / num_pops * 1e6
+    return [pool_class.__name__, len(tasks), add_us, pop_us, pop_class_us, remove_ms]
+
+
+def main():
+    sizes = [int(sys.argv[1])] if len(sys.argv) > 1 else DEFAULT_NUM_TASKS
+    rows = []
+    for n in sizes:
+        tasks = make_tasks(n)
+        rows.append(run(TaskPool, tasks))
+        if n <= LEGACY_MAX_TASKS:
+            rows.append(run(ListTaskPool, tasks))
+    print_table(['pool', 'tasks', 'add (us)', 'pop (us)', 'pop class (us)', 'remove dir (ms)'], rows)
+
+
+if __name__ == '__main__':
+    main()
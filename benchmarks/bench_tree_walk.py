@@ -0,0 +1,135 @@
+"""
+Measure how long it takes to discover a remote tree, merging directories the way MergeDirTask does, with TreeWalker
+listing directories ahead at several concurrency windows. A window of 0 is the walk without TreeWalker: each
+directory is listed by the worker that merges it.
+
+    python3 -m benchmarks.bench_tree_walk [RTT_MS] [NUM_WORKERS]
+
+Listing a directory takes one round trip of RTT_MS (default 20) and returns one page. NUM_WORKERS (default 2) task
+workers merge directories, popping them from a FIFO queue as the task pool does.
+"""
+
+import queue
+import sys
+import threading
+import time
+
+from benchmarks import print_table
+from onedrived.api import items
+from onedrived.common.tree_walker import TreeWalker
+
+DEFAULT_RTT_MS = 20
+
+DEFAULT_NUM_WORKERS = 2
+
+WINDOWS = [0, 4, 16]
+
+ROOT = '/drive/root:/'
+
+
+def make_tree(fan_out, depth, num_chains=0, chain_depth=0):
+    """
+    :return dict[str, [str]]: Names of subdirectories by remote path: a tree of the given fan-out and depth, plus
+    chains of directories hanging from the root.
+    """
+    tree = {ROOT: []}
+    level = [ROOT]
+    for _ in range(depth):
+        next_level = []
+        for path in level:
+            for i in range(fan_out):
+                tree[path].append('d%d' % i)
+                child = path.rstrip('/') + '/d%d' % i
+                tree[child] = []
+                next_level.append(child)
+        level = next_level
+    for i in range(num_chains):
+        path = ROOT
+        name = 'chain%d' % i
+        for _ in range(chain_depth):
+            tree[path].append(name)
+            path = path.rstrip('/') + '/' + name
+            tree[path] = []
+            name = 'c'
+    return tree
+
+
+class FakeConfig:
+    def __init__(self, window):
+        self.max_list_concurrency = window
+        self.list_prefetch_pages = 0
+
+
+class FakeDrive:
+    def __init__(self, tree, rtt_sec, window):
+        self.tree = tree
+        self.rtt_sec = rtt_sec
+        self.config = FakeConfig(window)
+
+    def get_children(self, item_path):
+        time.sleep(self.rtt_sec)
+        return items.ItemCollection(self, {'value': [{'name': n, 'folder': {}} for n in self.tree[item_path]]})
+
+
+def walk(tree, rtt_sec, window, num_workers):
+    """
+    :return float: Seconds until every directory is merged.
+    """
+    drive = FakeDrive(tree, rtt_sec, window)
+    walker = TreeWalker(drive, window)
+    tasks = queue.Queue()
+    pending = [len(tree)]
+    done = threading.Event()
+    lock = threading.Lock()
+
+    def merge(rel_path, remote_path):
+        pages = walker.take(rel_path)
+        if pages is None:
+            pages = items.iter_pages(drive.get_children(item_path=remote_path))
+        for page in pages:
+            for item in page:
+                child = (rel_path + '/' + item.name, remote_path.rstrip('/') + '/' + item.name)
+                tasks.put(child)
+                walker.add(*child)
+
+    def work():
+        while True:
+            task = tasks.get()
+            if task is None:
+                return
+            merge(*task)
+            with lock:
+                pending[0] -= 1
+                if pending[0] == 0:
+                    done.set()
+
+    start = time.perf_counter()
+    tasks.put(('', ROOT))
+    workers = [threading.Thread(target=work, daemon=True) for _ in range(num_workers)]
+    for t in workers:
+        t.start()
+    done.wait()
+    sec = time.perf_counter() - start
+    for _ in workers:
+        tasks.put(None)
+    return sec
+
+
+def main():
+    rtt_sec = (int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_RTT_MS) / 1000
+    num_workers = int(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_NUM_WORKERS
+    trees = [('wide (1 x 300)', make_tree(300, 1)),
+             ('bushy (4^4)', make_tree(4, 4)),
+             ('deep (10 chains x 30)', make_tree(0, 0, num_chains=10, chain_depth=30))]
+    rows = []
+    for name, tree in trees:
+        row = [name, len(tree)]
+        for window in WINDOWS:
+            row.append(walk(tree, rtt_sec, window, num_workers))
+        rows.append(row)
+    print('RTT %d ms, %d workers.' % (rtt_sec * 1000, num_workers))
+    print_table(['tree', 'dirs'] + ['window %d sec' % w for w in WINDOWS], rows)
+
+
+if __name__ == '__main__':
+    main()
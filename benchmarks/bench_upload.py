@@ -0,0 +1,53 @@
+"""
+Measure upload time of DriveObject.put_large_file against a local upload session stub that adds latency to each
+request and throttles each fragment, as the service does.
+
+    python3 -m benchmarks.bench_upload [SIZE_MB] [RTT_MS] [MB_PER_SEC]
+
+Each row uploads the same file with a different fragment policy: fixed sizes pin config.max_put_fragment_bytes to
+config.max_put_size_bytes, and adaptive sizing starts from the default fragment size.
+"""
+
+import io
+import sys
+import time
+
+from benchmarks import print_table
+from onedrived.api.fragment_sizer import FragmentSizer
+from onedrived.common import drive_config
+from tests.factory import drive_factory, server_factory
+
+DEFAULT_SIZE_MB = 64
+DEFAULT_RTT_MS = 50
+DEFAULT_MB_PER_SEC = 32
+FIXED_FRAGMENTS = [FragmentSizer.UNIT_BYTES, 16 * FragmentSizer.UNIT_BYTES, FragmentSizer.MAX_BYTES]
+
+
+def run(policy, config, data, rtt_sec, bytes_per_sec):
+    drive = drive_factory.get_sample_drive_object()
+    drive.root.account.session.session.trust_env = False
+    drive.config = drive_config.DriveConfig(config)
+    with server_factory.UploadServer(rtt_sec, bytes_per_sec) as server:
+        drive.drive_uri = server.url
+        start = time.perf_counter()
+        drive.put_large_file('bench', io.BytesIO(data), len(data), parent_id='123')
+        elapsed = time.perf_counter() - start
+        fragments = server.fragments
+    return [policy, len(fragments), max(fragments) >> 10, elapsed, len(data) / elapsed / (1 << 20)]
+
+
+def main():
+    size = (int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_SIZE_MB) << 20
+    rtt_sec = (int(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_RTT_MS) / 1000
+    rate = (int(sys.argv[3]) if len(sys.argv) > 3 else DEFAULT_MB_PER_SEC) << 20
+    data = bytes(size)
+    rows = []
+    for n in FIXED_FRAGMENTS:
+        rows.append(run('fixed %d KB' % (n >> 10), {'max_put_size_bytes': n, 'max_put_fragment_bytes': n},
+                        data, rtt_sec, rate))
+    rows.append(run('adaptive', {}, data, rtt_sec, rate))
+    print_table(['policy', 'fragments', 'max KB', 'seconds', 'MB/sec'], rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""
+Measure throughput and peak memory of DriveObject.put_large_file with fragments read into one reusable buffer, as
+it does, against fragments read into a new bytes object each, as it did before. Uploads go to a local upload session
+stub without latency or throttling, so that the cost of preparing fragments shows.
+
+    python3 -m benchmarks.bench_upload_buffers [SIZE_MB] [FRAGMENT_KB]
+"""
+
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks import print_table
+from onedrived.api import drives
+from onedrived.common import drive_config
+from tests import mock
+from tests.factory import drive_factory, server_factory
+
+DEFAULT_SIZE_MB = 256
+DEFAULT_FRAGMENT_KB = 10240
+
+
+def read_new_bytes(data, offset, buf):
+    data.seek(offset)
+    return data.read(len(buf))
+
+
+def upload(f, size, fragment_bytes):
+    drive = drive_factory.get_sample_drive_object()
+    drive.root.account.session.session.trust_env = False
+    drive.config = drive_config.DriveConfig({'max_put_size_bytes': fragment_bytes,
+                                             'max_put_fragment_bytes': fragment_bytes})
+    with server_factory.UploadServer() as server:
+        drive.drive_uri = server.url
+        drive.put_large_file('bench', f, size, parent_id='123')
+
+
+def run(name, f, size, fragment_bytes):
+    start = time.perf_counter()
+    upload(f, size, fragment_bytes)
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    try:
+        upload(f, size, fragment_bytes)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return [name, size >> 20, elapsed, size / elapsed / (1 << 20), peak >> 10]
+
+
+def main():
+    size = (int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_SIZE_MB) << 20
+    fragment_bytes = (int(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_FRAGMENT_KB) << 10
+    with tempfile.TemporaryFile() as f:
+        for offset in range(0, size, 65536):
+            f.write(server_factory.generate_content(offset, 65536))
+        f.flush()
+        rows = [run('readinto()', f, size, fragment_bytes)]
+        with mock.patch.object(drives.DriveObject, '_read_fragment', staticmethod(read_new_bytes)):
+            rows.append(run('read()', f, size, fragment_bytes))
+    print_table(['fragments', 'MB', 'seconds', 'MB/sec', 'peak KB'], rows)
+
+
+if __name__ == '__main__':
+    main()
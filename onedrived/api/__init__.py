@@ -1 +1,2 @@
-__all__ = ['accounts', 'clients', 'drives', 'errors', 'facets', 'items', 'options', 'resources', 'restapi']
+__all__ = ['accounts', 'clients', 'drives', 'errors', 'facets', 'fragment_sizer', 'items', 'options', 'resources',
+           'restapi']
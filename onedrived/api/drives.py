@@ -5,14 +5,22 @@ https://github.com/OneDrive/onedrive-api-docs#root-resources
 """
 
 import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 import requests
+from requests.packages.urllib3.exceptions import HTTPError as StreamError
 
+from onedrived.api import errors
 from onedrived.api import facets
+from onedrived.api import fragment_sizer
 from onedrived.api import items
 from onedrived.api import options
 from onedrived.api import resources
 from onedrived.common import drive_config
+from onedrived.common import hasher
 from onedrived.common import logger_factory
 
 
@@ -82,6 +90,9 @@ class DriveObject:
 
     VERSION_KEY = '@version'
     VERSION_VALUE = 0
+    DOWNLOAD_BUFFER_BYTES = 262144
+    # Times a fragment the server did not receive any of is sent again, each time halved, before the upload fails.
+    MAX_FRAGMENT_RETRIES = 2
 
     logger = logger_factory.get_logger('DriveObject')
 
@@ -203,7 +214,8 @@ class DriveObject:
         return items.OneDriveItem(self, request.json())
 
     def upload_file(self, filename, data, size, parent_id=None, parent_path=None,
-                    conflict_behavior=options.NameConflictBehavior.REPLACE):
+                    conflict_behavior=options.NameConflictBehavior.REPLACE, session=None, on_progress=None,
+                    stream_hasher=None):
         """
         Upload a file object to the specified parent directory, the method of which is determined by file size.
         :param str filename: Name of the remote file.
@@ -212,15 +224,36 @@ class DriveObject:
         :param str | None parent_id: (Optional) ID of the parent directory.
         :param str | None parent_path: (Optional) Path to the parent directory.
         :param str conflict_behavior: (Optional) Specify the behavior to use if the file already exists.
+        :param onedrived.api.resources.UploadSession | None session: (Optional) See put_large_file.
+        :param on_progress: (Optional) See put_large_file.
+        :param onedrived.common.hasher.StreamHasher | None stream_hasher: (Optional) Fed with the content as it is
+        uploaded, so that the uploaded file need not be read again to hash it.
         :rtype: onedrived.api.items.OneDriveItem
         """
         if size <= self.config.max_put_size_bytes:
-            return self.put_file(filename, data, parent_id, parent_path, conflict_behavior)
+            return self.put_file(filename, data, parent_id, parent_path, conflict_behavior, stream_hasher)
         else:
-            return self.put_large_file(filename, data, size, parent_id, parent_path, conflict_behavior)
+            return self.put_large_file(filename, data, size, parent_id, parent_path, conflict_behavior,
+                                       session, on_progress, stream_hasher)
+
+    def get_upload_status(self, session):
+        """
+        Query the server for the ranges an upload session still expects.
+        https://github.com/OneDrive/onedrive-api-docs/blob/master/items/upload_large_files.md#request-upload-status
+        :param onedrived.api.resources.UploadSession session: The upload session, which is updated in place.
+        :return True | False: False if the session no longer exists, e.g., because it expired.
+        """
+        try:
+            request = self.root.account.session.get(session.upload_url)
+        except errors.OneDriveError as e:
+            self.logger.info('Upload session is no longer available: %s.', e)
+            return False
+        session.update(request.json())
+        return True
 
     def put_large_file(self, filename, data, size, parent_id=None, parent_path=None,
-                       conflict_behavior=options.NameConflictBehavior.REPLACE):
+                       conflict_behavior=options.NameConflictBehavior.REPLACE, session=None, on_progress=None,
+                       stream_hasher=None):
         """
         Upload a large file by splitting it into fragments.
         https://github.com/OneDrive/onedrive-api-docs/blob/master/items/upload_large_files.md
@@ -230,42 +263,115 @@ class DriveObject:
         :param str | None parent_id: (Optional) ID of the parent directory.
         :param str | None parent_path: (Optional) Path to the parent directory.
         :param str conflict_behavior: (Optional) Specify the behavior to use if the file already exists.
-        :rtype: onedrived.api.items.OneDriveItem
-        """
-        # Create an upload session.
-        if parent_id is not None:
-            parent_id += ':'
-        uri = self.get_item_uri(parent_id, parent_path) + '/' + filename + ':/upload.createSession'
-        payload = {'item': {'name': filename}}
-        if conflict_behavior != options.NameConflictBehavior.REPLACE:
-            payload['item']['@name.conflictBehavior'] = conflict_behavior
+        :param onedrived.api.resources.UploadSession | None session: (Optional) An upload session of the same content
+        created before. If the server still has it, the upload continues from where the server says it stopped.
+        :param on_progress: (Optional) A function called with the upload session and the offset of the next fragment,
+        when the session is created or resumed and after each fragment is accepted.
+        :param onedrived.common.hasher.StreamHasher | None stream_hasher: (Optional) Fed with the whole content in
+        order. Content uploaded before the session was resumed is read to do so.
+        :return onedrived.api.items.OneDriveItem | None: The uploaded item, if the server returned it.
+        """
+        sizer = fragment_sizer.FragmentSizer(self.config.max_put_size_bytes, self.config.max_put_fragment_bytes)
+        start = time.perf_counter()
+        if session is not None and self.get_upload_status(session) and len(session.next_ranges) > 0:
+            current_session = session
+            offset = session.next_ranges[0][0]
+            self.logger.info('Resumed upload session of "%s" at offset %d.', filename, offset)
+        else:
+            # Create an upload session.
+            if parent_id is not None:
+                parent_id += ':'
+            uri = self.get_item_uri(parent_id, parent_path) + '/' + filename + ':/upload.createSession'
+            payload = {'item': {'name': filename}}
+            if conflict_behavior != options.NameConflictBehavior.REPLACE:
+                payload['item']['@name.conflictBehavior'] = conflict_behavior
+            request = self.root.account.session.post(uri, json=payload)
+            current_session = resources.UploadSession(request.json())
+            offset = 0
+        sizer.on_request(time.perf_counter() - start)
+        if on_progress is not None:
+            on_progress(current_session, offset)
+
+        # Upload content. Fragments must come in order, so the offset is tracked locally rather than taken from the
+        # ranges the server expects, except when recovering from an error. Fragment size adapts to the connection.
         size_str = str(size)
-        request = self.root.account.session.post(uri, json=payload)
-        current_session = resources.UploadSession(request.json())
-
-        # Upload content.
-        expected_ranges = [(0, size - 1)]  # Use local value rather than that given in session.
-        while len(expected_ranges) > 0:  # Ranges must come in order
-            f, t = expected_ranges.pop(0)  # Both inclusive
-            if t is None or t >= size:
-                t = size - 1
-            next_cursor = f + self.config.max_put_size_bytes
-            if t >= next_cursor:
-                expected_ranges.insert(0, (next_cursor, t))
-                t = next_cursor - 1
-            data.seek(f)
-            chunk = data.read(t - f + 1)
+        buf = None
+        hashed_bytes = 0
+        retries = 0
+        while offset < size:
+            t = min(offset + sizer.fragment_bytes, size) - 1  # Both inclusive
+            if buf is None or len(buf) < t - offset + 1:
+                # Reused by all fragments, so it is only allocated again when fragments grow.
+                buf = memoryview(bytearray(sizer.fragment_bytes))
+            if stream_hasher is not None:
+                while hashed_bytes < offset:
+                    # Content the server received before the session was resumed, or before an error.
+                    n = min(len(buf), offset - hashed_bytes)
+                    stream_hasher.update(self._read_fragment(data, hashed_bytes, buf[:n]))
+                    hashed_bytes += n
+            chunk = self._read_fragment(data, offset, buf[:t - offset + 1])
+            if stream_hasher is not None and hashed_bytes == offset:
+                stream_hasher.update(chunk)
+                hashed_bytes = t + 1
             headers = {
-                'Content-Range': str(f) + '-' + str(t) + '/' + size_str
+                'Content-Range': str(offset) + '-' + str(t) + '/' + size_str
             }
-            request = self.root.account.session.put(current_session.upload_url, data=chunk, headers=headers,
-                                                    ok_status_code=requests.codes.accepted)
-            current_session.update(request.json())
-            # TODO: handle timeout error
-            # https://github.com/OneDrive/onedrive-api-docs/blob/master/items/upload_large_files.md#request-upload-status
+            start = time.perf_counter()
+            try:
+                request = self.root.account.session.put(
+                        current_session.upload_url, data=chunk, headers=headers,
+                        ok_status_code={requests.codes.accepted, requests.codes.ok, requests.codes.created})
+            except errors.OneDriveError:
+                sizer.on_failure()
+                # If the connection broke after the server received the fragment, sending it again is rejected.
+                # Continue from where the server says the upload is. If it made no progress, send the fragment again
+                # in the smaller size the sizer chose.
+                if not self.get_upload_status(current_session) or len(current_session.next_ranges) == 0 \
+                        or current_session.next_ranges[0][0] < offset:
+                    raise
+                if current_session.next_ranges[0][0] == offset:
+                    retries += 1
+                    if retries > self.MAX_FRAGMENT_RETRIES:
+                        raise
+                    self.logger.info('Sending fragment of "%s" at offset %d again in %d bytes.', filename, offset,
+                                     sizer.fragment_bytes)
+                    continue
+                retries = 0
+                offset = current_session.next_ranges[0][0]
+                self.logger.info('Upload of "%s" continues at offset %d reported by server.', filename, offset)
+            else:
+                retries = 0
+                sizer.on_success(len(chunk), time.perf_counter() - start)
+                offset = t + 1
+                if request.status_code != requests.codes.accepted:
+                    return items.OneDriveItem(self, request.json())
+                current_session.update(request.json())
+            if on_progress is not None:
+                on_progress(current_session, offset)
+        return None
+
+    @staticmethod
+    def _read_fragment(data, offset, buf):
+        """
+        Read a fragment of the file into the buffer. The buffer is sent as is, so no bytes object is created per
+        fragment. The file is read rather than memory-mapped because a file truncated while mapped kills the process.
+        :param file data: An opened file object available for reading.
+        :param int offset: Offset of the fragment in the file.
+        :param memoryview buf: A buffer as long as the fragment.
+        :return memoryview: The filled buffer.
+        """
+        data.seek(offset)
+        received = 0
+        while received < len(buf):
+            n = data.readinto(buf[received:])
+            if not n:
+                raise IOError('File ends at %d before the end of fragment at %d.' % (offset + received,
+                                                                                    offset + len(buf)))
+            received += n
+        return buf
 
     def put_file(self, filename, data, parent_id=None, parent_path=None,
-                 conflict_behavior=options.NameConflictBehavior.REPLACE):
+                 conflict_behavior=options.NameConflictBehavior.REPLACE, stream_hasher=None):
         """
         Use HTTP PUT to upload a file that is relatively small (less than 100M).
         :param str filename: Name of the remote file.
@@ -273,6 +379,8 @@ class DriveObject:
         :param str | None parent_id: (Optional) ID of the parent directory.
         :param str | None parent_path: (Optional) Path to the parent directory.
         :param str conflict_behavior: (Optional) Specify the behavior to use if the file already exists.
+        :param onedrived.common.hasher.StreamHasher | None stream_hasher: (Optional) Fed with the content. The
+        content is then read into memory once to be both hashed and sent.
         :rtype: onedrived.api.items.OneDriveItem
         """
         if parent_id is not None:
@@ -280,28 +388,146 @@ class DriveObject:
         uri = self.get_item_uri(parent_id, parent_path) + '/' + filename + ':/content'
         if conflict_behavior != options.NameConflictBehavior.REPLACE:
             uri += '?@name.conflictBehavior=' + conflict_behavior
+        if stream_hasher is not None:
+            data = data.read()
+            stream_hasher.update(data)
         request = self.root.account.session.put(uri, data=data, ok_status_code=requests.codes.created)
         return items.OneDriveItem(self, request.json())
 
-    def download_file(self, file, size, item_id=None, item_path=None):
+    def download_file(self, file, size, item_id=None, item_path=None, offset=0, on_progress=None):
         """
-        Download the target item to target file object. If the file is too large, download by fragments.
+        Download the target item to target file object. If the file is too large, download by fragments. Data is
+        streamed to the file through fixed-size buffers, so memory use does not grow with file or fragment size.
+
+        If the file is a real file opened for both reading and writing, e.g., with mode 'w+b', up to
+        config.max_get_concurrency fragments are downloaded at the same time and written at their offsets.
         :param file file: An open file object available for writing binary data.
         :param int size: Expected size of the item.
         :param str | None item_id: ID of the target file.
         :param str | None item_path: Path to the target file.
+        :param int offset: (Optional) Number of bytes at the start of the file that were downloaded before. They are
+        read back for hashing, so the file must be open for reading as well, and only the rest is downloaded.
+        :param on_progress: (Optional) A function called with the number of bytes from the start of the file that are
+        downloaded, each time a fragment completes them.
+        :return onedrived.common.hasher.StreamHasher: Hash values of the whole file.
+        """
+        if offset == 0 and size <= self.config.max_get_size_bytes:
+            ranges = [None]
+        else:
+            ranges = [(f, min(f + self.config.max_get_size_bytes, size) - 1)
+                      for f in range(offset, size, self.config.max_get_size_bytes)]
+        concurrency = min(self.config.max_get_concurrency, len(ranges))
+        if concurrency > 1 and '+' in getattr(file, 'mode', '') and hasattr(os, 'pwrite'):
+            file.flush()
+            return self._download_ranges_parallel(file.fileno(), size, offset, ranges, concurrency, item_id,
+                                                  item_path, on_progress)
+        buf = memoryview(bytearray(self.DOWNLOAD_BUFFER_BYTES))
+        stream_hasher = hasher.StreamHasher()
+        if offset > 0:
+            file.seek(0)
+            while stream_hasher.size < offset:
+                n = file.readinto(buf[:min(len(buf), offset - stream_hasher.size)])
+                if not n:
+                    raise IOError('File ends at %d before resume offset %d.' % (stream_hasher.size, offset))
+                stream_hasher.update(buf[:n])
+            file.seek(offset)
+
+        def write(data):
+            file.write(data)
+            stream_hasher.update(data)
+
+        for range_bytes in ranges:
+            self._stream_file_content(item_id, item_path, range_bytes, buf, write)
+            if on_progress is not None:
+                on_progress(stream_hasher.size)
+        # Ranges are checked as they are received, but a whole-file body is only known to be complete here.
+        if stream_hasher.size != size:
+            raise IOError('Received %d bytes of %d for item "%s".' % (stream_hasher.size, size, item_id or item_path))
+        return stream_hasher
+
+    def _download_ranges_parallel(self, fd, size, offset, ranges, concurrency, item_id, item_path, on_progress):
+        """
+        Download ranges of an item with a pool of threads, each writing to the file at the offsets of its range.
+        :param int fd: Descriptor of the file, open for reading and writing.
+        :param int size: Size of the item.
+        :param int offset: Number of bytes at the start of the file that were downloaded before.
+        :param [(int, int)] ranges: Consecutive ranges covering the item from offset.
+        :param int concurrency: Number of threads.
+        :param str | None item_id: ID of the target file.
+        :param str | None item_path: Path to the target file.
+        :param on_progress: A function called with the number of bytes downloaded from the start of the file, or None.
+        :rtype: onedrived.common.hasher.StreamHasher
+        """
+        # Allocate the whole file up front so that a full disk fails early and the file is not fragmented.
+        if hasattr(os, 'posix_fallocate'):
+            os.posix_fallocate(fd, 0, size)
+        else:
+            os.ftruncate(fd, size)
+        # The bytes downloaded before form one more range, which is complete from the start.
+        prefix = [(0, offset - 1)] if offset > 0 else []
+        range_hasher = hasher.OrderedRangeHasher(fd, prefix + ranges, self.DOWNLOAD_BUFFER_BYTES, on_progress)
+        buffers = threading.local()
+
+        def download_range(i):
+            if not hasattr(buffers, 'buf'):
+                buffers.buf = memoryview(bytearray(self.DOWNLOAD_BUFFER_BYTES))
+            offset = [ranges[i][0]]
+
+            def write(data):
+                start = offset[0]
+                rest = data
+                while len(rest) > 0:
+                    n = os.pwrite(fd, rest, offset[0])
+                    rest = rest[n:]
+                    offset[0] += n
+                range_hasher.update(len(prefix) + i, start, data)
+
+            self._stream_file_content(item_id, item_path, ranges[i], buffers.buf, write)
+            range_hasher.complete(len(prefix) + i)
+
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            futures = [executor.submit(range_hasher.complete, 0)] if offset > 0 else []
+            futures += [executor.submit(download_range, i) for i in range(len(ranges))]
+            try:
+                for future in futures:
+                    future.result()
+            finally:
+                for future in futures:
+                    future.cancel()
+        return range_hasher.hasher
+
+    def _stream_file_content(self, item_id, item_path, range_bytes, buf, write):
+        """
+        Stream the content of an item, or a range of it.
+        :param str | None item_id: ID of the target file.
+        :param str | None item_path: Path to the target file.
+        :param (int, int) | None range_bytes: Range of the bytes to download. Both ends are inclusive.
+        :param memoryview buf: Buffer to read data into.
+        :param write: A function called with each piece of data read into the buffer.
         """
-        if size <= self.config.max_get_size_bytes:
-            self.get_file_content(item_id, item_path, file=file)
-            return
-        t = 0
-        while t < size:
-            f = t
-            t += self.config.max_get_size_bytes - 1  # Both inclusive.
-            if t >= size:
-                t = size - 1
-            self.get_file_content(item_id, item_path, range_bytes=(f, t), file=file)
-            t += 1
+        uri = self.get_item_uri(item_id, item_path) + '/content'
+        # Content encoding would defeat both byte ranges and reading the raw stream into the buffer.
+        headers = {'Accept-Encoding': 'identity'}
+        if range_bytes is None:
+            ok_status_code = requests.codes.ok
+        else:
+            headers['Range'] = 'bytes=%d-%d' % range_bytes
+            ok_status_code = requests.codes.partial
+        request = self.root.account.session.get(uri, headers=headers, ok_status_code=ok_status_code, stream=True)
+        received = 0
+        try:
+            while True:
+                n = request.raw.readinto(buf)
+                if not n:
+                    break
+                write(buf[:n])
+                received += n
+        except StreamError as e:
+            raise IOError('Error reading content of "%s": %s' % (uri, e))
+        finally:
+            request.close()
+        if range_bytes is not None and received != range_bytes[1] - range_bytes[0] + 1:
+            raise IOError('Received %d bytes for range %d-%d of "%s".' % ((received,) + range_bytes + (uri,)))
 
     def get_file_content(self, item_id=None, item_path=None, range_bytes=None, file=None):
         """
@@ -413,8 +639,26 @@ class DriveObject:
         request = self.root.account.session.get(uri, params=params)
         return items.ItemCollection(self, request.json())
 
-    def get_changes(self):
-        raise NotImplementedError('The API feature is not used yet.')
+    def get_changes(self, token=None, item_id=None, item_path=None):
+        """
+        Enumerate the items changed within the specified directory (default: root) since the given delta token.
+        https://github.com/OneDrive/onedrive-api-docs/blob/master/items/view_delta.md
+        :param str | None token: (Optional) Delta token returned by the previous call. None to enumerate all items, or
+        'latest' to get only the latest token.
+        :param str | None item_id: (Optional) ID of the directory to track.
+        :param str | None item_path: (Optional) Path to the directory to track.
+        :rtype: onedrived.api.items.DeltaCollection
+        :raise onedrived.api.errors.OneDriveResyncRequiredError: If the token is rejected by server.
+        """
+        params = None
+        if token is not None:
+            params = {'token': token}
+        uri = self.get_item_uri(item_id, item_path)
+        if item_path is not None:
+            uri += ':'
+        uri += '/view.delta'
+        request = self.root.account.session.get(uri, params=params)
+        return items.DeltaCollection(self, request.json())
 
     def get_special_dir(self, name):
         raise NotImplementedError('The API feature is not used yet.')
@@ -11,6 +11,8 @@ class OneDriveError(Exception):
                 self.__class__ = OneDriveTokenExpiredError
             elif self.errno == 'server_internal_error':
                 self.__class__ = OneDriveServerInternalError
+            elif self.errno.startswith('resync'):
+                self.__class__ = OneDriveResyncRequiredError
         else:
             raise ValueError('Unknown OneDrive error format - ' + str(error_with_description))
 
@@ -26,6 +28,13 @@ class OneDriveServerInternalError(OneDriveError):
     pass
 
 
+class OneDriveResyncRequiredError(OneDriveError):
+    """
+    The delta token used to enumerate changes is no longer valid and the client must do a full resync.
+    """
+    pass
+
+
 class OneDriveRecoverableError(Exception):
     def __init__(self, retry_after_seconds):
         super().__init__()
@@ -90,6 +90,13 @@ class HashFacet:
         """
         return self._data['crc32Hash']
 
+    @property
+    def quick_xor(self):
+        """
+        :return str | None: The QuickXorHash value of the file in base64 (if available). Business drives only.
+        """
+        return self._data.get('quickXorHash')
+
 
 class FileFacet:
     """
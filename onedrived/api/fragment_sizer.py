@@ -0,0 +1,77 @@
+"""
+Choose the size of each fragment of an upload session from the throughput and round-trip time measured so far.
+https://github.com/OneDrive/onedrive-api-docs/blob/master/items/upload_large_files.md
+"""
+
+
+class FragmentSizer:
+    # The service requires every fragment but the last to be a multiple of 320 KiB, and at most 60 MiB.
+    UNIT_BYTES = 327680
+    MAX_BYTES = 62914560
+    # Aim for fragments that take this many round trips to transfer, so that latency costs about 1 / (1 + 8) of time.
+    TARGET_RTT_MULTIPLE = 8
+    # But never aim for fragments that take longer than this, because a failed fragment is sent again in full.
+    MAX_FRAGMENT_SEC = 30
+    # Weight of the newest sample in the moving average of throughput.
+    SMOOTHING = 0.5
+
+    def __init__(self, initial_bytes, max_bytes=MAX_BYTES):
+        """
+        :param int initial_bytes: Size of the first fragment.
+        :param int max_bytes: (Optional) Maximum size of a fragment. If it is not above initial_bytes, the size is
+        fixed.
+        """
+        self.max_bytes = min(max_bytes, self.MAX_BYTES)
+        if self.max_bytes > initial_bytes:
+            self.min_bytes = min(self.UNIT_BYTES, initial_bytes)
+        else:
+            self.min_bytes = self.max_bytes
+        self.fragment_bytes = self._clamp(initial_bytes)
+        self.rtt_sec = None
+        self.bytes_per_sec = None
+
+    def _clamp(self, size):
+        """
+        :param int | float size:
+        :return int: The size rounded down to an allowed fragment size.
+        """
+        size = int(size)
+        if size >= self.UNIT_BYTES:
+            size -= size % self.UNIT_BYTES
+        return max(self.min_bytes, min(size, self.max_bytes))
+
+    def on_request(self, elapsed_sec):
+        """
+        Record the time taken by a request with no significant body, e.g., creating the session, as round-trip time.
+        :param float elapsed_sec:
+        """
+        if self.rtt_sec is None or elapsed_sec < self.rtt_sec:
+            self.rtt_sec = elapsed_sec
+
+    def on_success(self, size, elapsed_sec):
+        """
+        Record a fragment that was accepted and choose the size of the next one. The size grows at most twofold.
+        :param int size: Size of the fragment.
+        :param float elapsed_sec: Time taken to send the fragment and receive the response.
+        """
+        self.on_request(elapsed_sec)
+        transfer_sec = elapsed_sec - self.rtt_sec
+        if transfer_sec > 0:
+            bytes_per_sec = size / transfer_sec
+            if self.bytes_per_sec is None:
+                self.bytes_per_sec = bytes_per_sec
+            else:
+                self.bytes_per_sec += self.SMOOTHING * (bytes_per_sec - self.bytes_per_sec)
+        if self.bytes_per_sec is None:
+            # The fragment took no longer than a round trip, so throughput is far from the limit.
+            target = 2 * self.fragment_bytes
+        else:
+            target_sec = min(self.TARGET_RTT_MULTIPLE * self.rtt_sec, self.MAX_FRAGMENT_SEC)
+            target = min(self.bytes_per_sec * target_sec, 2 * self.fragment_bytes)
+        self.fragment_bytes = self._clamp(target)
+
+    def on_failure(self):
+        """
+        Record a fragment that failed. The size of the next fragment is halved.
+        """
+        self.fragment_bytes = self._clamp(self.fragment_bytes // 2)
@@ -1,3 +1,6 @@
+import queue
+import threading
+
 from onedrived.api import facets
 from onedrived.api import resources
 from onedrived.common.dateparser import str_to_datetime
@@ -38,6 +41,73 @@ class ItemCollection:
         return [OneDriveItem(self._drive, d) for d in self._data['value']]
 
 
+def iter_pages(collection, prefetch=0):
+    """
+    :param ItemCollection collection:
+    :param int prefetch: (Optional) Number of pages to fetch ahead on a background thread while the caller works on
+    the current one. 0 to fetch each page only when it is asked for.
+    :return: A generator of the remaining pages of the collection, each a list of OneDriveItems.
+    """
+    if prefetch <= 0:
+        while collection.has_next:
+            yield collection.get_next()
+    else:
+        yield from _prefetch_pages(collection, prefetch)
+
+
+def _prefetch_pages(collection, depth):
+    """
+    Fetch the pages of a collection on a thread of its own, at most depth pages ahead of the consumer. An error raised
+    by a fetch is raised to the consumer once it has taken the pages fetched before it. The thread starts when the
+    first page is asked for, and stops once the generator is exhausted or closed.
+    """
+    pages = queue.Queue()
+    # One slot for each page fetched and not yet taken.
+    slots = threading.Semaphore(depth)
+    stopped = threading.Event()
+
+    def fetch():
+        try:
+            while collection.has_next:
+                slots.acquire()
+                if stopped.is_set():
+                    return
+                pages.put((collection.get_next(), None))
+        except Exception as e:
+            pages.put((None, e))
+            return
+        pages.put((None, None))
+
+    threading.Thread(target=fetch, name='prefetch', daemon=True).start()
+    try:
+        while True:
+            page, error = pages.get()
+            if error is not None:
+                raise error
+            if page is None:
+                return
+            slots.release()
+            yield page
+    finally:
+        stopped.set()
+        # Wake up the thread if it is waiting for a slot.
+        slots.release()
+
+
+class DeltaCollection(ItemCollection):
+    """
+    A collection of items changed since a delta token, as returned by view.delta API.
+    https://github.com/OneDrive/onedrive-api-docs/blob/master/items/view_delta.md
+    """
+
+    @property
+    def delta_token(self):
+        """
+        :return str | None: The token to pass to the next delta call to get changes made after the fetched page.
+        """
+        return self._data['@delta.token'] if '@delta.token' in self._data else None
+
+
 class OneDriveItem:
     def __init__(self, drive, data):
         """
@@ -51,6 +121,13 @@ class OneDriveItem:
         else:
             self._fs_info = None
 
+    @property
+    def data(self):
+        """
+        :return dict: The JSON dictionary the item was built from.
+        """
+        return self._data
+
     @property
     def id(self):
         """
@@ -65,6 +142,13 @@ class OneDriveItem:
         """
         return OneDriveItemTypes.FOLDER in self._data
 
+    @property
+    def is_root(self):
+        """
+        :return True | False: True if the item is the root folder of the drive.
+        """
+        return 'root' in self._data
+
     @property
     def type(self):
         """
@@ -151,6 +151,16 @@ class UploadSession:
                     t = int(t)
                 self.next_ranges.append((f, t))
 
+    @classmethod
+    def build(cls, upload_url, next_offset):
+        """
+        Build an UploadSession object from the values saved from a previous one.
+        :param str upload_url: URL of the upload session.
+        :param int next_offset: Offset of the next fragment the session expects.
+        :rtype: UploadSession
+        """
+        return UploadSession({'uploadUrl': upload_url, 'nextExpectedRanges': [str(next_offset) + '-']})
+
 
 class AsyncCopySession:
     """
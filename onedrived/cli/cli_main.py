@@ -7,9 +7,19 @@ import time
 from onedrived.api import clients
 from onedrived.cli import CONFIG_DIR, get_current_user_config
 from onedrived.common import logger_factory, netman, task_worker
+from onedrived.common.fsmonitor import FileSystemMonitor
+from onedrived.common.scheduler import Scheduler
 from onedrived.common.tasks import TaskBase
+from onedrived.common.tasks.delete_task import DeleteItemTask
+from onedrived.common.tasks.delta_task import DeltaSyncTask
+from onedrived.common.tasks.down_task import DownloadFileTask
 from onedrived.common.tasks.merge_task import MergeDirTask
-from onedrived.store import account_db, drives_db, items_db, task_pool
+from onedrived.common.tasks.up_task import CreateDirTask, UpdateMetadataTask, UploadFileTask
+from onedrived.store import account_db, drives_db, items_db, task_journal, task_pool
+
+# Task types recorded in the task journal.
+JOURNALED_TASK_TYPES = [CreateDirTask, DeleteItemTask, DownloadFileTask, MergeDirTask, UpdateMetadataTask,
+                        UploadFileTask]
 
 logger = None
 user_conf = None
@@ -42,20 +52,38 @@ def fix_log_args(args):
     return args
 
 
+def get_base_task(drive):
+    base = TaskBase(None)
+    base.drive = drive
+    base.items_store = item_store_mgr.get_item_storage(drive)
+    base.task_pool = task_store
+    return base
+
+
 def add_initial_tasks():
     all_drives = drive_store.get_all_drives()
     for key, drive in all_drives.items():
         # root_item = drive.get_root_dir(list_children=False)
         # print(root_item._data)
-        base = TaskBase(None)
-        base.drive = drive
-        base.items_store = item_store_mgr.get_item_storage(drive)
-        base.task_pool = task_store
-        task = MergeDirTask(base, '', '')
+        task = DeltaSyncTask(get_base_task(drive))
         if not task_store.has_pending_task(task.local_path):
             task_store.add_task(task)
 
 
+def replay_task_journal():
+    """
+    Queue the tasks left in the journal by the last run.
+    """
+    if task_store.journal is None:
+        return
+    base_tasks = {drive.drive_id: get_base_task(drive) for drive in drive_store.get_all_drives().values()}
+    tasks = task_store.journal.load_tasks(base_tasks.get)
+    for task in tasks:
+        if not task_store.add_task(task):
+            task_store.complete_task(task)
+    logger.info('Resumed %d tasks from task journal.', len(tasks))
+
+
 def load_item_storage():
     global item_store_mgr
     item_store_mgr = items_db.ItemStorageManager(CONFIG_DIR)
@@ -64,6 +92,8 @@ def load_item_storage():
 def load_task_storage():
     global task_store
     task_store = task_pool.TaskPool.get_instance()
+    if user_conf.use_task_journal:
+        task_store.journal = task_journal.TaskJournal(CONFIG_DIR + '/tasks.db', JOURNALED_TASK_TYPES)
 
 
 def load_user_config():
@@ -86,6 +116,12 @@ def check_config_dir():
         sys.exit(1)
 
 
+def start_fs_monitor():
+    # Keep the snapshot of polling on disk so that changes made while the daemon was not running are found.
+    snapshot_path = CONFIG_DIR + '/snapshot.db' if user_conf.use_poll_snapshot else ':memory:'
+    FileSystemMonitor(drive_store, item_store_mgr, task_store, snapshot_path=snapshot_path).start()
+
+
 def start_task_workers():
     for i in range(user_conf.num_consumers):
         t = task_worker.TaskConsumer(task_pool=task_store)
@@ -93,9 +129,19 @@ def start_task_workers():
         t.start()
 
 
+def log_metrics():
+    logger.debug('Metrics of task pool: %s', task_store.metrics.snapshot())
+    logger.debug('Metrics of downloads: %s', DownloadFileTask.metrics.snapshot())
+    scheduler = Scheduler.get_instance()
+    logger.debug('Scheduler has %d pending calls. Metrics: %s', scheduler.pending_count, scheduler.metrics.snapshot())
+    for drive, items_store in item_store_mgr.item_storages.items():
+        logger.debug('Metrics of item storage of drive "%s": %s', drive.drive_id, items_store.metrics.snapshot())
+
+
 def refill_tasks():
     try:
         while True:
+            log_metrics()
             logger.info('Refilling initial tasks...')
             add_initial_tasks()
             time.sleep(5 * 60)
@@ -112,6 +158,8 @@ def main():
     load_user_config()
     load_item_storage()
     load_task_storage()
+    replay_task_journal()
+    start_fs_monitor()
     start_task_workers()
     refill_tasks()
 
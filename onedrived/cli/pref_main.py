@@ -139,9 +139,24 @@ def prompt_drive_config(drive):
     drive_config_data['max_get_size_bytes'] = prompt.query('Maximum size, in KB, for a single download request?',
                                                            default=str(drive_config_data['max_get_size_bytes'] >> 10),
                                                            validators=[validators.IntegerValidator()]) * 1024
+    drive_config_data['max_get_concurrency'] = prompt.query('Maximum number of download requests for a single file?',
+                                                            default=str(drive_config_data['max_get_concurrency']),
+                                                            validators=[validators.IntegerValidator()])
     drive_config_data['max_put_size_bytes'] = prompt.query('Maximum size, in KB, for a single upload request?',
                                                            default=str(drive_config_data['max_put_size_bytes'] >> 10),
                                                            validators=[validators.IntegerValidator()]) * 1024
+    drive_config_data['max_put_fragment_bytes'] = prompt.query(
+            'Maximum size, in KB, for a single upload request of a large file?',
+            default=str(drive_config_data['max_put_fragment_bytes'] >> 10),
+            validators=[validators.IntegerValidator()]) * 1024
+    drive_config_data['max_list_concurrency'] = prompt.query(
+            'Maximum number of directories to list ahead at the same time (0 to disable)?',
+            default=str(drive_config_data['max_list_concurrency']),
+            validators=[validators.IntegerValidator()])
+    drive_config_data['list_prefetch_pages'] = prompt.query(
+            'Number of pages of a directory listing to fetch ahead while merging (0 to disable)?',
+            default=str(drive_config_data['list_prefetch_pages']),
+            validators=[validators.IntegerValidator()])
     try:
         while not prompt.yn('Do you have ignore list files specific to this Drive to add?', default='n'):
             ignore_file_path = prompt.query('Path to the ignore list file (hit [Ctrl+C] to skip): ',
@@ -7,7 +7,11 @@ from onedrived.common import path_filter
 class DriveConfig:
     DEFAULT_VALUES = {
         'max_get_size_bytes': 1048576,
+        'max_get_concurrency': 4,
         'max_put_size_bytes': 524288,
+        'max_put_fragment_bytes': 62914560,
+        'max_list_concurrency': 4,
+        'list_prefetch_pages': 1,
         'local_root': None,
         'ignore_files': set(),
     }
@@ -48,6 +52,13 @@ class DriveConfig:
         """
         return self.data['max_get_size_bytes']
 
+    @property
+    def max_get_concurrency(self):
+        """
+        :return int: Maximum number of ranges of one file to download at the same time.
+        """
+        return self.data['max_get_concurrency']
+
     @property
     def max_put_size_bytes(self):
         """
@@ -55,6 +66,30 @@ class DriveConfig:
         """
         return self.data['max_put_size_bytes']
 
+    @property
+    def max_put_fragment_bytes(self):
+        """
+        :return int: Maximum size of a fragment of an upload session. Fragments start at max_put_size_bytes and their
+        size adapts to the connection up to this value.
+        """
+        return self.data['max_put_fragment_bytes']
+
+    @property
+    def max_list_concurrency(self):
+        """
+        :return int: Maximum number of directories to list ahead of merging them at the same time. 0 to list each
+        directory only when it is merged.
+        """
+        return self.data['max_list_concurrency']
+
+    @property
+    def list_prefetch_pages(self):
+        """
+        :return int: Number of pages of a directory listing to fetch ahead while the current page is merged. 0 to fetch
+        each page only after the previous one is merged.
+        """
+        return self.data['list_prefetch_pages']
+
     @property
     def local_root(self):
         """
@@ -85,7 +120,8 @@ class DriveConfig:
 
     def dump(self, exact_dump=False):
         data = {}
-        for key in ['max_get_size_bytes', 'max_put_size_bytes', 'local_root']:
+        for key in ['max_get_size_bytes', 'max_get_concurrency', 'max_put_size_bytes', 'max_put_fragment_bytes',
+                    'max_list_concurrency', 'list_prefetch_pages', 'local_root']:
             if exact_dump or getattr(self, key) != self.DEFAULT_VALUES[key]:
                 data[key] = getattr(self, key)
         ignore_files = [s for s in self.ignore_files if exact_dump or s not in self.DEFAULT_VALUES['ignore_files']]
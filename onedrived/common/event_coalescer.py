@@ -0,0 +1,213 @@
+"""
+Merge file system events per path into the net change, e.g., a file created, written, and renamed over another becomes
+one upload of the final path. A path is reported once no event has touched it for a window of time.
+"""
+
+import collections
+
+from onedrived.common import inotify
+
+
+class Intents:
+    UPLOAD = 'upload'
+    CREATE_DIR = 'create_dir'
+    DELETE = 'delete'
+    MOVE = 'move'
+
+
+# A change to carry out. old_local_path is the source of a MOVE, and None for other kinds.
+Intent = collections.namedtuple('Intent', ['kind', 'local_path', 'is_folder', 'old_local_path'])
+
+
+class _Entry:
+    __slots__ = ('kind', 'is_folder', 'new', 'old_path', 'modified', 'replaced', 'deadline')
+
+    def __init__(self, kind, is_folder, new):
+        self.kind = kind
+        self.is_folder = is_folder
+        # True if the path had nothing remotely before the window, so nothing needs undoing if the entry goes away.
+        self.new = new
+        self.old_path = None
+        self.modified = False
+        # If not None, is_folder of a remote entry on the path that must be deleted before this change is carried out.
+        self.replaced = None
+        self.deadline = 0
+
+    def replace(self, old_is_folder):
+        """
+        Record that the remote entry of the path is replaced. Uploads replace remote files, but directories and moves
+        need the remote entry deleted first.
+        :param True | False old_is_folder:
+        """
+        self.new = False
+        if self.is_folder or old_is_folder or self.kind == Intents.MOVE:
+            self.replaced = old_is_folder
+
+
+class EventCoalescer:
+    """
+    Not thread-safe. The reader of events calls add() for each event, and pop_due() whenever next_deadline() passes.
+    """
+
+    def __init__(self, window_sec):
+        """
+        :param float window_sec: Time a path must stay untouched before its change is reported.
+        """
+        self.window_sec = window_sec
+        # Ordered by deadline, because every update moves the entry to the end.
+        self._entries = collections.OrderedDict()
+        # MOVED_FROM halves waiting for their MOVED_TO: cookie -> (old path, is_folder, pending entry, deadline).
+        self._moves = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self._entries) + len(self._moves)
+
+    def _touch(self, path, entry, now):
+        entry.deadline = now + self.window_sec
+        self._entries[path] = entry
+        self._entries.move_to_end(path)
+
+    def _pop_children(self, path):
+        prefix = path + '/'
+        children = [(p, e) for p, e in self._entries.items() if p.startswith(prefix)]
+        for p, _ in children:
+            del self._entries[p]
+        return children
+
+    def _delete(self, path, is_folder, now):
+        """ Record that an entry that exists remotely is gone from the path. """
+        entry = self._entries.get(path)
+        if entry is None:
+            self._touch(path, _Entry(Intents.DELETE, is_folder, new=False), now)
+        else:
+            # Something new took the path meanwhile, which replaces the remote entry.
+            entry.replace(is_folder)
+            self._touch(path, entry, now)
+
+    @staticmethod
+    def _remote_leftovers(path, is_folder, entry):
+        """
+        :param str path:
+        :param True | False is_folder:
+        :param _Entry | None entry: Pending change of the path, if any.
+        :return [(str, True | False)]: Paths and types of remote entries to delete once the entry leaves the path.
+        """
+        if entry is None:
+            return [(path, is_folder)]
+        ret = []
+        if entry.kind == Intents.MOVE:
+            ret.append((entry.old_path, entry.is_folder))
+        if entry.replaced is not None:
+            ret.append((path, entry.replaced))
+        elif not entry.new and entry.kind != Intents.MOVE:
+            ret.append((path, entry.is_folder))
+        return ret
+
+    def add(self, local_parent_path, mask, cookie, name, now):
+        """
+        :param str local_parent_path: Path of the parent directory, ending with '/'.
+        :param int mask: Event bits, as defined in onedrived.common.inotify.
+        :param int cookie:
+        :param str name:
+        :param float now: Time of the event, in time.monotonic().
+        """
+        path = local_parent_path + name
+        is_folder = bool(mask & inotify.IN_ISDIR)
+        entry = self._entries.get(path)
+        if mask & inotify.IN_CREATE or mask & inotify.IN_CLOSE_WRITE and not is_folder:
+            kind = Intents.CREATE_DIR if is_folder else Intents.UPLOAD
+            if entry is None:
+                entry = _Entry(kind, is_folder, new=bool(mask & inotify.IN_CREATE))
+            elif entry.kind == Intents.DELETE:
+                old_is_folder = entry.is_folder
+                entry = _Entry(kind, is_folder, new=False)
+                entry.replace(old_is_folder)
+            elif entry.kind == Intents.MOVE:
+                entry.modified = True
+            self._touch(path, entry, now)
+        elif mask & inotify.IN_DELETE:
+            if is_folder:
+                self._pop_children(path)
+            if entry is not None:
+                del self._entries[path]
+            for p, f in self._remote_leftovers(path, is_folder, entry):
+                self._delete(p, f, now)
+        elif mask & inotify.IN_MOVED_FROM:
+            if entry is not None:
+                del self._entries[path]
+            self._moves[cookie] = (path, is_folder, entry, now + self.window_sec)
+        elif mask & inotify.IN_MOVED_TO:
+            self._add_moved_to(path, is_folder, cookie, now)
+
+    def _add_moved_to(self, path, is_folder, cookie, now):
+        old_path, _, old_entry, _ = self._moves.pop(cookie, (None, None, None, None))
+        entry = _Entry(Intents.MOVE, is_folder, new=False)
+        if old_path is None:
+            # Moved in from outside the watched trees.
+            entry = _Entry(Intents.CREATE_DIR if is_folder else Intents.UPLOAD, is_folder, new=True)
+        elif old_entry is None:
+            entry.old_path = old_path
+        elif old_entry.kind == Intents.MOVE:
+            entry.old_path = old_entry.old_path
+            entry.modified = old_entry.modified
+            if old_entry.replaced is not None:
+                self._delete(old_path, old_entry.replaced, now)
+        elif old_entry.new or old_entry.replaced is not None:
+            # What is on the old path remotely, if anything, is not this entry. So the entry is new here.
+            entry = _Entry(Intents.CREATE_DIR if is_folder else Intents.UPLOAD, is_folder, new=True)
+            if old_entry.replaced is not None:
+                self._delete(old_path, old_entry.replaced, now)
+        else:
+            # An existing file was changed and then moved.
+            entry.old_path = old_path
+            entry.modified = True
+        target = self._entries.get(path)
+        if target is not None:
+            if target.kind == Intents.MOVE:
+                # The entry moved here earlier is overwritten, so it is gone from where it was.
+                self._delete(target.old_path, target.is_folder, now)
+            if target.replaced is not None:
+                entry.replace(target.replaced)
+            elif not target.new and target.kind != Intents.MOVE:
+                entry.replace(target.is_folder)
+        if old_path is not None and is_folder:
+            for child_path, child in self._pop_children(old_path):
+                self._touch(path + child_path[len(old_path):], child, now)
+        self._touch(path, entry, now)
+
+    def next_deadline(self):
+        """
+        :return float | None: The earliest time a change will be due, or None if there is no pending event.
+        """
+        deadlines = []
+        if len(self._entries) > 0:
+            deadlines.append(next(iter(self._entries.values())).deadline)
+        if len(self._moves) > 0:
+            deadlines.append(next(iter(self._moves.values()))[3])
+        return min(deadlines) if len(deadlines) > 0 else None
+
+    def pop_due(self, now):
+        """
+        :param float now:
+        :return [Intent]: Changes of paths untouched for the window, in the order they became due.
+        """
+        ret = []
+        while len(self._moves) > 0:
+            cookie, (old_path, is_folder, old_entry, deadline) = next(iter(self._moves.items()))
+            if deadline > now:
+                break
+            del self._moves[cookie]
+            # No MOVED_TO came, so the entry was moved out of the watched trees and is gone.
+            for p, f in self._remote_leftovers(old_path, is_folder, old_entry):
+                ret.append(Intent(Intents.DELETE, p, f, None))
+        while len(self._entries) > 0:
+            path, entry = next(iter(self._entries.items()))
+            if entry.deadline > now:
+                break
+            del self._entries[path]
+            if entry.replaced is not None:
+                ret.append(Intent(Intents.DELETE, path, entry.replaced, None))
+            ret.append(Intent(entry.kind, path, entry.is_folder, entry.old_path))
+            if entry.kind == Intents.MOVE and entry.modified and not entry.is_folder:
+                ret.append(Intent(Intents.UPLOAD, path, False, None))
+        return ret
@@ -1,181 +1,303 @@
-import csv
-import os
-import shutil
-import subprocess
+import re
+import sqlite3
 import threading
+import time
 
+from onedrived.common import inotify
+from onedrived.common.event_coalescer import EventCoalescer, Intents
 from onedrived.common.logger_factory import get_logger
+from onedrived.common.metrics import MetricSet
+from onedrived.common.path_trie import PathTrie
+from onedrived.common.poll_scanner import PollingScanner
 from onedrived.common.tasks import TaskBase
-from onedrived.common.tasks import delete_task, merge_task, move_task, up_task, utils
+from onedrived.common.tasks import delete_task, merge_task, move_task, up_task
+from onedrived.store.snapshot_db import SnapshotIndex
 
 
-def _get_rel_parent_path(drive, local_parent_path):
+# Temporary files of downloads, e.g., '.foo.bar.!od'.
+_EXCLUDE_NAME_RE = re.compile(r'^\..*\.!od$')
+
+
+def _is_upload_after_move(first, second):
     """
-    Translate a local path to path relative to drive local root. E.g., '/home/xb/OneDrive/foo.bar' -> '/foo.bar'.
-    :param onedrived.api.drives.DriveObject drive:
-    :param str local_parent_path:
-    :return str: Path relative to drive local root.
+    :param onedrived.common.event_coalescer.Intent first:
+    :param onedrived.common.event_coalescer.Intent second:
+    :return True | False: True if the intents are a move of a file and the upload of its new content.
     """
-    return local_parent_path.replace(drive.config.local_root, '', 1)
+    return first.kind == Intents.MOVE and second.kind == Intents.UPLOAD and first.local_path == second.local_path
 
 
 # TODO: there are still some issues to let a task occupy a path until it's completed.
-# TODO: finish the class.
 
 class FileSystemMonitor(threading.Thread):
-    MOVE_DETECTION_DELAY_SEC = 4
-    SYNC_PARENT_DELAY_SEC = 60
+    # Events on a path are merged until the path is untouched for this long.
+    COALESCE_WINDOW_SEC = 2
+
+    # Wake up at least this often to check whether close() was called.
+    READ_TIMEOUT_SEC = 1
+
+    # When polling, scan the trees this often.
+    POLL_INTERVAL_SEC = 30
+
+    # When polling, also check files in directories that have no new, deleted or renamed entries every this many scans,
+    # to find files written in place.
+    FULL_SCAN_EVERY = 10
 
     logger = get_logger('fsmon')
 
-    def __init__(self, drive_store, items_store_manager, task_pool):
+    def __init__(self, drive_store, items_store_manager, task_pool, coalesce_window_sec=COALESCE_WINDOW_SEC,
+                 poll=False, poll_interval_sec=POLL_INTERVAL_SEC, snapshot_path=':memory:'):
         """
         :param onedrived.store.drives_db.DriveStorage drive_store:
         :param onedrived.store.items_db.ItemStorageManager items_store_manager:
         :param onedrived.store.task_pool.TaskPool task_pool:
+        :param float coalesce_window_sec: (Optional) Time a path must stay untouched before its change is acted on.
+        :param True | False poll: (Optional) Poll for changes even if inotify can be used, e.g., for network mounts.
+        Polling is the fallback when inotify fails.
+        :param float poll_interval_sec: (Optional) Time between two scans when polling.
+        :param str snapshot_path: (Optional) Path to the snapshot database of polling. With a database on disk, changes
+        made while the daemon was not running are found by the first scan. Not kept on disk by default.
         """
         super().__init__(name='fsmon', daemon=True)
         self._items_store_man = items_store_manager
         self._task_pool = task_pool
         self._all_drives = drive_store.get_all_drives().values()
         self._running = False
-        self._delayed_tasks = set()
         self._task_bases = dict()
+        self._drive_roots = PathTrie()
+        self._coalescer = EventCoalescer(coalesce_window_sec)
+        self._watcher = None
+        self._poll = poll
+        self._poll_interval_sec = poll_interval_sec
+        self._snapshot_path = snapshot_path
+        self._scanner = None
+        self._wake_event = threading.Event()
+        self.metrics = MetricSet()
         self._preprocess_drives()
 
-    def _enqueue_delayed_task(self, task):
+    @property
+    def watch_count(self):
         """
-        :param onedrived.common.tasks.TaskBase task:
+        :return int: Number of directories being watched.
         """
-        if task in self._delayed_tasks:
-            self._task_pool.add_task(task)
+        return self._watcher.watch_count if self._watcher is not None else 0
 
-    def _find_drive(self, path):
-        for d in self._all_drives:
-            if path.startswith(d.config.local_root):
-                return d
+    def _route(self, local_path):
+        """
+        Find the drive whose local root is the longest prefix of a path, so that a drive nested in another one gets
+        the events under it, and translate the path to be relative to that root. E.g., '/home/xb/OneDrive/foo.bar'
+        -> '/foo.bar'.
+        :param str local_path:
+        :return (onedrived.api.drives.DriveObject, str): The drive and the relative path, which is '' for the root.
+        (None, None) if the path is in no drive.
+        """
+        root, drive = self._drive_roots.longest_prefix(local_path)
+        if drive is None:
+            return None, None
+        return drive, local_path[len(root.rstrip('/')):]
 
     def _preprocess_drives(self):
         for drive in self._all_drives:
+            self._drive_roots.add(drive.config.local_root, drive)
             task_base = TaskBase(None)
             task_base.drive = drive
             task_base.task_pool = self._task_pool
             task_base.items_store = self._items_store_man.get_item_storage(drive)
             self._task_bases[drive] = task_base
 
-    def _sync_parent_dir_of(self, drive, rel_path):
-        rel_parent_path, dir_name = rel_path.rsplit('/', maxsplit=1)
-        task = merge_task.MergeDirTask(self._task_bases[drive], rel_parent_path=rel_parent_path, item_name=dir_name)
-        self._task_pool.add_task(task)
-
-    def _process_create_dir_event(self, drive, local_parent_path, dir_name):
+    def _locate(self, local_path):
         """
-        Subroutine to handle the event that a new directory is created.
-        :param onedrived.api.drives.DriveObject drive:
-        :param str local_parent_path: Local path to the parent of this newly created directory.
-        :param str dir_name: Name of the newly created directory.
+        :param str local_path:
+        :return (onedrived.api.drives.DriveObject, str, str): The drive, the parent path relative to drive root in
+        the form of TaskBase.rel_parent_path, and the name. The drive is None if the path is in no drive.
         """
-        rel_parent_path = _get_rel_parent_path(drive, local_parent_path)
-        task = up_task.CreateDirTask(self._task_bases[drive], rel_parent_path=rel_parent_path, item_name=dir_name)
-        task.handle()
-        if task.should_sync_parent:
-            self._sync_parent_dir_of(drive, rel_parent_path)
+        drive, rel_path = self._route(local_path)
+        if drive is None or rel_path == '':
+            return None, None, None
+        rel_parent_path, name = rel_path.rsplit('/', 1)
+        return drive, rel_parent_path + '/', name
 
-    def _process_delete_event(self, drive, local_parent_path, ent_name, is_folder):
+    def _has_record(self, drive, rel_parent_path, name):
+        items_store = self._task_bases[drive].items_store
+        local_parent_path = drive.config.local_root + rel_parent_path.rstrip('/')
+        return len(items_store.get_items_by_id(local_parent_path=local_parent_path, item_name=name)) > 0
+
+    def _merge_parent_dir(self, drive, rel_parent_path):
         """
-        Subroutine to handle the event that an entry is deleted.
+        Merge the directory, which uploads whatever is new under it, e.g., a new directory and its content.
         :param onedrived.api.drives.DriveObject drive:
-        :param str local_parent_path:
-        :param str ent_name:
-        :param True | False is_folder: True to indicate that the deleted item is a directory.
-        """
-        rel_parent_path = _get_rel_parent_path(drive, local_parent_path)
-        task = delete_task.DeleteItemTask(parent_task=self._task_bases[drive], rel_parent_path=rel_parent_path,
-                                          item_name=ent_name, is_folder=is_folder)
-        self._task_pool.add_task(task)
-
-    def _process_move_from_event(self, drive, local_parent_path, ent_name, is_folder):
-        # First try finding the item in database.
-        rel_parent_path = _get_rel_parent_path(drive, local_parent_path)
-        item_store = self._items_store_man.get_item_storage(drive)
-        q = item_store.get_items_by_id(local_parent_path=local_parent_path, item_name=ent_name)
-        try:
-            item_id, item = q.popitem()
-            if item.is_folder != is_folder:
-                raise KeyError()
-        except KeyError:
-            # If the record does not match, sync the parent after some time.
-            threading.Timer(self.SYNC_PARENT_DELAY_SEC, self._sync_parent_dir_of, (drive, rel_parent_path))
-            return
-        task = delete_task.DeleteItemTask(parent_task=self._task_bases[drive], rel_parent_path=rel_parent_path,
-                                          item_name=ent_name, is_folder=is_folder)
-        task.item_obj = item
-        self._delayed_tasks.add(task)
-        threading.Timer(self.MOVE_DETECTION_DELAY_SEC, self._enqueue_delayed_task, task)
+        :param str rel_parent_path: Path to the directory, in the form of TaskBase.rel_parent_path.
+        """
+        rel_dir_path = rel_parent_path.rstrip('/')
+        if rel_dir_path == '':
+            task = merge_task.MergeDirTask(self._task_bases[drive], '', '')
+        else:
+            parent_path, name = rel_dir_path.rsplit('/', 1)
+            task = merge_task.MergeDirTask(self._task_bases[drive], parent_path + '/', name)
+        if not self._task_pool.has_pending_task(task.local_path):
+            self._task_pool.add_task(task)
 
-    def _convert_delete_dir_to_move(self, drive, local_parent_path, ent_name):
+    def _add_new(self, drive, rel_parent_path, name, is_folder):
+        base = self._task_bases[drive]
+        if is_folder:
+            # The directory may have had content before it was watched, so merge it from its parent, which creates it
+            # remotely and uploads all its content.
+            self._merge_parent_dir(drive, rel_parent_path)
+        elif not self._task_pool.has_pending_task(drive.config.local_root + rel_parent_path + name):
+            self._task_pool.add_task(up_task.UploadFileTask(base, rel_parent_path, name))
 
-        for t in self._delayed_tasks:
-            if isinstance(t, delete_task.DeleteItemTask)
+    def _dispatch(self, intent, upload_after=False):
+        """
+        Queue the tasks to carry out a change. Only local work is done here, so that reading events never waits for
+        the network.
+        :param onedrived.common.event_coalescer.Intent intent:
+        :param True | False upload_after: (Optional) For a MOVE, also upload the file once it is moved.
+        """
+        drive, rel_parent_path, name = self._locate(intent.local_path)
+        if drive is None or drive.config.path_filter.should_ignore(rel_parent_path + name, intent.is_folder):
+            return
+        base = self._task_bases[drive]
+        if intent.kind == Intents.UPLOAD or intent.kind == Intents.CREATE_DIR:
+            self._add_new(drive, rel_parent_path, name, intent.is_folder)
+        elif intent.kind == Intents.DELETE:
+            self._task_pool.add_task(delete_task.DeleteItemTask(base, rel_parent_path, name, intent.is_folder))
+        elif intent.kind == Intents.MOVE:
+            old_drive, old_rel_parent_path, old_name = self._locate(intent.old_local_path)
+            if old_drive is drive and self._has_record(drive, old_rel_parent_path, old_name):
+                move_from_task = delete_task.DeleteItemTask(base, old_rel_parent_path, old_name, intent.is_folder)
+                self._task_pool.add_task(move_task.MoveItemTask(base, rel_parent_path, name, move_from_task,
+                                                                upload_after=upload_after))
+            else:
+                # The old path is in another drive or was never synced, so upload the entry as new.
+                if old_drive is not None and old_drive is not drive:
+                    self._task_pool.add_task(delete_task.DeleteItemTask(
+                        self._task_bases[old_drive], old_rel_parent_path, old_name, intent.is_folder))
+                self._add_new(drive, rel_parent_path, name, intent.is_folder)
 
-    def _process_move_to_event(self, drive, local_parent_path, ent_name):
-        local_path = local_parent_path + '/' + ent_name
-        item_store = self._items_store_man.get_item_storage(drive)
-        try:
-            is_folder = os.path.isdir(local_path)
-            for t in self._delayed_tasks:
-                pass
-                # if not isinstance(t, delete_task.DeleteItemTask) or t.local_parent_path != local_parent_path \
-                #        or t.item_name !:
-                #    pass
-                #    continue
-                # if t.item_obj.is_folder == is_folder:
-
-    def _process_event(self, event_str, local_parent_path, ent_name):
-        """
-        The event dispatcher.
-        :param str event_str:
-        :param str local_parent_path:
+    def _process_event(self, mask, local_parent_path, ent_name, cookie=0, now=None):
+        """
+        Merge an event into the pending changes. Changes are acted on by _flush() once their paths settle.
+        :param int mask: Event bits, as defined in onedrived.common.inotify.
+        :param str local_parent_path: Path of the parent directory, ending with '/'.
         :param str ent_name:
+        :param int cookie: (Optional) The cookie that pairs MOVED_FROM and MOVED_TO events of the same move.
+        :param float | None now: (Optional) Time of the event, in time.monotonic(). Current time by default.
+        """
+        if _EXCLUDE_NAME_RE.match(ent_name):
+            return
+        self._coalescer.add(local_parent_path, mask, cookie, ent_name, time.monotonic() if now is None else now)
+        self.metrics.counter('events').add()
+
+    def _flush(self, now=None):
+        """
+        Act on the changes of paths that settled.
+        :param float | None now: (Optional) Current time, in time.monotonic().
         """
-        drive = self._find_drive(local_parent_path)
-        if event_str == 'CREATE,ISDIR':
-            # A new directory was created. The directory might have name conflict with existing item, and might have
-            # been deleted by the time CreateDirTask runs. It might have been added new files to as well. Therefore,
-            # handle this type of event synchronously.
-            # If there is no network, this handle will be blocked. But if no network, tasks will pile up anyway.
-            self._process_create_dir_event(drive, local_parent_path, ent_name)
-        elif 'CLOSE_WRITE' in event_str:
-            # A file that opened in writable mode was closed. If the file is being uploaded, the current upload session
-            # should be aborted. Also the task to upload that file could have been fetched by a worker and not traceable
-            # in TaskPool.
-            pass
-        elif 'MOVED_FROM' in event_str:
-            # Add delayed move to a queue. Use a new thread to add it to the task queue later.
-            # A better way is to use asyncio, but it is not part of Python 3.3 standard (which adds extra dependency).
-            self._process_move_from_event(drive, local_parent_path, ent_name, 'ISDIR' in event_str)
-        elif 'MOVED_TO' in event_str:
-            self._process_move_to_event(drive, local_parent_path, ent_name)
-        elif 'DELETE' in event_str:
-            self._process_delete_event(drive, local_parent_path, ent_name, 'ISDIR' in event_str)
+        intents = self._coalescer.pop_due(time.monotonic() if now is None else now)
+        for i, intent in enumerate(intents):
+            if i > 0 and _is_upload_after_move(intents[i - 1], intent):
+                # Queued by the MoveItemTask of the previous intent, which occupies the path until it is done.
+                continue
+            self._dispatch(intent, upload_after=i + 1 < len(intents) and _is_upload_after_move(intent, intents[i + 1]))
+        self.metrics.counter('intents').add(len(intents))
+
+    def _get_read_timeout(self):
+        deadline = self._coalescer.next_deadline()
+        if deadline is None:
+            return self.READ_TIMEOUT_SEC
+        return max(0, min(self.READ_TIMEOUT_SEC, deadline - time.monotonic()))
 
     def close(self):
         """ An external thread should call close() and then join() this thread (to finish the last task) to stop. """
         if self._running:
-            subprocess.call(['kill', '-s', '9', str(self._subp.pid)])
+            # Wake the loop before it may exit and close the watcher.
+            watcher = self._watcher
+            if watcher is not None:
+                watcher.wake()
+            self._wake_event.set()
             self._running = False
 
+    def _process_batch(self, events):
+        """
+        :param [onedrived.common.inotify.PathEvent] events:
+        """
+        for event in events:
+            if event.mask & inotify.IN_Q_OVERFLOW:
+                # Events were lost, so changes made meanwhile are found by the next full sync instead.
+                self.metrics.counter('overflows').add()
+                self.logger.warning('Inotify event queue overflowed. Some changes will be picked up by next sync.')
+            else:
+                self._process_event(event.mask, event.local_parent_path, event.name, event.cookie)
+
+    def _start_watcher(self):
+        """
+        :return True | False: True if all trees are watched with inotify.
+        """
+        if self._poll:
+            return False
+        try:
+            self._watcher = inotify.TreeWatcher()
+            for drive in self._all_drives:
+                self._watcher.add_tree(drive.config.local_root)
+        except OSError as e:
+            self.logger.warning('Cannot watch with inotify: %s. Poll for changes every %d seconds instead.',
+                                e, self._poll_interval_sec)
+            if self._watcher is not None:
+                self._watcher.close()
+                self._watcher = None
+            return False
+        return True
+
+    def _watch(self):
+        self.logger.info('Starting. Watching %d directories.', self._watcher.watch_count)
+        while self._running:
+            deadline = self._coalescer.next_deadline()
+            events = self._watcher.read(self._get_read_timeout())
+            start = time.monotonic()
+            if deadline is not None and start >= deadline:
+                # How late changes that settled are acted on, e.g., because reading or handling took long.
+                self.metrics.timer('loop_lag').record(start - deadline)
+            self._process_batch(events)
+            self._flush()
+            self.metrics.timer('batch_time').record(time.monotonic() - start)
+        self._watcher.close()
+
+    def _scan(self, num_scans):
+        """
+        :param int num_scans: Number of scans done before this one.
+        """
+        start = time.monotonic()
+        try:
+            self._scanner.scan(self._process_event,
+                               check_files=num_scans > 0 and num_scans % self.FULL_SCAN_EVERY == 0)
+        except sqlite3.Error as e:
+            self.logger.error('Cannot save snapshot of local trees: %s.', e)
+        self.metrics.timer('scan').record(time.monotonic() - start)
+
+    def _poll_changes(self):
+        index = SnapshotIndex(self._snapshot_path)
+        self._scanner = PollingScanner([drive.config.local_root for drive in self._all_drives], index)
+        self.logger.info('Starting. Polling %d trees.', len(self._scanner.roots))
+        num_scans = 0
+        next_scan = time.monotonic()
+        while self._running:
+            if time.monotonic() >= next_scan:
+                self._scan(num_scans)
+                num_scans += 1
+                next_scan = time.monotonic() + self._poll_interval_sec
+            self._flush()
+            timeout = next_scan - time.monotonic()
+            deadline = self._coalescer.next_deadline()
+            if deadline is not None:
+                timeout = min(timeout, deadline - time.monotonic())
+            self._wake_event.wait(max(0, timeout))
+        index.close()
+
     def run(self):
-        if not shutil.which('inotifywait'):
-            self.logger.critical('Cannot start file system monitor because command "inotifywait" was not found.')
-            return
+        use_watcher = self._start_watcher()
         self._running = True
-        self.logger.info('Starting.')
-        args = ['inotifywait', '--quiet', '--csv', '-e', 'unmount,create,close_write,delete,move',
-                '--exclude', '\..*\.!od', '-mr'] + [drive.config.local_root for drive in self._all_drives]
-        self._subp = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True)
-        reader = csv.reader(self._subp.stdout)
-        for row in reader:
-            local_parent_path, event_str, ent_name = row
-            self._process_event(event_str, local_parent_path, ent_name)
+        if use_watcher:
+            self._watch()
+        else:
+            self._poll_changes()
         self.logger.info('Stopped.')
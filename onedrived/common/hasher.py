@@ -1,15 +1,38 @@
+import atexit
+import base64
+import binascii
 import hashlib
+import multiprocessing
+import os
+import struct
+import sys
+import threading
 import zlib
+from concurrent.futures import ProcessPoolExecutor
 
+# Names of digests, which are also the keys of the hash values in HashFacet.
+SHA1 = 'sha1Hash'
+CRC32 = 'crc32Hash'
+QUICK_XOR = 'quickXorHash'
 
-def hash_value(file_path, block_size=1048576, algorithm=hashlib.sha1()):
+DEFAULT_DIGESTS = (SHA1, CRC32)
+DEFAULT_BLOCK_SIZE = 1048576
+
+# Files at least this large are hashed in a worker process by get_file_values(), so that hashing them does not hold
+# the GIL that sync threads need.
+POOL_MIN_BYTES = 16777216
+
+
+def hash_value(file_path, block_size=DEFAULT_BLOCK_SIZE, algorithm=None):
     """
     Calculate the MD5 or SHA hash value of the data of the specified file.
     :param str file_path:
     :param int block_size:
-    :param algorithm: A hash function defined in hashlib.
+    :param algorithm: (Optional) A new hash object from hashlib. SHA-1 by default.
     :return str:
     """
+    if algorithm is None:
+        algorithm = hashlib.sha1()
     with open(file_path, 'rb') as f:
         while True:
             data = f.read(block_size)
@@ -19,6 +42,347 @@ def hash_value(file_path, block_size=1048576, algorithm=hashlib.sha1()):
     return algorithm.hexdigest().upper()
 
 
+class QuickXorHash:
+    """
+    The QuickXorHash used by OneDrive for Business. Byte i of the content is XORed into a 160-bit state at bit offset
+    (11 * i) mod 160, wrapping around, and the length of the content is XORed into the last 64 bits of the state.
+    https://docs.microsoft.com/en-us/onedrive/developer/code-snippets/quickxorhash
+
+    Bytes 160 apart share the same offset, so each update first XORs the data column-wise with big integer operations
+    and then places only the 160 column values, instead of looping over every byte in Python.
+    """
+
+    WIDTH_BITS = 160
+    SHIFT = 11
+    _ROW_BYTES = 160
+    _MASK = (1 << WIDTH_BITS) - 1
+
+    def __init__(self):
+        self._state = 0
+        self._length = 0
+
+    def update(self, data):
+        """
+        :param bytes | bytearray | memoryview data:
+        """
+        data = memoryview(data)
+        n = len(data)
+        if n == 0:
+            return
+        full = n - n % self._ROW_BYTES
+        columns = self._fold_rows(int.from_bytes(data[:full], 'little'), full // self._ROW_BYTES)
+        columns ^= int.from_bytes(data[full:], 'little')
+        state = self._state
+        column_bytes = columns.to_bytes(self._ROW_BYTES, 'little')
+        for r in range(min(n, self._ROW_BYTES)):
+            b = column_bytes[r]
+            if b:
+                shift = (self.SHIFT * (self._length + r)) % self.WIDTH_BITS
+                state ^= ((b << shift) | (b >> (self.WIDTH_BITS - shift))) & self._MASK
+        self._state = state
+        self._length += n
+
+    @classmethod
+    def _fold_rows(cls, x, rows):
+        """
+        :param int x: Rows of _ROW_BYTES bytes each, in little endian order.
+        :param int rows: Number of rows in x.
+        :return int: XOR of all rows.
+        """
+        while rows > 1:
+            kept = rows - rows // 2
+            bits = kept * cls._ROW_BYTES * 8
+            x = (x & ((1 << bits) - 1)) ^ (x >> bits)
+            rows = kept
+        return x
+
+    def digest(self):
+        """
+        :rtype: bytes
+        """
+        state = self._state ^ ((self._length & 0xFFFFFFFFFFFFFFFF) << (self.WIDTH_BITS - 64))
+        return state.to_bytes(self.WIDTH_BITS // 8, 'little')
+
+
+class StreamHasher:
+    """
+    Calculate hash values of data fed piece by piece, e.g., as it is transferred or read from a file, computing all
+    requested digests from the same pass. SHA-1 and CRC32 values are in the same format as those returned by
+    hash_value() and crc32_value().
+    """
+
+    def __init__(self, digests=DEFAULT_DIGESTS):
+        """
+        :param [str] digests: (Optional) Digests to compute, from SHA1, CRC32 and QUICK_XOR.
+        """
+        self.digests = frozenset(digests)
+        self._sha1 = hashlib.sha1() if SHA1 in self.digests else None
+        self._quick_xor = QuickXorHash() if QUICK_XOR in self.digests else None
+        self._crc32 = 0
+        self.size = 0
+
+    def update(self, data):
+        """
+        :param bytes | bytearray | memoryview data:
+        """
+        if self._sha1 is not None:
+            self._sha1.update(data)
+        if CRC32 in self.digests:
+            self._crc32 = zlib.crc32(data, self._crc32)
+        if self._quick_xor is not None:
+            self._quick_xor.update(data)
+        self.size += len(data)
+
+    @property
+    def sha1(self):
+        """
+        :rtype: str
+        """
+        return self._sha1.hexdigest().upper()
+
+    @property
+    def crc32(self):
+        """
+        :rtype: str
+        """
+        return str(self._crc32).upper()
+
+    @property
+    def crc32_hex(self):
+        """
+        :return str: The CRC32 value in the format of HashFacet, i.e., hex digits of the little endian bytes.
+        """
+        return binascii.hexlify(struct.pack('<I', self._crc32)).decode('ascii').upper()
+
+    @property
+    def quick_xor(self):
+        """
+        :return str: The QuickXorHash value in the format of HashFacet, i.e., base64 of the digest.
+        """
+        return base64.b64encode(self._quick_xor.digest()).decode('ascii')
+
+    def values(self):
+        """
+        :return dict[str, str]: Values of all computed digests in the format of HashFacet, keyed as in HashFacet.
+        """
+        ret = {}
+        if SHA1 in self.digests:
+            ret[SHA1] = self.sha1
+        if CRC32 in self.digests:
+            ret[CRC32] = self.crc32_hex
+        if QUICK_XOR in self.digests:
+            ret[QUICK_XOR] = self.quick_xor
+        return ret
+
+    def matches(self, hash_facet):
+        """
+        Compare the hash values with those the server reports for the content.
+        :param onedrived.api.facets.HashFacet | None hash_facet:
+        :return True | False | None: None if the server reports no hash value to compare with.
+        """
+        values = self.values()
+        return hashes_match(hash_facet, values.get(CRC32), values.get(SHA1), values.get(QUICK_XOR))
+
+
+def hashes_match(hash_facet, crc32_hex, sha1, quick_xor=None):
+    """
+    Compare hash values of some content with those the server reports for it. SHA-1 is preferred when available.
+    :param onedrived.api.facets.HashFacet | None hash_facet:
+    :param str | None crc32_hex: CRC32 value of the content, in the format of HashFacet.
+    :param str | None sha1: SHA-1 value of the content, in upper-case hex digits.
+    :param str | None quick_xor: (Optional) QuickXorHash value of the content, in base64.
+    :return True | False | None: None if the server reports no hash value to compare with.
+    """
+    if hash_facet is not None:
+        if hash_facet.sha1 is not None and sha1 is not None:
+            return hash_facet.sha1.upper() == sha1
+        if hash_facet.quick_xor is not None and quick_xor is not None:
+            return hash_facet.quick_xor == quick_xor
+        if hash_facet.crc32 is not None and crc32_hex is not None:
+            return hash_facet.crc32.upper() == crc32_hex
+    return None
+
+
+def hash_file(file_path, block_size=DEFAULT_BLOCK_SIZE, digests=DEFAULT_DIGESTS):
+    """
+    Calculate hash values of the data of the specified file, all in one read through a reused buffer.
+    :param str file_path:
+    :param int block_size:
+    :param [str] digests: (Optional) Digests to compute, from SHA1, CRC32 and QUICK_XOR.
+    :rtype: StreamHasher
+    """
+    h = StreamHasher(digests)
+    buf = memoryview(bytearray(block_size))
+    with open(file_path, 'rb') as f:
+        while True:
+            n = f.readinto(buf)
+            if not n:
+                break
+            h.update(buf[:n])
+    return h
+
+
+def _hash_file_values(file_path, block_size, digests):
+    return hash_file(file_path, block_size, digests).values()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool():
+    """
+    :return concurrent.futures.ProcessPoolExecutor: The pool of hashing processes, created when first used.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            if sys.version_info >= (3, 7):
+                # Spawn rather than fork workers, because forking a process that runs threads can copy held locks.
+                _pool = ProcessPoolExecutor(max_workers=multiprocessing.cpu_count(),
+                                            mp_context=multiprocessing.get_context('spawn'))
+            else:
+                # The pool takes no start method before Python 3.7, so workers are forked. They only read and hash
+                # files, and do not use the locks other threads may hold at the time of the fork.
+                _pool = ProcessPoolExecutor(max_workers=multiprocessing.cpu_count())
+            atexit.register(_pool.shutdown)
+        return _pool
+
+
+def submit_hash_file(file_path, block_size=DEFAULT_BLOCK_SIZE, digests=DEFAULT_DIGESTS):
+    """
+    Hash a file in a worker process, so that hashing does not hold the GIL of this process.
+    :param str file_path:
+    :param int block_size:
+    :param [str] digests: (Optional) Digests to compute, from SHA1, CRC32 and QUICK_XOR.
+    :return concurrent.futures.Future: A future of the hash values, as returned by StreamHasher.values().
+    """
+    return _get_pool().submit(_hash_file_values, file_path, block_size, tuple(digests))
+
+
+def get_file_values(file_path, size, digests=DEFAULT_DIGESTS):
+    """
+    Hash a file, in a worker process if it is at least POOL_MIN_BYTES large, or else in the calling thread.
+    :param str file_path:
+    :param int size: Size of the file.
+    :param [str] digests: (Optional) Digests to compute, from SHA1, CRC32 and QUICK_XOR.
+    :return dict[str, str]: Hash values, as returned by StreamHasher.values().
+    """
+    if size >= POOL_MIN_BYTES:
+        return submit_hash_file(file_path, digests=digests).result()
+    return hash_file(file_path, digests=digests).values()
+
+
+class OrderedRangeHasher:
+    """
+    Hash a file whose ranges are written in any order, e.g., by parallel downloads. Data written right after all the
+    data hashed so far is hashed from memory as it is written, via update(). Data written ahead of that is hashed once
+    all data before it is, by reading it back from the file while it is still in page cache. With ranges downloaded
+    about as fast as each other, most of the file is hashed from memory and only ranges that finish before the ones
+    in front of them are read back.
+    """
+
+    def __init__(self, fd, ranges, block_size=1048576, on_progress=None):
+        """
+        :param int fd: A file descriptor open for reading.
+        :param [(int, int)] ranges: Consecutive ranges covering the file, in file order. Both ends are inclusive.
+        :param int block_size:
+        :param on_progress: (Optional) A function called with the number of bytes hashed after each range is hashed.
+        """
+        self.hasher = StreamHasher()
+        # Number of bytes hashed by reading them back from the file.
+        self.bytes_read_back = 0
+        self._on_progress = on_progress
+        self._fd = fd
+        self._ranges = ranges
+        self._block_size = block_size
+        self._done = [False] * len(ranges)
+        # End of the data written to each range so far.
+        self._written = [first for first, last in ranges]
+        self._next = 0
+        # Only changed by the thread that set _hashing.
+        self._hashed_bytes = ranges[0][0] if len(ranges) > 0 else 0
+        self._hashing = False
+        self._lock = threading.Lock()
+
+    def update(self, i, offset, data):
+        """
+        Record data written to the file. If it is next in file order to be hashed, it is hashed right away.
+        :param int i: Index of the range the data was written to.
+        :param int offset: Offset of the data in the file.
+        :param bytes | memoryview data: The data, which is not used after the call returns.
+        """
+        with self._lock:
+            self._written[i] = offset + len(data)
+            if self._hashing or offset != self._hashed_bytes:
+                return
+            self._hashing = True
+        try:
+            self.hasher.update(data)
+            self._hashed_bytes += len(data)
+        except Exception:
+            with self._lock:
+                self._hashing = False
+            raise
+        self._drain()
+
+    def complete(self, i):
+        """
+        Mark a range complete, and hash all ranges that are ready if no other thread is doing so.
+        :param int i: Index of the range.
+        """
+        with self._lock:
+            self._done[i] = True
+            self._written[i] = self._ranges[i][1] + 1
+            if self._hashing:
+                return
+            self._hashing = True
+        self._drain()
+
+    def _drain(self):
+        """
+        Hash the data written and not yet hashed, in file order, as far as it goes without a gap. Called by the thread
+        that set _hashing, which it clears when it returns.
+        """
+        try:
+            while True:
+                with self._lock:
+                    if self._next >= len(self._ranges):
+                        self._hashing = False
+                        return
+                    first, last = self._ranges[self._next]
+                    if self._done[self._next] and self._hashed_bytes > last:
+                        self._next += 1
+                        done_range = True
+                    else:
+                        done_range = False
+                        end = self._written[self._next]
+                        if end <= self._hashed_bytes:
+                            self._hashing = False
+                            return
+                if done_range:
+                    if self._on_progress is not None:
+                        self._on_progress(last + 1)
+                else:
+                    # Data written before the thread writing it could hash it, e.g., while this thread was hashing.
+                    self._read_back(self._hashed_bytes, end)
+        except Exception:
+            with self._lock:
+                self._hashing = False
+            raise
+
+    def _read_back(self, start, end):
+        offset = start
+        while offset < end:
+            data = os.pread(self._fd, min(self._block_size, end - offset), offset)
+            if not data:
+                raise IOError('File ends at %d before %d bytes are hashed.' % (offset, end))
+            self.hasher.update(data)
+            offset += len(data)
+            self._hashed_bytes = offset
+            self.bytes_read_back += len(data)
+
+
 def crc32_value(file_path, block_size=1048576):
     """
     Calculate the CRC32 value of the data of the specified file.
@@ -0,0 +1,268 @@
+"""
+Read Linux inotify events in process through libc, decoding the binary records of a whole read at once, and keep
+watches on every directory of some trees.
+http://man7.org/linux/man-pages/man7/inotify.7.html
+"""
+
+import collections
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+
+from onedrived.common.path_trie import PathTrie
+
+IN_ACCESS = 0x00000001
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_CLOSE_NOWRITE = 0x00000010
+IN_OPEN = 0x00000020
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_UNMOUNT = 0x00002000
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_DONT_FOLLOW = 0x02000000
+IN_EXCL_UNLINK = 0x04000000
+IN_ISDIR = 0x40000000
+
+# Names of event bits in the order inotifywait prints them, e.g., 'CREATE,ISDIR'.
+_EVENT_NAMES = [(IN_ACCESS, 'ACCESS'), (IN_MODIFY, 'MODIFY'), (IN_ATTRIB, 'ATTRIB'), (IN_CLOSE_WRITE, 'CLOSE_WRITE'),
+                (IN_CLOSE_NOWRITE, 'CLOSE_NOWRITE'), (IN_OPEN, 'OPEN'), (IN_MOVED_FROM, 'MOVED_FROM'),
+                (IN_MOVED_TO, 'MOVED_TO'), (IN_CREATE, 'CREATE'), (IN_DELETE, 'DELETE'),
+                (IN_DELETE_SELF, 'DELETE_SELF'), (IN_MOVE_SELF, 'MOVE_SELF'), (IN_UNMOUNT, 'UNMOUNT'),
+                (IN_Q_OVERFLOW, 'Q_OVERFLOW'), (IN_IGNORED, 'IGNORED'), (IN_ISDIR, 'ISDIR')]
+
+# struct inotify_event without the name that follows it: int wd; uint32_t mask, cookie, len.
+_EVENT_HEADER = struct.Struct('iIII')
+
+# An event as read from the kernel. wd is -1 for IN_Q_OVERFLOW.
+Event = collections.namedtuple('Event', ['wd', 'mask', 'cookie', 'name'])
+
+# An event translated to the path of the watched directory, which ends with '/' as in the output of inotifywait.
+# local_parent_path is None for IN_Q_OVERFLOW.
+PathEvent = collections.namedtuple('PathEvent', ['local_parent_path', 'mask', 'cookie', 'name'])
+
+_libc = None
+
+
+def _get_libc():
+    global _libc
+    if _libc is None:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+        _libc = libc
+    return _libc
+
+
+def _check(ret):
+    if ret < 0:
+        e = ctypes.get_errno()
+        raise OSError(e, os.strerror(e))
+    return ret
+
+
+def event_names(mask):
+    """
+    :param int mask:
+    :return str: Names of the event bits in the format of inotifywait, e.g., 'MOVED_FROM,ISDIR'.
+    """
+    return ','.join(name for bit, name in _EVENT_NAMES if mask & bit)
+
+
+def parse_events(buf):
+    """
+    :param bytes | bytearray | memoryview buf: Records returned by one read of an inotify file descriptor.
+    :rtype: [Event]
+    """
+    events = []
+    offset = 0
+    end = len(buf)
+    while offset + _EVENT_HEADER.size <= end:
+        wd, mask, cookie, name_len = _EVENT_HEADER.unpack_from(buf, offset)
+        offset += _EVENT_HEADER.size
+        name = bytes(buf[offset:offset + name_len]).rstrip(b'\0')
+        offset += name_len
+        events.append(Event(wd, mask, cookie, os.fsdecode(name)))
+    return events
+
+
+class Inotify:
+    """
+    An inotify instance. read_events() returns all events the kernel has queued, up to BUFFER_BYTES, from one read.
+    """
+
+    # Room for at least 2048 events with names of up to 16 bytes.
+    BUFFER_BYTES = 65536
+
+    def __init__(self):
+        self._fd = _check(_get_libc().inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC))
+        self._wake_r, self._wake_w = os.pipe()
+        self._poll = select.poll()
+        self._poll.register(self._fd, select.POLLIN)
+        self._poll.register(self._wake_r, select.POLLIN)
+
+    def fileno(self):
+        return self._fd
+
+    def add_watch(self, path, mask):
+        """
+        :param str path:
+        :param int mask:
+        :return int: The watch descriptor. Watching the same inode again returns the same descriptor.
+        """
+        return _check(_get_libc().inotify_add_watch(self._fd, os.fsencode(path), mask))
+
+    def rm_watch(self, wd):
+        """
+        :param int wd: A watch descriptor. Descriptors the kernel has already removed are ignored.
+        """
+        try:
+            _check(_get_libc().inotify_rm_watch(self._fd, wd))
+        except OSError as e:
+            if e.errno != errno.EINVAL:
+                raise
+
+    def read_events(self, timeout_sec=None):
+        """
+        Wait until events are queued, wake() is called, or the timeout expires.
+        :param float | None timeout_sec: None to wait indefinitely.
+        :rtype: [Event]
+        """
+        ready = self._poll.poll(None if timeout_sec is None else int(timeout_sec * 1000))
+        for fd, _ in ready:
+            if fd == self._wake_r:
+                os.read(self._wake_r, 512)
+        try:
+            return parse_events(os.read(self._fd, self.BUFFER_BYTES))
+        except BlockingIOError:
+            return []
+
+    def wake(self):
+        """ Make a pending or the next call to read_events() return. Safe to call from any thread. """
+        os.write(self._wake_w, b'\0')
+
+    def close(self):
+        os.close(self._fd)
+        os.close(self._wake_r)
+        os.close(self._wake_w)
+
+
+class TreeWatcher:
+    """
+    Keep an inotify watch on every directory of some trees and translate events to paths. Watches are added for
+    directories created or moved into the trees, removed for directories moved out, and renamed with directories
+    moved inside the trees.
+    """
+
+    MASK = IN_CREATE | IN_CLOSE_WRITE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO | IN_UNMOUNT | IN_ONLYDIR | \
+        IN_DONT_FOLLOW | IN_EXCL_UNLINK
+
+    def __init__(self, inotify=None, mask=MASK):
+        """
+        :param Inotify | None inotify: (Optional) The inotify instance to use. A new one by default.
+        :param int mask: (Optional) Events to watch for.
+        """
+        self.inotify = inotify if inotify is not None else Inotify()
+        self.mask = mask
+        self._paths = {}
+        self._wds = PathTrie()
+
+    @property
+    def watch_count(self):
+        """
+        :rtype: int
+        """
+        return len(self._paths)
+
+    def _watch(self, path, wd):
+        old_path = self._paths.get(wd)
+        if old_path is not None and old_path != path:
+            self._wds.remove(old_path)
+        self._paths[wd] = path
+        self._wds.add(path, wd)
+
+    def add_tree(self, path):
+        """
+        Watch a directory and all directories under it. Entries that vanish or cannot be read while walking the tree are
+        skipped. Other errors, e.g., ENOSPC when max_user_watches is reached, are raised.
+        :param str path:
+        """
+        for dir_path, dir_names, _ in os.walk(path):
+            try:
+                self._watch(dir_path, self.inotify.add_watch(dir_path, self.mask))
+            except OSError as e:
+                if e.errno not in (errno.ENOENT, errno.ENOTDIR, errno.EACCES):
+                    raise
+                dir_names.clear()
+
+    def remove_tree(self, path):
+        """
+        :param str path: Stop watching this directory and all directories under it.
+        """
+        for _, wd in self._wds.pop_subtree(path):
+            del self._paths[wd]
+            self.inotify.rm_watch(wd)
+
+    def _move_tree(self, old_path, new_path):
+        """ Keep the watches of a directory moved inside the trees, which move with it, under their new paths. """
+        for path, wd in self._wds.pop_subtree(old_path):
+            path = new_path + path[len(old_path):]
+            self._paths[wd] = path
+            self._wds.add(path, wd)
+
+    def read(self, timeout_sec=None):
+        """
+        Read a batch of events and update watches for directories created, moved or deleted.
+        :param float | None timeout_sec: None to wait indefinitely.
+        :rtype: [PathEvent]
+        """
+        ret = []
+        moved_from = {}
+        for event in self.inotify.read_events(timeout_sec):
+            if event.mask & IN_Q_OVERFLOW:
+                ret.append(PathEvent(None, event.mask, event.cookie, event.name))
+                continue
+            parent_path = self._paths.get(event.wd)
+            if parent_path is None:
+                continue
+            if event.mask & IN_IGNORED:
+                # The kernel removed the watch because the directory was deleted or its file system unmounted.
+                del self._paths[event.wd]
+                if self._wds.get(parent_path) == event.wd:
+                    self._wds.remove(parent_path)
+                continue
+            path = os.path.join(parent_path, event.name)
+            if event.mask & IN_ISDIR:
+                if event.mask & IN_MOVED_FROM:
+                    moved_from[event.cookie] = path
+                elif event.mask & IN_MOVED_TO:
+                    old_path = moved_from.pop(event.cookie, None)
+                    if old_path is not None:
+                        self._move_tree(old_path, path)
+                    else:
+                        self.add_tree(path)
+                elif event.mask & IN_CREATE:
+                    self.add_tree(path)
+            ret.append(PathEvent(parent_path + '/', event.mask, event.cookie, event.name))
+        # Directories moved out of the trees, or whose move was split across reads and will be watched again when the
+        # other half is read.
+        for path in moved_from.values():
+            self.remove_tree(path)
+        return ret
+
+    def wake(self):
+        self.inotify.wake()
+
+    def close(self):
+        self.inotify.close()
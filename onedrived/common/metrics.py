@@ -0,0 +1,109 @@
+"""
+Lightweight in-process metrics. Each component keeps its own MetricSet so that numbers can be reported per component,
+e.g., per item storage of a drive.
+"""
+
+import threading
+
+
+class Timer:
+    """
+    Accumulate the count, sum and maximum of durations of one kind of operation.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.count = 0
+        self.total_sec = 0.0
+        self.max_sec = 0.0
+
+    def record(self, seconds):
+        """
+        :param float seconds: Duration of one operation.
+        """
+        with self._lock:
+            self.count += 1
+            self.total_sec += seconds
+            if seconds > self.max_sec:
+                self.max_sec = seconds
+
+    @property
+    def mean_sec(self):
+        """
+        :rtype: float
+        """
+        return self.total_sec / self.count if self.count > 0 else 0.0
+
+    def snapshot(self):
+        """
+        :return dict[str, int | float]:
+        """
+        with self._lock:
+            return {'count': self.count, 'total_sec': self.total_sec, 'max_sec': self.max_sec,
+                    'mean_sec': self.total_sec / self.count if self.count > 0 else 0.0}
+
+
+class Counter:
+    """
+    A monotonic counter.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0
+
+    def add(self, n=1):
+        """
+        :param int n: Amount to increase.
+        """
+        with self._lock:
+            self.value += n
+
+    def snapshot(self):
+        """
+        :rtype: int
+        """
+        return self.value
+
+
+class MetricSet:
+    """
+    A named collection of metrics, created on first use.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    def _get(self, name, metric_class):
+        metric = self._metrics.get(name)
+        if metric is None:
+            with self._lock:
+                if name not in self._metrics:
+                    self._metrics[name] = metric_class()
+                metric = self._metrics[name]
+        if not isinstance(metric, metric_class):
+            raise TypeError('Metric "%s" is a %s, not a %s.' % (name, type(metric).__name__, metric_class.__name__))
+        return metric
+
+    def timer(self, name):
+        """
+        :param str name:
+        :rtype: Timer
+        """
+        return self._get(name, Timer)
+
+    def counter(self, name):
+        """
+        :param str name:
+        :rtype: Counter
+        """
+        return self._get(name, Counter)
+
+    def snapshot(self):
+        """
+        :return dict[str, T]: Current values of all metrics keyed by name.
+        """
+        with self._lock:
+            metrics = list(self._metrics.items())
+        return {name: metric.snapshot() for name, metric in metrics}
@@ -0,0 +1,164 @@
+"""
+A map keyed by '/'-separated paths and organized by path components, so that all entries under a directory can be
+found or removed without looking at entries elsewhere in the tree.
+"""
+
+_NO_VALUE = object()
+
+
+class _Node:
+    __slots__ = ('children', 'value')
+
+    def __init__(self):
+        self.children = {}
+        self.value = _NO_VALUE
+
+
+def split_path(path):
+    """
+    :param str path: A '/'-separated path. Empty components, e.g., from a trailing '/', are ignored.
+    :rtype: [str]
+    """
+    return [c for c in path.split('/') if c != '']
+
+
+def normalize_path(path):
+    """
+    :param str path: A '/'-separated path.
+    :return str: The path as a PathTrie keys it, i.e., starting with '/' and without empty components. Paths that
+    normalize the same share one entry in a PathTrie.
+    """
+    return '/' + '/'.join(split_path(path))
+
+
+class PathTrie:
+    def __init__(self):
+        self._root = _Node()
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def __contains__(self, path):
+        node = self._find(path)
+        return node is not None and node.value is not _NO_VALUE
+
+    def _find(self, path):
+        node = self._root
+        for name in split_path(path):
+            node = node.children.get(name)
+            if node is None:
+                return None
+        return node
+
+    def get(self, path, default=None):
+        """
+        :param str path:
+        :param default: Value returned when there is no entry on the path.
+        """
+        node = self._find(path)
+        if node is None or node.value is _NO_VALUE:
+            return default
+        return node.value
+
+    def longest_prefix(self, path, default=None):
+        """
+        Find the entry on the path or on its closest ancestor, in one walk down the path.
+        :param str path:
+        :param default: Value returned when neither the path nor any ancestor has an entry.
+        :return (str, T): The path of the entry, normalized to start with '/', and its value. (None, default) if no
+        entry is found.
+        """
+        node = self._root
+        names = split_path(path)
+        depth = 0 if node.value is not _NO_VALUE else -1
+        value = node.value
+        for i, name in enumerate(names):
+            node = node.children.get(name)
+            if node is None:
+                break
+            if node.value is not _NO_VALUE:
+                depth = i + 1
+                value = node.value
+        if depth < 0:
+            return None, default
+        return normalize_path('/'.join(names[:depth])), value
+
+    def add(self, path, value):
+        """
+        Set the value of a path, replacing the existing one, if any.
+        :param str path:
+        :param value:
+        """
+        node = self._root
+        for name in split_path(path):
+            child = node.children.get(name)
+            if child is None:
+                child = node.children[name] = _Node()
+            node = child
+        if node.value is _NO_VALUE:
+            self._size += 1
+        node.value = value
+
+    def _get_nodes(self, names):
+        """
+        :param [str] names: Components of a path.
+        :return [_Node] | None: Nodes from root down to the path, or None if the path has no node.
+        """
+        nodes = [self._root]
+        for name in names:
+            node = nodes[-1].children.get(name)
+            if node is None:
+                return None
+            nodes.append(node)
+        return nodes
+
+    @staticmethod
+    def _prune(names, nodes):
+        """ Remove the nodes left without entries or children, from the bottom up. """
+        for i in range(len(names), 0, -1):
+            if nodes[i].value is not _NO_VALUE or len(nodes[i].children) > 0:
+                break
+            del nodes[i - 1].children[names[i - 1]]
+
+    def remove(self, path):
+        """
+        Remove the entry of a path. Entries under the path are kept.
+        :param str path:
+        :return: Value of the removed entry.
+        """
+        names = split_path(path)
+        nodes = self._get_nodes(names)
+        if nodes is None or nodes[-1].value is _NO_VALUE:
+            raise KeyError(path)
+        value = nodes[-1].value
+        nodes[-1].value = _NO_VALUE
+        self._size -= 1
+        self._prune(names, nodes)
+        return value
+
+    def pop_subtree(self, path):
+        """
+        Remove the entry of a path and all entries under it.
+        :param str path:
+        :return [(str, T)]: Paths and values of the removed entries. Paths are normalized to start with '/'.
+        """
+        names = split_path(path)
+        nodes = self._get_nodes(names)
+        if nodes is None:
+            return []
+        if len(names) == 0:
+            self._root = _Node()
+        else:
+            del nodes[-2].children[names[-1]]
+            self._prune(names[:-1], nodes[:-1])
+        ret = []
+        stack = [('/'.join([''] + names), nodes[-1])]
+        while len(stack) > 0:
+            node_path, node = stack.pop()
+            if node.value is not _NO_VALUE:
+                ret.append((node_path or '/', node.value))
+            for name, child in node.children.items():
+                stack.append((node_path + '/' + name, child))
+        self._size -= len(ret)
+        return ret
@@ -0,0 +1,273 @@
+"""
+Find changes of local trees by comparing them with a snapshot of their last scan, for where inotify cannot be used,
+e.g., it is unavailable, the trees have more directories than max_user_watches, or they are on network mounts.
+"""
+
+import itertools
+import os
+import stat
+import time
+
+from onedrived.common import inotify
+from onedrived.common.metrics import MetricSet
+from onedrived.store.snapshot_db import INODE, IS_DIR, MTIME_NS, SIZE
+
+
+def _nest_free(roots):
+    """
+    :param [str] roots:
+    :return [str]: The roots, without trailing '/', that are not under another root.
+    """
+    ret = []
+    for root in sorted(r.rstrip('/') for r in roots):
+        if len(ret) == 0 or not (root + '/').startswith(ret[-1] + '/'):
+            ret.append(root)
+    return ret
+
+
+def _stat_entry(st):
+    """
+    :param os.stat_result st: Result of stat without following symlinks.
+    :rtype: list
+    """
+    if stat.S_ISDIR(st.st_mode):
+        return [st.st_ino, 0, 0, 1]
+    return [st.st_ino, st.st_size, st.st_mtime_ns, 0]
+
+
+def _type_bit(ent):
+    """
+    :param list ent: An entry of a directory record.
+    :return int: IN_ISDIR for a directory, and 0 otherwise.
+    """
+    return inotify.IN_ISDIR if ent[IS_DIR] else 0
+
+
+class PollingScanner:
+    """
+    Compare local trees with a SnapshotIndex and report the differences as the events inotify would have reported,
+    so that they feed the same event handling as FileSystemMonitor does with inotify:
+
+     * A new entry is reported as IN_CREATE, and a missing one as IN_DELETE. IN_ISDIR is set for directories.
+     * A file whose size or mtime changed is reported as IN_CLOSE_WRITE.
+     * A missing entry and a new one with the same inode on the same device are reported as a move, i.e., IN_MOVED_FROM
+       and IN_MOVED_TO with the same cookie. The snapshot of a moved directory moves with it, so only what changed
+       under it is reported.
+
+    Creating, deleting or renaming an entry changes the mtime of its directory, so a directory whose mtime is as in
+    the snapshot is not listed again. Writing a file does not change the mtime of its directory, so scan() checks the
+    files of those directories only when asked to. Directories are not followed through symlinks.
+
+    On file systems with coarse timestamps, an entry created right after its directory was listed may leave the mtime
+    of the directory as it was. As git does with racily clean files, a directory whose mtime is within RACY_MTIME_NS
+    of the start of the scan is recorded with RACY_MTIME instead, so the next scan lists it again.
+
+    Trees never scanned before are recorded without reporting anything. Not thread-safe.
+    """
+
+    # Coarsest mtime granularity expected, that of FAT.
+    RACY_MTIME_NS = 2000000000
+
+    # Recorded as mtime of directories listed too soon after they changed. No directory has it.
+    RACY_MTIME = -1
+
+    def __init__(self, roots, index):
+        """
+        :param [str] roots: Paths of the directories to scan. Roots under another root are scanned with it.
+        :param onedrived.store.snapshot_db.SnapshotIndex index: Snapshot to compare with, which is updated by scans.
+        """
+        self.roots = _nest_free(roots)
+        self.index = index
+        self.metrics = MetricSet()
+        self._cookies = itertools.count(1)
+        # Directories whose mtime is above it are listed again by the next scan.
+        self._racy_after_ns = 0
+
+    def scan(self, on_event, check_files=False):
+        """
+        Scan all roots once, and commit the updated snapshot.
+        :param on_event: Called for each change with arguments (mask, local_parent_path, name, cookie), where
+        local_parent_path ends with '/' and cookie is 0 except for moves.
+        :param True | False check_files: Also check files in directories whose mtime did not change.
+        """
+        self._racy_after_ns = int(time.time() * 1000000000) - self.RACY_MTIME_NS
+        pending = [(root, True) for root in self.roots]
+        while len(pending) > 0:
+            # Entries gone from and new to their directories: [(parent path, name, entry, device)].
+            removed = []
+            added = []
+            for path, report in pending:
+                self._scan_tree(path, report, check_files, on_event, removed, added)
+            pending = self._report_diff(removed, added, on_event)
+        self.index.commit()
+
+    def _scan_tree(self, path, report, check_files, on_event, removed, added):
+        """
+        Update the snapshot of a directory and the directories under it. Directories new to their parents are not
+        descended into, but left to _report_diff() to tell moved ones from new ones.
+        :param str path:
+        :param True | False report: False to record the tree as the baseline without reporting changes.
+        """
+        stack = [path]
+        while len(stack) > 0:
+            dir_path = stack.pop()
+            try:
+                st = os.stat(dir_path, follow_symlinks=False)
+            except OSError:
+                # It vanished after its parent was listed. The next scan of the parent finds it gone.
+                continue
+            if not stat.S_ISDIR(st.st_mode):
+                continue
+            record = self.index.get(dir_path)
+            new_dir_names = ()
+            if record is not None and record[0] == st.st_mtime_ns:
+                self.metrics.counter('dirs_skipped').add()
+                entries = record[1]
+                if check_files and report:
+                    self._check_files(dir_path, record, on_event)
+            else:
+                entries = self._list_dir(dir_path)
+                if entries is None:
+                    continue
+                mtime_ns = st.st_mtime_ns
+                if mtime_ns > self._racy_after_ns:
+                    mtime_ns = self.RACY_MTIME
+                    self.metrics.counter('dirs_racy').add()
+                self.index.put(dir_path, mtime_ns, entries)
+                if record is not None and report:
+                    new_dir_names = self._diff_dir(dir_path, record[1], entries, st.st_dev, on_event, removed, added)
+            stack.extend(dir_path + '/' + name for name, ent in entries.items()
+                         if ent[IS_DIR] and name not in new_dir_names)
+
+    def _list_dir(self, dir_path):
+        """
+        :param str dir_path:
+        :return dict[str, list] | None: Entries of the directory, or None if it cannot be read.
+        """
+        entries = {}
+        try:
+            if getattr(os, 'scandir', None) is None:
+                # Python before 3.5. Every entry is statted by path.
+                for name in os.listdir(dir_path):
+                    try:
+                        entries[name] = _stat_entry(os.stat(dir_path + '/' + name, follow_symlinks=False))
+                        self.metrics.counter('files_statted').add()
+                    except OSError:
+                        pass
+            else:
+                # Iterators of os.scandir() are context managers only since Python 3.6. Exhausting one closes it.
+                for ent in os.scandir(dir_path):
+                    try:
+                        if ent.is_dir(follow_symlinks=False):
+                            entries[ent.name] = [ent.inode(), 0, 0, 1]
+                        else:
+                            entries[ent.name] = _stat_entry(ent.stat(follow_symlinks=False))
+                            self.metrics.counter('files_statted').add()
+                    except OSError:
+                        # It vanished after listing, so it is as if it were not there.
+                        pass
+        except OSError:
+            return None
+        self.metrics.counter('dirs_listed').add()
+        return entries
+
+    def _check_files(self, dir_path, record, on_event):
+        """
+        Report files written in place in a directory whose entries are unchanged.
+        """
+        mtime_ns, entries = record
+        parent_path = dir_path + '/'
+        changed = False
+        for name, ent in entries.items():
+            if ent[IS_DIR]:
+                continue
+            try:
+                new_ent = _stat_entry(os.stat(parent_path + name, follow_symlinks=False))
+            except OSError:
+                continue
+            self.metrics.counter('files_statted').add()
+            if new_ent != ent and not new_ent[IS_DIR]:
+                ent[:] = new_ent
+                changed = True
+                on_event(inotify.IN_CLOSE_WRITE, parent_path, name, 0)
+        if changed:
+            self.index.put(dir_path, mtime_ns, entries)
+
+    @staticmethod
+    def _diff_dir(dir_path, old_entries, entries, dev, on_event, removed, added):
+        """
+        Report files written in a directory, and collect the entries gone from it and new to it.
+        :return set[str]: Names of directories new to the directory.
+        """
+        parent_path = dir_path + '/'
+        new_dir_names = set()
+        for name, old_ent in old_entries.items():
+            ent = entries.get(name)
+            if ent is None or ent[INODE] != old_ent[INODE] or ent[IS_DIR] != old_ent[IS_DIR]:
+                removed.append((parent_path, name, old_ent, dev))
+            elif not ent[IS_DIR] and (ent[SIZE] != old_ent[SIZE] or ent[MTIME_NS] != old_ent[MTIME_NS]):
+                on_event(inotify.IN_CLOSE_WRITE, parent_path, name, 0)
+        for name, ent in entries.items():
+            old_ent = old_entries.get(name)
+            if old_ent is None or ent[INODE] != old_ent[INODE] or ent[IS_DIR] != old_ent[IS_DIR]:
+                added.append((parent_path, name, ent, dev))
+                if ent[IS_DIR]:
+                    new_dir_names.add(name)
+        return new_dir_names
+
+    @staticmethod
+    def _move_key(ent, dev):
+        """
+        :return tuple: What a moved entry has in common with its old self. A rename keeps the size and mtime of a
+        file, so they are compared too, to avoid taking a new file that reused the inode of a deleted one for a move.
+        """
+        if ent[IS_DIR]:
+            return dev, ent[INODE], 1
+        return dev, ent[INODE], 0, ent[SIZE], ent[MTIME_NS]
+
+    def _report_diff(self, removed, added, on_event):
+        """
+        Pair entries gone from their directories with new ones into moves, report all of them, and update the
+        snapshot of directories moved or deleted.
+        :param [(str, str, list, int)] removed: Entries gone, as (parent path, name, entry, device).
+        :param [(str, str, list, int)] added: Entries new, in the same form.
+        :return [(str, True | False)]: Directories to scan next, with whether to report their changes. Moved
+        directories are compared with their old snapshot, and new ones are recorded as the baseline.
+        """
+        removed_by_key = {}
+        for r in removed:
+            removed_by_key.setdefault(self._move_key(r[2], r[3]), []).append(r)
+        moves = []
+        created = []
+        for a in added:
+            candidates = removed_by_key.get(self._move_key(a[2], a[3]))
+            if candidates:
+                moves.append((candidates.pop(), a))
+            else:
+                created.append(a)
+        moved = set(id(r) for r, _ in moves)
+        gone = [r for r in removed if id(r) not in moved]
+        # Deletions go first, so that an entry replaced by another is not taken for deleted after the replacement. All
+        # sources of moves go before their targets, so that entries swapping names are not taken for overwritten.
+        for parent_path, name, ent, _ in gone:
+            on_event(inotify.IN_DELETE | _type_bit(ent), parent_path, name, 0)
+        cookies = [next(self._cookies) for _ in moves]
+        for ((parent_path, name, ent, _), _), cookie in zip(moves, cookies):
+            on_event(inotify.IN_MOVED_FROM | _type_bit(ent), parent_path, name, cookie)
+        for (_, (parent_path, name, ent, _)), cookie in zip(moves, cookies):
+            on_event(inotify.IN_MOVED_TO | _type_bit(ent), parent_path, name, cookie)
+        for parent_path, name, ent, _ in created:
+            on_event(inotify.IN_CREATE | _type_bit(ent), parent_path, name, 0)
+        # Take all old records out before putting moved ones back, in case a directory took the path of another.
+        moved_records = [(r[0] + r[1], a[0] + a[1], self.index.pop_subtree(r[0] + r[1]))
+                         for r, a in moves if r[2][IS_DIR]]
+        for parent_path, name, ent, _ in gone:
+            if ent[IS_DIR]:
+                self.index.pop_subtree(parent_path + name)
+        pending = []
+        for old_path, new_path, records in moved_records:
+            for path, (mtime_ns, entries) in records.items():
+                self.index.put(new_path + path[len(old_path):], mtime_ns, entries)
+            pending.append((new_path, True))
+        pending.extend((parent_path + name, False) for parent_path, name, ent, _ in created if ent[IS_DIR])
+        return pending
@@ -0,0 +1,143 @@
+"""
+Run functions after a delay on one shared thread, instead of a thread per delay as threading.Timer does.
+"""
+
+import heapq
+import itertools
+import threading
+import time
+
+from onedrived.common import logger_factory
+from onedrived.common.metrics import MetricSet
+
+
+class ScheduledCall:
+    """ A handle of a call scheduled by Scheduler.call_later(). """
+
+    __slots__ = ('due', 'func', 'args', 'cancelled', 'queued', '_scheduler')
+
+    def __init__(self, scheduler, due, func, args):
+        self._scheduler = scheduler
+        self.due = due
+        self.func = func
+        self.args = args
+        self.cancelled = False
+        # True while the call is in the heap of the scheduler.
+        self.queued = True
+
+    def cancel(self):
+        """ Prevent the call if it has not started. Cancelling a call that ran or was cancelled does nothing. """
+        self._scheduler._cancel(self)
+
+
+class Scheduler(threading.Thread):
+    """
+    A singleton thread running delayed calls in the order they are due. Calls are kept in a heap keyed by due time, so
+    scheduling is O(log n) and the thread only wakes up when the earliest call is due. Cancelled calls stay in the heap
+    until they reach its head, unless they outnumber the live ones, in which case the heap is rebuilt without them.
+
+    Calls run on the scheduler thread one after another, so they should be short, e.g., put a task back to the task
+    pool. How late each call started is recorded in `metrics` as "lateness".
+    """
+
+    logger = logger_factory.get_logger('Scheduler')
+
+    @classmethod
+    def get_instance(cls):
+        """
+        :return Scheduler: The shared scheduler, started on first use.
+        """
+        with cls._instance_lock:
+            if not hasattr(cls, '_instance'):
+                cls._instance = Scheduler()
+                cls._instance.start()
+            return cls._instance
+
+    _instance_lock = threading.Lock()
+
+    def __init__(self):
+        super().__init__(name='scheduler', daemon=True)
+        self._cond = threading.Condition()
+        self._seq = itertools.count()
+        # Heap of entries (due time, sequence number, ScheduledCall).
+        self._heap = []
+        self._cancelled = 0
+        self._running = True
+        self.metrics = MetricSet()
+
+    @property
+    def pending_count(self):
+        """
+        :return int: Number of calls scheduled and neither started nor cancelled.
+        """
+        with self._cond:
+            return len(self._heap) - self._cancelled
+
+    def call_later(self, delay_sec, func, *args):
+        """
+        :param float delay_sec: Run the call at the earliest this many seconds later.
+        :param func:
+        :param args: Positional arguments of func.
+        :rtype: ScheduledCall
+        """
+        call = ScheduledCall(self, time.monotonic() + delay_sec, func, args)
+        with self._cond:
+            heapq.heappush(self._heap, (call.due, next(self._seq), call))
+            if self._heap[0][2] is call:
+                self._cond.notify()
+        return call
+
+    def _cancel(self, call):
+        """
+        :param ScheduledCall call:
+        """
+        with self._cond:
+            if call.cancelled or not call.queued:
+                return
+            call.cancelled = True
+            self._cancelled += 1
+            if self._cancelled > len(self._heap) // 2:
+                self._heap = [e for e in self._heap if not e[2].cancelled]
+                heapq.heapify(self._heap)
+                self._cancelled = 0
+
+    def close(self):
+        """ Stop the thread. Calls not yet due are dropped. """
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+
+    def _pop_due(self):
+        """
+        :return ScheduledCall | None: The next call once it is due, or None if the scheduler is closed.
+        """
+        with self._cond:
+            while self._running:
+                if len(self._heap) == 0:
+                    self._cond.wait()
+                    continue
+                due, _, call = self._heap[0]
+                if call.cancelled:
+                    heapq.heappop(self._heap)
+                    call.queued = False
+                    self._cancelled -= 1
+                    continue
+                now = time.monotonic()
+                if due > now:
+                    self._cond.wait(due - now)
+                    continue
+                heapq.heappop(self._heap)
+                call.queued = False
+                return call
+        return None
+
+    def run(self):
+        while True:
+            call = self._pop_due()
+            if call is None:
+                return
+            self.metrics.timer('lateness').record(time.monotonic() - call.due)
+            try:
+                call.func(*call.args)
+            except Exception as e:
+                self.logger.error('Error running scheduled call %s: %s.', call.func, e)
@@ -22,9 +22,15 @@ class TaskConsumer(threading.Thread):
             if self.terminate_sign.is_set():
                 break
             task = self.task_pool.pop_task()
+            if task is None:
+                # The task was removed from the pool after the semaphore was released for it.
+                continue
             self.logger.debug('Acquired task of type "%s" on parent "%s", name "%s".',
                               type(task).__name__, task.local_parent_path, task.item_name)
-            task.handle()
+            try:
+                task.handle()
+            finally:
+                self.task_pool.complete_task(task)
         self.logger.debug('Stopped.')
 
 
@@ -1,11 +1,31 @@
+import json
+import math
+
 from onedrived.common import logger_factory
 
-__all__ = ['copy_task', 'delete_task', 'down_task', 'merge_task', 'move_task', 'up_task', 'utils']
+__all__ = ['copy_task', 'delete_task', 'delta_task', 'down_task', 'merge_task', 'move_task', 'up_task', 'utils']
+
+
+class TaskPriorities:
+    """ Priority classes of tasks, most urgent first. """
+    METADATA = 'metadata'
+    SMALL_TRANSFER = 'small_transfer'
+    LARGE_TRANSFER = 'large_transfer'
 
 
 class TaskBase:
     logger = logger_factory.get_logger('Tasks')
 
+    # Task pool pops tasks in the order of enqueue time plus priority delay. Metadata tasks have no delay, so they
+    # overtake transfers queued shortly before them and discover the rest of the tree early. Because the delay is
+    # fixed at enqueue, a transfer yields to tasks queued at most its delay after it, and is never starved. The delay
+    # of a transfer grows with the logarithm of its size, so that a huge file waits about a minute rather than hours.
+    IS_TRANSFER = False
+    TRANSFER_DELAY_SEC = 5.0
+    TRANSFER_DELAY_SEC_PER_DOUBLING = 5.0
+    TRANSFER_DELAY_UNIT_BYTES = 1048576
+    LARGE_TRANSFER_BYTES = 8388608
+
     def __init__(self, parent_task=None):
         """
         Initialize basic properties from the task from the parent task.
@@ -127,5 +147,68 @@ class TaskBase:
         """
         self._hold = v
 
+    @property
+    def size_hint(self):
+        """
+        :return int: Estimated number of bytes the task transfers.
+        """
+        return 0
+
+    @property
+    def priority(self):
+        """
+        Size of a transfer is taken once for both values, since it may take a stat call.
+        :return (float, str): Priority delay and priority class of the task.
+        """
+        if not self.IS_TRANSFER:
+            return 0.0, TaskPriorities.METADATA
+        size = self.size_hint
+        delay = self.TRANSFER_DELAY_SEC + self.TRANSFER_DELAY_SEC_PER_DOUBLING * math.log2(
+            1 + size / self.TRANSFER_DELAY_UNIT_BYTES)
+        if size < self.LARGE_TRANSFER_BYTES:
+            return delay, TaskPriorities.SMALL_TRANSFER
+        return delay, TaskPriorities.LARGE_TRANSFER
+
+    @property
+    def priority_class(self):
+        """
+        :return str: One value of TaskPriorities.
+        """
+        return self.priority[1]
+
+    @property
+    def priority_delay(self):
+        """
+        :return float: Seconds the task may yield to tasks queued after it.
+        """
+        return self.priority[0]
+
+    def dump(self):
+        """
+        Serialize the task for the task journal. Tasks that return None are not journaled.
+        :return str | None: A serialized JSON dictionary that can be passed to load().
+        """
+        return None
+
+    @classmethod
+    def load(cls, parent_task, s):
+        """
+        Re-create a task from the output of dump().
+        :param TaskBase parent_task: Task providing the drive, item storage and task pool.
+        :param str s: A string returned by a dump() call.
+        :rtype: TaskBase
+        """
+        raise NotImplementedError('Subclass should override this stub.')
+
+    @staticmethod
+    def _dump_args(**kwargs):
+        return json.dumps(kwargs)
+
+    def discard(self):
+        """
+        Called by the task pool when the task is removed from the pool without being handled.
+        """
+        pass
+
     def handle(self):
         raise NotImplementedError('Subclass should override this stub.')
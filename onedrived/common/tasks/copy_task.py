@@ -1,10 +1,9 @@
 import os
-import threading
-from time import sleep
 
 from onedrived.api import errors
 from onedrived.api import options
 from onedrived.api import resources
+from onedrived.common.scheduler import Scheduler
 from onedrived.common.tasks import TaskBase
 from onedrived.common.tasks.up_task import UploadFileTask
 from onedrived.store.items_db import ItemRecordStatuses
@@ -47,10 +46,10 @@ class AsyncCopyMonitorTask(TaskBase):
         self._async_status = async_status
 
     def put_back(self):
+        """ Put the task back to task pool after the polling interval, without holding a thread meanwhile. """
         self.logger.info('Copy for file "%s" is still in progress. Recheck in %d sec.',
                          self.local_path, self.POLLING_INTERVAL_SEC)
-        sleep(self.POLLING_INTERVAL_SEC)
-        self.task_pool.add_task(self)
+        Scheduler.get_instance().call_later(self.POLLING_INTERVAL_SEC, self.task_pool.add_task, self)
 
     def handle(self):
         try:
@@ -70,9 +69,6 @@ class AsyncCopyMonitorTask(TaskBase):
                 self.items_store.update_item(item, ItemRecordStatuses.OK)
                 self.logger.info('Successfully copied file "%s" to server', self.local_path)
             else:
-                # Put the task back to task pool.
-                th = threading.Thread(target=self.put_back, args=())
-                th.daemon = True
-                th.start()
+                self.put_back()
         except errors.OneDriveError as e:
             self.logger.error('API error when polling copy status for file "%s": %s.', self.local_path, e)
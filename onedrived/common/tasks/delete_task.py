@@ -1,3 +1,5 @@
+import json
+
 from onedrived.api import errors
 from onedrived.common.tasks import TaskBase
 
@@ -15,6 +17,15 @@ class DeleteItemTask(TaskBase):
         self.item_name = item_name
         self.is_folder = is_folder
 
+    def dump(self):
+        return self._dump_args(rel_parent_path=self.rel_parent_path, item_name=self.item_name,
+                               is_folder=self.is_folder)
+
+    @classmethod
+    def load(cls, parent_task, s):
+        data = json.loads(s)
+        return cls(parent_task, data['rel_parent_path'], data['item_name'], data['is_folder'])
+
     def handle(self):
         try:
             self.drive.delete_item(item_path=self.remote_path)
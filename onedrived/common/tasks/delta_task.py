@@ -0,0 +1,235 @@
+import os
+import threading
+
+from send2trash import send2trash
+
+from onedrived.api import errors
+from onedrived.common.dateparser import compare_timestamps, datetime_to_timestamp
+from onedrived.common.tasks import TaskBase
+from onedrived.common.tasks.merge_task import MergeDirTask, MergeWalk
+from onedrived.common.tasks.up_task import UploadFileTask
+from onedrived.common.tasks.utils import stat_file
+from onedrived.common.tasks.utils import unpack_first_item as _unpack_first_item
+
+
+class DeltaSyncTask(TaskBase):
+    """
+    Replay the changes of a drive since the delta token stored in its item storage. A full MergeDirTask walk from
+    drive root is started only when there is no token, the server rejects it, or changes cannot be located. While the
+    walk runs, the drive has no stored token, the token for the changes made after the walk started is kept as the
+    pending token, and no other walk or replay of the drive starts.
+    """
+
+    LATEST_TOKEN = 'latest'
+
+    # Drive -> MergeWalk from drive root in progress.
+    _walks = {}
+    _walks_lock = threading.Lock()
+
+    def __init__(self, parent_task):
+        super().__init__(parent_task)
+        self.rel_parent_path = ''
+        self.item_name = ''
+        self.path_filter = self.drive.config.path_filter
+        self._root_path = self.drive.drive_path + '/root:'
+        self._dir_paths = {}
+        self._mergers = {}
+        self._needs_full_merge = False
+
+    def handle(self):
+        with self._walks_lock:
+            if self.drive in self._walks:
+                self.logger.info('Drive "%s" is being merged from root. Skip this sync.', self.drive.drive_id)
+                return
+        token = self.items_store.get_delta_token()
+        if token is None:
+            pending_token = self.items_store.get_delta_token(pending=True)
+            if pending_token is not None:
+                # A walk was interrupted, e.g., by a restart, or could not start. Its token is still good.
+                self.logger.info('Merge of drive "%s" from root did not finish. Start it again.', self.drive.drive_id)
+                self._start_walk(pending_token)
+            else:
+                self.logger.info('No delta token for drive "%s". Start a full merge.', self.drive.drive_id)
+                self._start_full_merge()
+            return
+        try:
+            changes = self.drive.get_changes(token=token)
+            while changes.has_next:
+                page = changes.get_next()
+                # Every page carries a token for the changes fetched so far. Store it after the changes so that an
+                # interrupted replay resumes right after the last applied page: writes are committed in the order
+                # they are made, so the token is never committed before the changes it covers.
+                for item in page:
+                    self._apply_change(item)
+                if changes.delta_token is not None:
+                    self.items_store.update_delta_token(changes.delta_token)
+        except errors.OneDriveResyncRequiredError as e:
+            self.logger.info('Delta token of drive "%s" was rejected: %s. Start a full merge.', self.drive.drive_id, e)
+            self.items_store.update_delta_token(None)
+            self._start_full_merge()
+            return
+        except errors.OneDriveError as e:
+            self.logger.error('API error enumerating changes of drive "%s": %s.', self.drive.drive_id, e)
+            return
+        if self._needs_full_merge:
+            self.logger.info('Some changes of drive "%s" cannot be located. Merge from root.', self.drive.drive_id)
+            self._start_walk(self.items_store.get_delta_token())
+
+    def _start_full_merge(self):
+        # Take the token before walking the tree so that changes made during the walk will be replayed next time.
+        try:
+            token = self.drive.get_changes(token=self.LATEST_TOKEN).delta_token
+        except errors.OneDriveError as e:
+            self.logger.error('API error getting latest delta token of drive "%s": %s.', self.drive.drive_id, e)
+            token = None
+        self._start_walk(token)
+
+    def _start_walk(self, token):
+        """
+        Merge the tree from drive root, and store the token only once the walk has finished. The stored token is
+        dropped meanwhile and the token is kept as the pending token, so that if the daemon stops mid-walk, the next
+        run walks the tree again rather than replaying changes on a tree that was never fully merged.
+        :param str | None token: Delta token for the changes made after the walk started.
+        """
+        walk = MergeWalk(lambda: self._finish_walk(walk, token))
+        with self._walks_lock:
+            if self.drive in self._walks:
+                return
+            self._walks[self.drive] = walk
+        self.items_store.update_delta_token(None)
+        self.items_store.update_delta_token(token, pending=True)
+        if not walk.add_task(self.task_pool, MergeDirTask(self, '', '')):
+            # Drive root is already queued to merge outside a walk. Keep the pending token and walk again next time.
+            self.logger.info('Drive root of "%s" is already queued. Merge from root later.', self.drive.drive_id)
+            with self._walks_lock:
+                del self._walks[self.drive]
+
+    def _finish_walk(self, walk, token):
+        self.logger.info('Finished merging drive "%s" from root.', self.drive.drive_id)
+        with self._walks_lock:
+            if self._walks.get(self.drive) is walk:
+                del self._walks[self.drive]
+        self.items_store.update_delta_token(token)
+        self.items_store.update_delta_token(None, pending=True)
+
+    def _get_merger(self, rel_dir_path):
+        """
+        Get a MergeDirTask working on the given directory, which is used to analyze a single child item without
+        listing the directory.
+        :param str rel_dir_path: Path to the directory relative to drive root. '' for root.
+        :rtype: onedrived.common.tasks.merge_task.MergeDirTask
+        """
+        if rel_dir_path not in self._mergers:
+            if rel_dir_path == '':
+                merger = MergeDirTask(self, '', '')
+            else:
+                rel_parent_path, name = rel_dir_path.rsplit('/', 1)
+                merger = MergeDirTask(self, rel_parent_path + '/', name)
+            self._mergers[rel_dir_path] = merger
+        return self._mergers[rel_dir_path]
+
+    def _resolve_parent_path(self, item):
+        """
+        Find the path reference of the parent of a changed item. Delta responses may omit the path, in which case
+        the parent is located by its ID among directories seen in this run or in database.
+        :param onedrived.api.items.OneDriveItem item:
+        :return str | None: Path reference of the parent directory, or None if it cannot be resolved.
+        """
+        parent_ref = item.parent_reference
+        if parent_ref is None:
+            return None
+        if 'path' in parent_ref.data:
+            return parent_ref.path
+        if parent_ref.id in self._dir_paths:
+            return self._dir_paths[parent_ref.id]
+        q = self.items_store.get_items_by_id(item_id=parent_ref.id)
+        if len(q) > 0:
+            item_id, record = _unpack_first_item(q)
+            return record.parent_path + '/' + record.item_name
+        return None
+
+    def _apply_change(self, item):
+        """
+        :param onedrived.api.items.OneDriveItem item: An item changed since the last token.
+        """
+        if item.is_root:
+            self._dir_paths[item.id] = self._root_path
+            return
+        if item.deleted_props is not None:
+            self._apply_deletion(item)
+            return
+        parent_path = self._resolve_parent_path(item)
+        if parent_path is None or not parent_path.startswith(self._root_path):
+            self.logger.warning('Cannot locate parent of changed item "%s".', item.id)
+            self._needs_full_merge = True
+            return
+        # Fill in the path so that records written for this item refer to the right parent.
+        item.parent_reference.data['path'] = parent_path
+        if item.is_folder:
+            self._dir_paths[item.id] = parent_path + '/' + item.name
+        rel_parent_path = parent_path[len(self._root_path):]
+        if self.path_filter.should_ignore(rel_parent_path + '/' + item.name, item.is_folder):
+            return
+        merger = self._get_merger(rel_parent_path)
+        item_local_path = merger.local_path + '/' + item.name
+        if not os.path.isdir(merger.local_path) or self.task_pool.has_pending_task(item_local_path):
+            return
+        self._apply_move(item, parent_path, item_local_path)
+        q = self.items_store.get_items_by_id(parent_path=parent_path, item_name=item.name)
+        merger._analyze_remote_item(item, set(), _unpack_first_item(q)[1] if len(q) > 0 else None)
+
+    def _apply_move(self, item, parent_path, item_local_path):
+        """
+        If the item is recorded at a different path, move the local entry along so that it is not downloaded again.
+        :param onedrived.api.items.OneDriveItem item:
+        :param str parent_path: New path reference of the item's parent.
+        :param str item_local_path: New local path of the item.
+        """
+        q = self.items_store.get_items_by_id(item_id=item.id)
+        if len(q) == 0:
+            return
+        item_id, record = _unpack_first_item(q)
+        if record.parent_path == parent_path and record.item_name == item.name:
+            return
+        old_local_path = self.drive.config.local_root + record.local_path
+        if not os.path.exists(old_local_path) or os.path.exists(item_local_path):
+            return
+        try:
+            os.rename(old_local_path, item_local_path)
+            self.items_store.move_item(item, record.parent_path, record.item_name)
+            self.logger.info('Moved local entry "%s" to "%s".', old_local_path, item_local_path)
+        except (IOError, OSError) as e:
+            self.logger.error('IO error moving local entry "%s" to "%s": %s.', old_local_path, item_local_path, e)
+
+    def _apply_deletion(self, item):
+        """
+        :param onedrived.api.items.OneDriveItem item: An item deleted remotely.
+        """
+        q = self.items_store.get_items_by_id(item_id=item.id)
+        if len(q) == 0:
+            return
+        item_id, record = _unpack_first_item(q)
+        item_local_path = self.drive.config.local_root + record.local_path
+        if self.task_pool.has_pending_task(item_local_path):
+            return
+        try:
+            if record.is_folder and os.path.isdir(item_local_path):
+                send2trash(item_local_path)
+                self.items_store.evict_cached_hashes(item_local_path)
+                self.task_pool.remove_children_tasks(item_local_path)
+                self.logger.info('Deleted local directory "%s" as it was deleted remotely.', item_local_path)
+            elif not record.is_folder and os.path.isfile(item_local_path):
+                file_size, file_mtime = stat_file(item_local_path)
+                if file_size == record.size \
+                        and compare_timestamps(file_mtime, datetime_to_timestamp(record.modified_time)) == 0:
+                    send2trash(item_local_path)
+                    self.items_store.evict_cached_hashes(item_local_path)
+                    self.logger.info('Deleted local file "%s" as it was deleted remotely.', item_local_path)
+                else:
+                    # The local file changed since last sync. Keep it by uploading it again.
+                    self.logger.info('File "%s" was deleted remotely but changed locally. Upload.', item_local_path)
+                    rel_parent_path = record.parent_path[len(self._root_path):] + '/'
+                    self.task_pool.add_task(UploadFileTask(self, rel_parent_path, record.item_name))
+            self.items_store.delete_item(item_id=item_id, is_folder=record.is_folder)
+        except (IOError, OSError) as e:
+            self.logger.error('IO error deleting local entry "%s": %s.', item_local_path, e)
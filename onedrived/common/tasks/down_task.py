@@ -1,8 +1,11 @@
+import json
 import os
 
 from onedrived import OS_USER_ID, OS_USER_GID
 from onedrived.api import errors
+from onedrived.api.items import OneDriveItem
 from onedrived.common.dateparser import datetime_to_timestamp
+from onedrived.common.metrics import MetricSet
 from onedrived.common.tasks import TaskBase
 from onedrived.store.items_db import ItemRecordStatuses
 
@@ -12,6 +15,11 @@ def get_tmp_filename(name):
 
 
 class DownloadFileTask(TaskBase):
+    IS_TRANSFER = True
+
+    # Counts bytes that were reused from an interrupted download and bytes that had to be downloaded again.
+    metrics = MetricSet()
+
     def __init__(self, parent_task, rel_parent_path, item):
         """
         :param TaskBase parent_task: Base task.
@@ -23,17 +31,72 @@ class DownloadFileTask(TaskBase):
         self._item = item
         self._item_name = item.name
 
+    @property
+    def size_hint(self):
+        return self._item.size
+
+    def dump(self):
+        return self._dump_args(rel_parent_path=self.rel_parent_path, item=self._item.data)
+
+    @classmethod
+    def load(cls, parent_task, s):
+        data = json.loads(s)
+        return cls(parent_task, data['rel_parent_path'], OneDriveItem(parent_task.drive, data['item']))
+
+    def _get_resume_offset(self, local_item_tmp_path):
+        """
+        Find how much of the item was downloaded to the temporary file before the download was interrupted. The
+        progress is only reused if the item has not changed on the server since, as judged by its eTag and size.
+        :param str local_item_tmp_path:
+        :return int: Number of bytes from the start of the temporary file that can be kept.
+        """
+        partial = self.items_store.get_partial_download(self._item.id)
+        if partial is None:
+            return 0
+        e_tag, size, done_bytes = partial
+        if e_tag == self._item.e_tag and size == self._item.size and os.path.isfile(local_item_tmp_path) \
+                and os.path.getsize(local_item_tmp_path) >= done_bytes:
+            self.metrics.counter('resumed_bytes').add(done_bytes)
+            return done_bytes
+        self.metrics.counter('restarted_bytes').add(done_bytes)
+        self.logger.info('Discarded %d bytes downloaded before for "%s" because the item changed.',
+                         done_bytes, self.local_path)
+        return 0
+
     def handle(self):
         local_item_tmp_path = self.local_parent_path + get_tmp_filename(self.item_name)
         try:
-            with open(local_item_tmp_path, 'wb') as f:
-                self.drive.download_file(file=f, size=self._item.size, item_id=self._item.id)
+            offset = self._get_resume_offset(local_item_tmp_path)
+            # Opened for reading as well so that large files can be downloaded in parallel ranges, and so that the
+            # part kept from an interrupted download can be hashed.
+            with open(local_item_tmp_path, 'r+b' if offset > 0 else 'w+b') as f:
+                hashes = self.drive.download_file(file=f, size=self._item.size, item_id=self._item.id,
+                                                  offset=offset, on_progress=self._save_progress)
+            file_props = self._item.file_props
+            if hashes.matches(file_props.hashes if file_props is not None else None) is False:
+                self.logger.error('Downloaded content of "%s" does not match hash values on server. Discard it.',
+                                  self.local_path)
+                self.items_store.delete_partial_download(self._item.id)
+                os.remove(local_item_tmp_path)
+                return
             os.rename(local_item_tmp_path, self.local_path)
             t = datetime_to_timestamp(self._item.modified_time)
             os.utime(self.local_path, (t, t))
             os.chown(self.local_path, OS_USER_ID, OS_USER_GID)
-            self.items_store.update_item(self._item, ItemRecordStatuses.DOWNLOADED)
+            self.items_store.update_item(self._item, ItemRecordStatuses.DOWNLOADED, hashes=hashes)
+            self.items_store.delete_partial_download(self._item.id)
+            # The file was hashed as it was downloaded, so the next merge need not read it to compare hashes.
+            self.items_store.update_cached_hashes(self.local_path, os.stat(self.local_path), hashes.crc32_hex,
+                                                  hashes.sha1)
         except (IOError, OSError) as e:
             self.logger.error('An IO error occurred when downloading "%s": %s.', self.local_path, e)
         except errors.OneDriveError as e:
             self.logger.error('An API error occurred when downloading "%s": %s.', self.local_path, e)
+
+    def _save_progress(self, done_bytes):
+        """
+        Persist the number of bytes downloaded from the start of the file so that an interrupted download resumes there.
+        :param int done_bytes:
+        """
+        if done_bytes < self._item.size:
+            self.items_store.update_partial_download(self._item, done_bytes)
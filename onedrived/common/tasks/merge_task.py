@@ -1,9 +1,11 @@
+import json
 import os
+import threading
 
 from send2trash import send2trash
 
 from onedrived import mkdir
-from onedrived.api import errors
+from onedrived.api import errors, items
 from onedrived.common import hasher
 from onedrived.common.dateparser import datetime_to_timestamp, compare_timestamps
 from onedrived.common.tasks import TaskBase
@@ -11,24 +13,69 @@ from onedrived.common.tasks.delete_task import DeleteItemTask
 from onedrived.common.tasks.down_task import DownloadFileTask
 from onedrived.common.tasks.up_task import UpdateMetadataTask
 from onedrived.common.tasks.up_task import UploadFileTask
-from onedrived.common.tasks.utils import append_hostname, stat_file
-from onedrived.common.tasks.utils import unpack_first_item as _unpack_first_item
+from onedrived.common.tasks.utils import LocalDir, append_hostname, get_file_hashes, is_dir_entry, stat_entry
+from onedrived.common.tree_walker import TreeWalker
 from onedrived.store.items_db import ItemRecordStatuses
 
 
-def _have_equal_hash(item_local_path, item):
+def _have_equal_hash(items_store, item_local_path, item, st=None):
     """
+    :param onedrived.store.items_db.ItemStorage items_store: Storage whose hash cache saves reading unchanged files.
     :param str item_local_path:
     :param onedrived.api.items.OneDriveItem item:
+    :param os.stat_result | None st: (Optional) Status of the local file, if already known.
     :return True | False:
     """
     file_props = item.file_props
     hash_props = file_props.hashes if file_props is not None else None
-    if hash_props is not None:
-        if hash_props.crc32 is not None and hash_props.crc32 == hasher.crc32_value(item_local_path) \
-                or hash_props.sha1 is not None and hash_props.sha1 == hasher.hash_value(item_local_path):
+    if hash_props is None or hash_props.sha1 is None and hash_props.crc32 is None:
+        return False
+    crc32_hash, sha1_hash = get_file_hashes(items_store, item_local_path, st)
+    return hasher.hashes_match(hash_props, crc32_hash, sha1_hash) is True
+
+
+class MergeWalk:
+    """
+    Track the MergeDirTasks of a walk down a tree, i.e., the first MergeDirTask and those queued for subdirectories by
+    MergeDirTasks of the walk, and call a function once all of them have been handled or removed from the task pool.
+    Tasks of the walk lost with the daemon are never handled, in which case the function is not called.
+    """
+
+    def __init__(self, on_done):
+        """
+        :param on_done: Called without arguments once the walk finishes, on the thread of its last MergeDirTask.
+        """
+        self._on_done = on_done
+        self._lock = threading.Lock()
+        self._pending = 0
+
+    def add_task(self, task_pool, task):
+        """
+        Queue a MergeDirTask as part of the walk.
+        :param onedrived.store.task_pool.TaskPool task_pool:
+        :param MergeDirTask task:
+        :return True | False: True if the task was added.
+        """
+        task.walk = self
+        with self._lock:
+            self._pending += 1
+        if task_pool.add_task(task):
             return True
-    return False
+        task.walk = None
+        # The directory is merged by a task outside the walk. If it was the first one, the walk has no task to finish.
+        with self._lock:
+            self._pending -= 1
+        return False
+
+    def task_done(self):
+        """
+        Tell that a MergeDirTask of the walk was handled, after it queued the tasks for its subdirectories.
+        """
+        with self._lock:
+            self._pending -= 1
+            done = self._pending == 0
+        if done:
+            self._on_done()
 
 
 class MergeDirTask(TaskBase):
@@ -36,40 +83,95 @@ class MergeDirTask(TaskBase):
         super().__init__(parent_task)
         self.rel_parent_path = rel_parent_path
         self.item_name = item_name
+        # The MergeWalk this task is part of, if any.
+        self.walk = None
         self.path_filter = self.drive.config.path_filter
+        # Replaced by a listing in handle(). Until then, e.g., when DeltaSyncTask analyzes single items, entries are
+        # looked up one by one.
+        self._local_dir = LocalDir(self.local_path)
+
+    def dump(self):
+        return self._dump_args(rel_parent_path=self.rel_parent_path, item_name=self.item_name)
+
+    @classmethod
+    def load(cls, parent_task, s):
+        data = json.loads(s)
+        return cls(parent_task, data['rel_parent_path'], data['item_name'])
 
     def handle(self):
         """
         Merge a remote directory with a local one.
         """
+        try:
+            self._merge()
+        finally:
+            if self.walk is not None:
+                self.walk.task_done()
+
+    def discard(self):
+        # The directory is gone, so there is nothing left for the walk to wait for under it.
+        if self.walk is not None:
+            self.walk.task_done()
+
+    def _merge(self):
         if not os.path.isdir(self.local_path):
             self.logger.error('Failed to merge dir "%s". Path is not a directory.', self.local_path)
             return
+        walker = TreeWalker.get_instance(self.drive)
         try:
             all_local_items = self._list_local_items()
-            all_remote_items = self.drive.get_children(item_path=self.remote_path)
+            all_remote_pages = walker.take(self.rel_path)
+            listed_ahead = all_remote_pages is not None
+            if not listed_ahead:
+                all_remote_pages = items.iter_pages(self.drive.get_children(item_path=self.remote_path),
+                                                    self.drive.config.list_prefetch_pages)
         except (IOError, OSError) as e:
             self.logger.error('Error occurred when synchronizing "%s": %s.', self.local_path, e)
             return
-        while all_remote_items.has_next:
-            for remote_item in all_remote_items.get_next():
-                all_local_items.discard(remote_item.name)  # Remove remote item from untouched list.
-                if not self.path_filter.should_ignore(self.rel_path + '/' + remote_item.name, remote_item.is_folder) \
-                        and not self.task_pool.has_pending_task(self.local_path + '/' + remote_item.name):
-                    self._analyze_remote_item(remote_item, all_local_items)
+        self.items_store.prune_cached_hashes(self.local_path, all_local_items)
+        # Reconcile against a snapshot of all records under this directory rather than querying one by one.
+        all_records = self.items_store.get_items_by_parent(parent_path=self.remote_path)
+        for page in all_remote_pages:
+            self._analyze_remote_page(page, all_local_items, all_records)
+        if listed_ahead and any(all_records.get(name) is not None for name in all_local_items):
+            # Local items with records would be deleted for missing from a listing fetched a while ago. They may have
+            # been created remotely since, so list the directory again before deleting anything.
+            self.logger.debug('Listing "%s" again before deleting local items.', self.remote_path)
+            try:
+                for page in items.iter_pages(self.drive.get_children(item_path=self.remote_path)):
+                    self._analyze_remote_page([i for i in page if i.name in all_local_items], all_local_items,
+                                              all_records)
+            except (IOError, OSError, errors.OneDriveError) as e:
+                self.logger.error('Error occurred when listing "%s" again: %s.', self.remote_path, e)
+                return
         for local_item_name in all_local_items:
-            self._analyze_local_item(local_item_name)
+            self._analyze_local_item(local_item_name, all_records.get(local_item_name))
+
+    def _analyze_remote_page(self, page, all_local_items, all_records):
+        """
+        :param [onedrived.api.items.OneDriveItem] page: Remote items to analyze.
+        :param set[str] all_local_items: All remaining untouched local items. Names of the remote items are removed.
+        :param dict[str, onedrived.store.items_db.ItemRecord] all_records: Records of the directory by item name.
+        """
+        # Records are written through group commit rather than a batch, as analysis hashes and moves files.
+        for remote_item in page:
+            all_local_items.discard(remote_item.name)  # Remove remote item from untouched list.
+            if not self.path_filter.should_ignore(self.rel_path + '/' + remote_item.name, remote_item.is_folder) \
+                    and not self.task_pool.has_pending_task(self.local_path + '/' + remote_item.name):
+                self._analyze_remote_item(remote_item, all_local_items, all_records.get(remote_item.name))
 
     def _list_local_items(self):
         """
-        List all names under the task working directory.
+        List all names under the task working directory. The entries are kept for the rest of the merge, so that
+        each is statted at most once.
         :return [str]: A list of entry names.
         """
         ent_list = set()
         ent_count = {}
-        for ent in os.listdir(self.local_path):
+        self._local_dir = LocalDir(self.local_path)
+        for ent in self._local_dir.list():
             ent_path = self.local_path + '/' + ent
-            is_dir = os.path.isdir(ent_path)
+            is_dir = is_dir_entry(self._local_dir.get(ent))
             filename, ext = os.path.splitext(ent)
             if self.path_filter.should_ignore(self.rel_path + '/' + ent, is_dir) or ext == '.!od':
                 continue
@@ -77,8 +179,10 @@ class MergeDirTask(TaskBase):
             if ent_lower in ent_count:
                 ent_count[ent_lower] += 1
                 try:
-                    ent = filename + ' ' + str(ent_count[ent_lower]) + ' (case conflict)' + ext
-                    os.rename(ent_path, self.local_path + '/' + ent)
+                    new_ent = filename + ' ' + str(ent_count[ent_lower]) + ' (case conflict)' + ext
+                    os.rename(ent_path, self.local_path + '/' + new_ent)
+                    self._local_dir.renamed(ent, new_ent)
+                    ent = new_ent
                     ent_count[ent.lower()] = 0
                 except (IOError, OSError) as e:
                     self.logger.error('An error occurred when solving name conflict on "%s": %s.',
@@ -89,24 +193,27 @@ class MergeDirTask(TaskBase):
             ent_list.add(ent)
         return ent_list
 
-    def _analyze_remote_item(self, remote_item, all_local_items):
+    def _analyze_remote_item(self, remote_item, all_local_items, item_record):
         """
         Analyze what to do with a remote item. Assume that this item passes ignore list.
         This function is the core algorithm and probably the ugliest code I've written so far.
         :param onedrived.api.items.OneDriveItem remote_item: The remote item object.
         :param [str] all_local_items: All remaining untouched local items.
+        :param onedrived.store.items_db.ItemRecord | None item_record: Database record on the same path, if any.
         """
         item_local_path = self.local_path + '/' + remote_item.name
-        q = self.items_store.get_items_by_id(parent_path=self.remote_path, item_name=remote_item.name)
-        exists = os.path.exists(item_local_path)
-        has_record = len(q) > 0
+        # One lookup serves all the checks below, e.g., a file is statted once for existence, type, size and mtime.
+        ent = self._local_dir.get(remote_item.name)
+        is_dir = is_dir_entry(ent)
+        st = None if is_dir else stat_entry(ent)
+        exists = is_dir or st is not None
+        has_record = item_record is not None
         if not has_record and not exists:
             # There is no record in database. The item is not present. Probably a new file.
             self._create_download_task(item_local_path, remote_item)
         elif has_record and not exists:
             # There is record but the file is gone.
-            item_id, item_record = _unpack_first_item(q)
-            if item_id == remote_item.id and remote_item.c_tag == item_record.c_tag \
+            if item_record.item_id == remote_item.id and remote_item.c_tag == item_record.c_tag \
                     and remote_item.e_tag == item_record.e_tag:
                 # Same record. The file is probably deleted when daemon is off.
                 self._create_delete_item_task(item_local_path, remote_item)
@@ -117,15 +224,13 @@ class MergeDirTask(TaskBase):
         else:
             # The entry exists locally.
             # First solve possible type conflict.
-            is_dir = os.path.isdir(item_local_path)
             if is_dir != remote_item.is_folder:
                 self.logger.info('Type conflict on path "%s". One side is file and the other is dir.', item_local_path)
-                self._move_existing_and_download(item_local_path, remote_item, all_local_items, q)
+                self._move_existing_and_download(item_local_path, remote_item, all_local_items, item_record)
             elif is_dir:
                 # Both sides are directories. Just update the record and sync if needed.
                 if has_record:
-                    item_id, item_record = _unpack_first_item(q)
-                    has_record = item_id == remote_item.id
+                    has_record = item_record.item_id == remote_item.id
                 if not has_record:
                     self.logger.info('Fix database record for directory "%s".', item_local_path)
                     self.items_store.update_item(remote_item, ItemRecordStatuses.OK)
@@ -133,14 +238,13 @@ class MergeDirTask(TaskBase):
                     self.logger.debug('Directory "%s" has intact record.', item_local_path)
             else:
                 # Both sides are files. Examine file attributes.
-                file_size, file_mtime = stat_file(item_local_path)
+                file_size, file_mtime = st.st_size, st.st_mtime
                 if file_size == remote_item.size \
                         and compare_timestamps(file_mtime, datetime_to_timestamp(remote_item.modified_time)) == 0:
                     # Same file name. Same size. Same mtime. Guess they are the same for laziness.
                     # Just update the record.
                     need_update = not has_record
                     if has_record:
-                        item_id, item_record = _unpack_first_item(q)
                         need_update = item_record.c_tag != remote_item.c_tag or item_record.e_tag != remote_item.e_tag
                     if need_update:
                         self.logger.info('Fix database record for file "%s" based on file size and mtime.',
@@ -150,8 +254,7 @@ class MergeDirTask(TaskBase):
                         self.logger.debug('File "%s" seems fine.', item_local_path)
                 else:
                     if has_record:
-                        item_id, item_record = _unpack_first_item(q)
-                        if item_id == remote_item.id and item_record.c_tag == remote_item.c_tag \
+                        if item_record.item_id == remote_item.id and item_record.c_tag == remote_item.c_tag \
                                 or item_record.e_tag == remote_item.e_tag:
                             # The remote item did not change since last update, but LOCAL file changed since then.
                             self.logger.info('File "%s" changed locally since last sync. Upload.', item_local_path)
@@ -165,28 +268,31 @@ class MergeDirTask(TaskBase):
                             # Three ends mismatch. Keep both.
                             self.logger.info('Cannot determine file "%s". All information differ. Keep both.',
                                              item_local_path)
-                            self._move_existing_and_download(item_local_path, remote_item, all_local_items, q)
+                            self._move_existing_and_download(item_local_path, remote_item, all_local_items,
+                                                             item_record)
                     else:
                         # Examine file hash.
-                        if _have_equal_hash(item_local_path, remote_item):
+                        if _have_equal_hash(self.items_store, item_local_path, remote_item, st):
                             # Same hash means that they are the same file. Update local timestamp and database record.
                             self._update_attr_when_hash_equal(item_local_path, remote_item)
                         else:
                             self.logger.info('Cannot determine file "%s". Rename and keep both.', item_local_path)
-                            self._move_existing_and_download(item_local_path, remote_item, all_local_items, q)
+                            self._move_existing_and_download(item_local_path, remote_item, all_local_items,
+                                                             item_record)
 
-    def _move_existing_and_download(self, item_local_path, remote_item, all_local_items, q):
+    def _move_existing_and_download(self, item_local_path, remote_item, all_local_items, item_record):
         """
         Rename existing file and download the remote item there.
         :param str item_local_path:
         :param onedrived.api.items.OneDriveItem remote_item:
         :param [str] all_local_items:
-        :param dict[str, onedrived.api.items.OneDriveItem] q:
+        :param onedrived.store.items_db.ItemRecord | None item_record:
         """
         try:
-            resolved_name = append_hostname(item_local_path)
+            resolved_name = os.path.basename(append_hostname(item_local_path))
+            self._local_dir.renamed(remote_item.name, resolved_name)
             all_local_items.add(resolved_name)
-            if len(q) > 0:
+            if item_record is not None:
                 self.items_store.delete_item(parent_path=self.remote_path, item_name=remote_item.name)
             self._create_download_task(item_local_path, remote_item)
         except (IOError, OSError) as e:
@@ -230,18 +336,17 @@ class MergeDirTask(TaskBase):
                 self.logger.info('Will download file "%s".', item_local_path)
                 self.task_pool.add_task(DownloadFileTask(self, rel_parent_path=self.rel_path + '/', item=item))
 
-    def _analyze_local_item(self, local_item_name):
+    def _analyze_local_item(self, local_item_name, item_record):
         """
         Analyze what to do with a local item that isn't found remotely. Assume that the item passes ignore list.
         :param str local_item_name: Name of the local item.
+        :param onedrived.store.items_db.ItemRecord | None item_record: Database record on the same path, if any.
         """
-        q = self.items_store.get_items_by_id(item_name=local_item_name, parent_path=self.remote_path)
         p = self.local_path + '/' + local_item_name
-        is_dir = os.path.isdir(p)
-        if len(q) > 0:
+        is_dir = is_dir_entry(self._local_dir.get(local_item_name))
+        if item_record is not None:
             # The item was on the server before, but now seems gone.
-            item_id, item = _unpack_first_item(q)
-            if item.is_folder and is_dir:
+            if item_record.is_folder and is_dir:
                 # Type matched. Delete local entry.
                 self._send_path_to_trash(local_item_name, p)
             else:
@@ -256,6 +361,7 @@ class MergeDirTask(TaskBase):
     def _send_path_to_trash(self, local_item_name, local_path):
         try:
             send2trash(local_path)
+            self.items_store.evict_cached_hashes(local_path)
             self.items_store.delete_item(item_name=local_item_name, parent_path=self.remote_path)
             self.logger.debug('Delete untouched local item "%s" as it seems deleted remotely.', local_path)
         except (IOError, OSError) as e:
@@ -272,7 +378,13 @@ class MergeDirTask(TaskBase):
         if not self.task_pool.has_pending_task(self.local_path + '/' + name):
             t = MergeDirTask(self, self.rel_path + '/', name)
             t.item_obj = item_obj
-            self.task_pool.add_task(t)
+            if self.walk is not None:
+                added = self.walk.add_task(self.task_pool, t)
+            else:
+                added = self.task_pool.add_task(t)
+            if added:
+                # Have the subdirectory listed while the task waits in the pool, so the listing is ready for its merge.
+                TreeWalker.get_instance(self.drive).add(t.rel_path, t.remote_path)
 
     def _create_remote_dir(self, name):
         try:
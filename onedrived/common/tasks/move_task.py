@@ -1,21 +1,24 @@
 from onedrived.api import errors
 from onedrived.api import resources
 from onedrived.common.tasks import TaskBase
+from onedrived.common.tasks import up_task
 from onedrived.store.items_db import ItemRecordStatuses
 
 
 class MoveItemTask(TaskBase):
-    def __init__(self, parent_task, rel_parent_path, item_name, move_from_task):
+    def __init__(self, parent_task, rel_parent_path, item_name, move_from_task, upload_after=False):
         """
         :param TaskBase parent_task:
         :param str rel_parent_path:
         :param str item_name:
         :param onedrived.common.tasks.delete_task.DeleteItemTask move_from_task: The deletion task on the old path.
+        :param True | False upload_after: (Optional) Upload the file once it is moved, because it was also modified.
         """
         super().__init__(parent_task)
         self.rel_parent_path = rel_parent_path
         self.item_name = item_name
         self._old_remote_item_path = move_from_task.remote_path
+        self.upload_after = upload_after
 
     def handle(self):
         try:
@@ -23,5 +26,8 @@ class MoveItemTask(TaskBase):
             item = self.drive.update_item(item_path=self._old_remote_item_path, new_name=self.item_name,
                                           new_parent_reference=new_parent_reference)
             self.items_store.update_item(item, ItemRecordStatuses.OK)
+            if self.upload_after:
+                # Queued only now, since the pool takes one task per path and this task had the path until popped.
+                self.task_pool.add_task(up_task.UploadFileTask(self, self.rel_parent_path, self.item_name))
         except errors.OneDriveError as e:
             self.logger.error('API error moving "%s" to "%s": %s.', self._old_remote_item_path, self.remote_path, e)
@@ -1,9 +1,12 @@
+import json
 import os
 
 from onedrived.api import errors
 from onedrived.api import facets
+from onedrived.api import resources
 from onedrived.api.options import NameConflictBehavior
-from onedrived.common.dateparser import timestamp_to_datetime
+from onedrived.common import hasher
+from onedrived.common.dateparser import datetime_to_timestamp, timestamp_to_datetime
 from onedrived.common.tasks import TaskBase
 from onedrived.store.items_db import ItemRecordStatuses
 
@@ -15,6 +18,15 @@ class UpTaskBase(TaskBase):
         self.item_name = item_name
         self._conflict_behavior = conflict_behavior
 
+    def dump(self):
+        return self._dump_args(rel_parent_path=self.rel_parent_path, item_name=self.item_name,
+                               conflict_behavior=self._conflict_behavior)
+
+    @classmethod
+    def load(cls, parent_task, s):
+        data = json.loads(s)
+        return cls(parent_task, data['rel_parent_path'], data['item_name'], data['conflict_behavior'])
+
     def handle(self):
         raise NotImplementedError()
 
@@ -38,21 +50,66 @@ class CreateDirTask(UpTaskBase):
 
 
 class UploadFileTask(UpTaskBase):
+    IS_TRANSFER = True
+
     def __init__(self, parent_task, rel_parent_path, item_name, conflict_behavior=NameConflictBehavior.REPLACE):
         super().__init__(parent_task, rel_parent_path, item_name, conflict_behavior)
         self.should_hold = True
 
+    @property
+    def size_hint(self):
+        try:
+            return os.path.getsize(self.local_path)
+        except (IOError, OSError):
+            return 0
+
+    def _get_upload_session(self, size, mtime):
+        """
+        Find the upload session of an interrupted upload of the file. The session is only reused if the file has not
+        changed since it was created, as judged by its size and mtime.
+        :param int size: Current size of the file.
+        :param float mtime: Current modification time of the file.
+        :rtype: onedrived.api.resources.UploadSession | None
+        """
+        saved = self.items_store.get_upload_session(self.local_path)
+        if saved is None:
+            return None
+        upload_url, saved_size, saved_mtime, next_offset = saved
+        if saved_size == size and saved_mtime == mtime:
+            return resources.UploadSession.build(upload_url, next_offset)
+        self.logger.info('Abandoned upload session of "%s" because the file changed.', self.local_path)
+        self.items_store.delete_upload_session(self.local_path)
+        return None
+
     def handle(self):
         try:
             size = os.path.getsize(self.local_path)
+            mtime = os.path.getmtime(self.local_path)
+            session = self._get_upload_session(size, mtime)
+
+            def save_progress(current_session, next_offset):
+                self.items_store.update_upload_session(self.local_path, current_session.upload_url, size, mtime,
+                                                       next_offset)
+
+            stream_hasher = hasher.StreamHasher()
             with open(self.local_path, 'rb') as f:
                 item = self.drive.upload_file(
                         filename=self.item_name, data=f, size=size, parent_path=self.remote_parent_path,
-                        conflict_behavior=self._conflict_behavior)
-                modified_time = timestamp_to_datetime(os.path.getmtime(self.local_path))
-                fs_info = facets.FileSystemInfoFacet(modified_time=modified_time)
+                        conflict_behavior=self._conflict_behavior, session=session, on_progress=save_progress,
+                        stream_hasher=stream_hasher)
+            self.items_store.delete_upload_session(self.local_path)
+            if item is None:
+                # The server accepted the last fragment without returning the item, so look the item up.
+                item = self.drive.get_item(item_path=self.remote_path, list_children=False)
+            file_props = item.file_props
+            if stream_hasher.matches(file_props.hashes if file_props is not None else None) is False:
+                # Leave the item unrecorded so that the next merge compares the two sides again.
+                self.logger.error('Uploaded content of "%s" does not match hash values on server. The file may have '
+                                  'changed during upload.', self.local_path)
+            else:
+                fs_info = facets.FileSystemInfoFacet(modified_time=timestamp_to_datetime(mtime))
                 item = self.drive.update_item(item_id=item.id, new_file_system_info=fs_info)
-                self.items_store.update_item(item, ItemRecordStatuses.OK)
+                self.items_store.update_item(item, ItemRecordStatuses.OK, hashes=stream_hasher)
                 self.logger.info('Uploaded file "%s".', self.local_path)
         except (IOError, OSError) as e:
             self.logger.error('IO error when uploading "%s": %s.', self.local_path, e)
@@ -68,6 +125,16 @@ class UpdateMetadataTask(UpTaskBase):
             new_mtime = timestamp_to_datetime(new_mtime)
         self._new_mtime = new_mtime
 
+    def dump(self):
+        return self._dump_args(rel_parent_path=self.rel_parent_path, item_name=self.item_name,
+                               new_mtime=datetime_to_timestamp(self._new_mtime))
+
+    @classmethod
+    def load(cls, parent_task, s):
+        data = json.loads(s)
+        return cls(parent_task, data['rel_parent_path'], data['item_name'],
+                   timestamp_to_datetime(data['new_mtime']))
+
     def handle(self):
         try:
             fs_info = facets.FileSystemInfoFacet(modified_time=self._new_mtime)
@@ -1,6 +1,8 @@
 import os
+import stat
 
 from onedrived import OS_HOSTNAME
+from onedrived.common import hasher
 
 
 def append_hostname(path):
@@ -26,7 +28,130 @@ def stat_file(filepath):
     :param str filepath: Path of the file to stat.
     :rtype: (int, int)
     """
-    return os.path.getsize(filepath), os.path.getmtime(filepath)
+    st = os.stat(filepath)
+    return st.st_size, st.st_mtime
+
+
+class PathEntry:
+    """
+    Stands in for os.DirEntry for an entry of a directory that is not listed. The path is statted on first use, and
+    the result, or the error, is kept for later calls.
+    """
+
+    __slots__ = ('name', 'path', '_stat', '_error')
+
+    def __init__(self, path):
+        self.path = path
+        self.name = os.path.basename(path)
+        self._stat = None
+        self._error = None
+
+    def stat(self):
+        """
+        :rtype: os.stat_result
+        :raise OSError: If the path cannot be statted, e.g., it does not exist.
+        """
+        if self._stat is None and self._error is None:
+            try:
+                self._stat = os.stat(self.path)
+            except OSError as e:
+                self._error = e
+        if self._error is not None:
+            raise self._error
+        return self._stat
+
+    def is_dir(self):
+        return stat.S_ISDIR(self.stat().st_mode)
+
+
+def is_dir_entry(ent):
+    """
+    :param os.DirEntry | PathEntry | None ent:
+    :return True | False: Whether the entry is a directory, following symlinks, as os.path.isdir() tells.
+    """
+    try:
+        return ent is not None and ent.is_dir()
+    except OSError:
+        return False
+
+
+def stat_entry(ent):
+    """
+    :param os.DirEntry | PathEntry | None ent:
+    :return os.stat_result | None: Status of the entry, following symlinks. None if it does not exist or cannot be
+    statted, as in os.path.exists().
+    """
+    try:
+        return ent.stat() if ent is not None else None
+    except OSError:
+        return None
+
+
+class LocalDir:
+    """
+    The entries of a local directory, listed once with os.scandir() and looked up by name. os.DirEntry keeps the file
+    type from the listing and caches the result of stat(), so each entry takes at most one syscall however many
+    times it is examined. A directory that is not listed is looked up one path at a time, without caching. Where
+    os.scandir() is missing, the directory is listed with os.listdir() and each entry is statted once by path.
+    """
+
+    def __init__(self, path):
+        """
+        :param str path: Path to the directory.
+        """
+        self.path = path
+        self._entries = None
+
+    def list(self):
+        """
+        :return [str]: Names of all entries, in the order of the listing.
+        :raise OSError: If the directory cannot be listed.
+        """
+        if getattr(os, 'scandir', None) is None:
+            # Python before 3.5. Entries are statted by path when first examined.
+            self._entries = {name: PathEntry(self.path + '/' + name) for name in os.listdir(self.path)}
+        else:
+            # Iterators of os.scandir() are context managers only since Python 3.6. Exhausting one closes it.
+            self._entries = {ent.name: ent for ent in os.scandir(self.path)}
+        return list(self._entries.keys())
+
+    def get(self, name):
+        """
+        :param str name:
+        :return os.DirEntry | PathEntry | None: The entry, or None if the listing does not have it.
+        """
+        if self._entries is None:
+            return PathEntry(self.path + '/' + name)
+        return self._entries.get(name)
+
+    def renamed(self, name, new_name):
+        """
+        Record that an entry was renamed in the directory. The entry is statted again on the new path.
+        :param str name:
+        :param str new_name:
+        """
+        if self._entries is not None:
+            self._entries.pop(name, None)
+            self._entries[new_name] = PathEntry(self.path + '/' + new_name)
+
+
+def get_file_hashes(items_store, file_path, st=None):
+    """
+    Get the hash values of a local file, from the hash cache of the item storage if the file has not changed since it
+    was last hashed, or else by reading the file, whose values are then cached.
+    :param onedrived.store.items_db.ItemStorage items_store:
+    :param str file_path:
+    :param os.stat_result | None st: (Optional) Status of the file, if already known.
+    :return (str, str): CRC32 and SHA-1 values, in the format of HashFacet.
+    """
+    if st is None:
+        st = os.stat(file_path)
+    cached = items_store.get_cached_hashes(st)
+    if cached is not None:
+        return cached
+    values = hasher.get_file_values(file_path, st.st_size)
+    items_store.update_cached_hashes(file_path, st, values[hasher.CRC32], values[hasher.SHA1])
+    return values[hasher.CRC32], values[hasher.SHA1]
 
 
 def unpack_first_item(q):
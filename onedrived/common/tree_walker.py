@@ -0,0 +1,204 @@
+"""
+List remote directories ahead of the MergeDirTasks that merge them, so that walking a remote tree is not bound to one
+round trip per directory on whichever worker pops the task.
+"""
+
+import collections
+import threading
+import time
+
+from onedrived.api import items
+from onedrived.common import logger_factory
+from onedrived.common.metrics import MetricSet
+
+
+class _Listing:
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    READY = 'ready'
+
+    __slots__ = ('remote_path', 'state', 'pages', 'ready_time')
+
+    def __init__(self, remote_path):
+        self.remote_path = remote_path
+        self.state = self.QUEUED
+        # A generator of the pages of the listing, the first of which is already fetched. None if listing failed.
+        self.pages = None
+        self.ready_time = 0
+
+
+class TreeWalker:
+    """
+    Per-drive threads listing remote directories before their MergeDirTasks run. A MergeDirTask that queues the merge
+    of a subdirectory has the walker list it with add(), on threads of the walker rather than the task workers, which
+    may be busy with file transfers, and with at most drive.config.max_list_concurrency requests at the same time. The
+    merge takes the listing with take() when it runs, and lists the directory itself if the walker has not started
+    listing it. The walker never lists a directory whose merge is not queued.
+
+    Directories are listed in the order their merges are queued, which is the order the task pool pops them in. At most
+    MAX_READY listings are fetched ahead of their merges, and a fetched listing waits for its merge at most
+    READY_TTL_SEC, so that listings neither run far ahead of the merges nor grow stale. Threads exit after
+    IDLE_EXIT_SEC without anything to list.
+    """
+
+    # Maximum number of listings fetched or being fetched and not yet taken. Listing pauses when it is reached.
+    MAX_READY = 32
+
+    # A fetched listing not taken within this long is discarded, so that merges do not act on old listings. Merges
+    # still list a directory again before deleting local items missing from a listing taken from the walker.
+    READY_TTL_SEC = 5
+
+    # Maximum number of directories waiting to be listed. Directories added beyond it are listed by their merges.
+    MAX_QUEUED = 10000
+
+    # A listing thread exits after waiting this long for a directory to list.
+    IDLE_EXIT_SEC = 10
+
+    logger = logger_factory.get_logger('TreeWalker')
+
+    @classmethod
+    def get_instance(cls, drive):
+        """
+        :param onedrived.api.drives.DriveObject drive:
+        :return TreeWalker: The walker of the drive, created on first use.
+        """
+        with cls._instances_lock:
+            walker = cls._instances.get(drive)
+            if walker is None:
+                walker = cls._instances[drive] = TreeWalker(drive, drive.config.max_list_concurrency)
+            return walker
+
+    _instances = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, drive, concurrency):
+        """
+        :param onedrived.api.drives.DriveObject drive:
+        :param int concurrency: Maximum number of listing requests at the same time. 0 to disable listing ahead.
+        """
+        self.drive = drive
+        self.concurrency = concurrency
+        self._cond = threading.Condition()
+        # Paths relative to drive root of directories to list, first added first.
+        self._queue = collections.deque()
+        # Relative path -> _Listing of every directory queued, being listed, or listed and not taken.
+        self._listings = {}
+        # Relative path -> _Listing of listings fetched and not taken, ordered by when they were fetched.
+        self._ready = collections.OrderedDict()
+        self._running = 0
+        self._num_threads = 0
+        self.metrics = MetricSet()
+
+    def add(self, rel_path, remote_path):
+        """
+        Queue a directory to be listed ahead of its merge. Call it once the MergeDirTask of the directory is queued.
+        :param str rel_path: Path of the directory relative to drive root, in the form of TaskBase.rel_path.
+        :param str remote_path: Remote path of the directory, as MergeDirTask.remote_path.
+        """
+        if self.concurrency <= 0:
+            return
+        with self._cond:
+            if rel_path in self._listings or len(self._queue) >= self.MAX_QUEUED:
+                return
+            self._listings[rel_path] = _Listing(remote_path)
+            self._queue.append(rel_path)
+            self._cond.notify()
+            if self._num_threads < min(self.concurrency, len(self._queue) + self._running):
+                t = threading.Thread(target=self._run, name='list-%d' % self._num_threads, daemon=True)
+                self._num_threads += 1
+                t.start()
+
+    def take(self, rel_path):
+        """
+        Take the listing of a directory, waiting for it if it is being fetched.
+        :param str rel_path: Path of the directory relative to drive root, in the form of TaskBase.rel_path.
+        :return: A generator of the pages of the listing, each a list of OneDriveItems, or None if the walker does not
+        have the listing, in which case the caller lists the directory itself.
+        """
+        with self._cond:
+            listing = self._listings.get(rel_path)
+            if listing is not None and listing.state == _Listing.RUNNING:
+                self.metrics.counter('waits').add()
+                while listing.state == _Listing.RUNNING:
+                    self._cond.wait()
+            self._evict_expired(time.monotonic())
+            # A queued listing is dropped, so the directory is not listed twice.
+            listing = self._listings.pop(rel_path, None)
+            self._ready.pop(rel_path, None)
+            self._cond.notify()
+        if listing is None or listing.pages is None:
+            self.metrics.counter('misses').add()
+            return None
+        self.metrics.counter('hits').add()
+        return listing.pages
+
+    def _evict_expired(self, now):
+        while len(self._ready) > 0:
+            rel_path, listing = next(iter(self._ready.items()))
+            if listing.ready_time + self.READY_TTL_SEC > now:
+                break
+            del self._ready[rel_path]
+            del self._listings[rel_path]
+            self.metrics.counter('expired').add()
+
+    def _next_listing(self):
+        """
+        :return (str, _Listing) | None: The next directory to list, once there is one and room for its listing. None
+        if there has been nothing to list for IDLE_EXIT_SEC, in which case the calling thread is to exit.
+        """
+        with self._cond:
+            idle_deadline = time.monotonic() + self.IDLE_EXIT_SEC
+            while True:
+                now = time.monotonic()
+                self._evict_expired(now)
+                if len(self._queue) > 0 and self._running + len(self._ready) < self.MAX_READY:
+                    rel_path = self._queue.popleft()
+                    listing = self._listings.get(rel_path)
+                    if listing is None or listing.state != _Listing.QUEUED:
+                        # Taken by its merge before it was listed.
+                        continue
+                    listing.state = _Listing.RUNNING
+                    self._running += 1
+                    return rel_path, listing
+                if len(self._queue) == 0:
+                    if now >= idle_deadline:
+                        self._num_threads -= 1
+                        return None
+                    timeout = idle_deadline - now
+                else:
+                    idle_deadline = now + self.IDLE_EXIT_SEC
+                    timeout = None
+                # Wake up in time to evict the oldest listing, which may make room.
+                if len(self._ready) > 0:
+                    oldest = next(iter(self._ready.values()))
+                    ttl = max(0, oldest.ready_time + self.READY_TTL_SEC - now)
+                    timeout = ttl if timeout is None else min(timeout, ttl)
+                self._cond.wait(timeout)
+
+    def _run(self):
+        while True:
+            job = self._next_listing()
+            if job is None:
+                return
+            rel_path, listing = job
+            start = time.monotonic()
+            try:
+                collection = self.drive.get_children(item_path=listing.remote_path)
+                page = collection.get_next()
+                listing.pages = _prepend(page, items.iter_pages(collection, self.drive.config.list_prefetch_pages))
+                self.metrics.timer('list').record(time.monotonic() - start)
+            except Exception as e:
+                # The merge of the directory lists it again and handles the error.
+                self.logger.debug('Failed to list "%s" ahead: %s.', listing.remote_path, e)
+            with self._cond:
+                self._running -= 1
+                listing.state = _Listing.READY
+                listing.ready_time = time.monotonic()
+                if self._listings.get(rel_path) is listing:
+                    self._ready[rel_path] = listing
+                self._cond.notify_all()
+
+
+def _prepend(page, pages):
+    yield page
+    yield from pages
@@ -12,6 +12,8 @@ class UserConfig:
         'num_consumers': 4,
         'deep_sync_interval_seconds': 300,
         'http_retry_after_seconds': 30,
+        'use_task_journal': True,
+        'use_poll_snapshot': True,
         'default_drive_config': DriveConfig.default_config(),
         'proxies': dict()
     }
@@ -27,6 +29,8 @@ class UserConfig:
         self.num_consumers = data['num_consumers']
         self.deep_sync_interval_seconds = data['deep_sync_interval_seconds']
         self.http_retry_after_seconds = data['http_retry_after_seconds']
+        self.use_task_journal = data['use_task_journal']
+        self.use_poll_snapshot = data['use_poll_snapshot']
         self.default_drive_config = data['default_drive_config']
         self.proxies = data['proxies']
 
@@ -41,6 +45,8 @@ class UserConfig:
             'num_consumers': self.num_consumers,
             'deep_sync_interval_seconds': self.deep_sync_interval_seconds,
             'http_retry_after_seconds': self.http_retry_after_seconds,
+            'use_task_journal': self.use_task_journal,
+            'use_poll_snapshot': self.use_poll_snapshot,
             'default_drive_config': self.default_drive_config.dump(exact_dump=True),
             'proxies': self.proxies
         }
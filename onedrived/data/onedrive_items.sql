@@ -12,4 +12,8 @@ CREATE TABLE IF NOT EXISTS items (
   status        TEXT,
   crc32_hash    TEXT,
   sha1_hash     TEXT
-);
\ No newline at end of file
+);
+CREATE TABLE IF NOT EXISTS drive_state (
+  key   TEXT UNIQUE PRIMARY KEY ON CONFLICT REPLACE,
+  value TEXT
+);
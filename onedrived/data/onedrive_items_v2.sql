@@ -0,0 +1,4 @@
+CREATE INDEX IF NOT EXISTS items_by_parent_path ON items (parent_path, item_name);
+CREATE INDEX IF NOT EXISTS items_by_parent_id ON items (parent_id);
+CREATE INDEX IF NOT EXISTS items_by_crc32_hash ON items (crc32_hash);
+CREATE INDEX IF NOT EXISTS items_by_sha1_hash ON items (sha1_hash);
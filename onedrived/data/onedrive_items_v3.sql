@@ -0,0 +1,6 @@
+CREATE TABLE IF NOT EXISTS partial_downloads (
+  item_id    TEXT UNIQUE PRIMARY KEY ON CONFLICT REPLACE,
+  etag       TEXT,
+  size       INT,
+  done_bytes INT
+);
@@ -0,0 +1,7 @@
+CREATE TABLE IF NOT EXISTS upload_sessions (
+  local_path  TEXT UNIQUE PRIMARY KEY ON CONFLICT REPLACE,
+  upload_url  TEXT,
+  size        INT,
+  mtime       REAL,
+  next_offset INT
+);
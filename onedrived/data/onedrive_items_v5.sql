@@ -0,0 +1,12 @@
+CREATE TABLE IF NOT EXISTS hash_cache (
+  device            INT,
+  inode             INT,
+  size              INT,
+  mtime_ns          INT,
+  local_parent_path TEXT,
+  item_name         TEXT,
+  crc32_hash        TEXT,
+  sha1_hash         TEXT,
+  PRIMARY KEY (device, inode) ON CONFLICT REPLACE
+);
+CREATE INDEX IF NOT EXISTS hash_cache_by_local_path ON hash_cache (local_parent_path, item_name);
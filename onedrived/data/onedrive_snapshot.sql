@@ -0,0 +1,5 @@
+CREATE TABLE IF NOT EXISTS dirs (
+  path     TEXT PRIMARY KEY,
+  mtime_ns INTEGER NOT NULL,
+  entries  TEXT    NOT NULL
+);
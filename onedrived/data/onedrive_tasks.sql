@@ -0,0 +1,6 @@
+CREATE TABLE IF NOT EXISTS tasks (
+  task_id   INTEGER PRIMARY KEY AUTOINCREMENT,
+  drive_id  TEXT NOT NULL,
+  task_type TEXT NOT NULL,
+  task_dump TEXT NOT NULL
+);
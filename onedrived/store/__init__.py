@@ -1 +1 @@
-__all__ = ['account_db', 'items_db', 'userconf_db']
+__all__ = ['account_db', 'items_db', 'schema', 'snapshot_db', 'task_journal', 'userconf_db', 'write_batch']
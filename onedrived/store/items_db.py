@@ -1,17 +1,37 @@
 import atexit
+import os
 import sqlite3
+import threading
+import time
+from contextlib import contextmanager
 
-from onedrived import get_content
 from onedrived.common import logger_factory
+from onedrived.common.metrics import MetricSet
 from onedrived.common.dateparser import datetime_to_str, str_to_datetime
+from onedrived.store import schema
+from onedrived.store.write_batch import WriteBatcher
 from onedrived.vendor.rwlock import ReadWriteLock
 
+# Scripts to upgrade the schema of item databases, oldest first. See onedrived.store.schema.
+SCHEMA_SCRIPTS = ['onedrive_items.sql', 'onedrive_items_v2.sql', 'onedrive_items_v3.sql',
+                  'onedrive_items_v4.sql', 'onedrive_items_v5.sql']
+
 
 def create_item_db_name(drive):
     account = drive.root.account
     return account.profile.user_id + '_' + account.TYPE + '_' + drive.drive_id + '.db'
 
 
+def get_descendant_range(path):
+    """
+    Paths of all descendants of a directory fall in a half-open string range, which, unlike a LIKE pattern, can be
+    answered by the parent_path index and is not confused by wildcard characters in names.
+    :param str path: Path reference of the directory.
+    :return (str, str): Lower (inclusive) and upper (exclusive) bound of descendant paths.
+    """
+    return path + '/', path + chr(ord('/') + 1)
+
+
 class ItemRecordStatuses:
     OK = 'OK'
     DOWNLOADED = 'DOWNLOADED'
@@ -20,13 +40,36 @@ class ItemRecordStatuses:
 
 
 class ItemRecord:
+    FOLDER_TYPE = 'folder'
+
     def __init__(self, row):
         self.item_id, self.type, self.item_name, self.parent_id, self.parent_path, self.e_tag, self.c_tag, self.size, \
-        self.created_time, self.modified_time, self.status, self.crc32_hash, self.sha1_hash = row
-        self.created_time = str_to_datetime(self.created_time)
-        self.modified_time = str_to_datetime(self.modified_time)
+        self._created_time, self._modified_time, self.status, self.crc32_hash, self.sha1_hash = row
         self.local_path = self.parent_path.split(':', 1)[1] + '/' + self.item_name
 
+    # Timestamps are parsed on first access because most records loaded in bulk are never asked for them.
+    @property
+    def created_time(self):
+        """
+        :rtype: datetime.datetime
+        """
+        if isinstance(self._created_time, str):
+            self._created_time = str_to_datetime(self._created_time)
+        return self._created_time
+
+    @property
+    def modified_time(self):
+        """
+        :rtype: datetime.datetime
+        """
+        if isinstance(self._modified_time, str):
+            self._modified_time = str_to_datetime(self._modified_time)
+        return self._modified_time
+
+    @property
+    def is_folder(self):
+        return self.type == self.FOLDER_TYPE
+
 
 class ItemStorageManager:
     def __init__(self, item_storage_dir):
@@ -50,8 +93,26 @@ class ItemStorageManager:
 class ItemStorage:
     """
     Local storage for items under ONE drive.
+
+    All writes go through one shared connection guarded by the write lock. A database file is opened in WAL mode so
+    that reads go through connections of their own without taking the lock, and never wait behind writers. Read
+    connections are borrowed from a pool for one query each, and at most MAX_IDLE_READ_CONNS of them are kept open
+    between queries, so threads that come and go do not leave connections behind. Reads of a thread that has
+    uncommitted writes go to the shared connection so that the thread sees its own writes.
+    In-memory databases cannot be shared by connections, so all their reads use the shared connection.
+
+    Lock wait and query time of every operation are recorded in `metrics` as "<operation>.lock_wait" and
+    "<operation>.query".
     """
 
+    DELTA_TOKEN_KEY = 'delta_token'
+
+    # Key of the token held back until a merge from drive root finishes.
+    PENDING_DELTA_TOKEN_KEY = 'pending_delta_token'
+
+    # Maximum number of read connections kept open while no query uses them.
+    MAX_IDLE_READ_CONNS = 4
+
     logger = logger_factory.get_logger('ItemStorage')
 
     def __init__(self, db_path, drive):
@@ -62,17 +123,128 @@ class ItemStorage:
         if not hasattr(drive, 'storage_lock'):
             drive.storage_lock = ReadWriteLock()
         self.lock = drive.storage_lock
+        self.db_path = db_path
         self._conn = sqlite3.connect(db_path, isolation_level=None, check_same_thread=False)
         self.drive = drive
         self._cursor = self._conn.cursor()
-        self._cursor.execute(get_content('onedrive_items.sql'))
-        self._conn.commit()
+        schema.upgrade(self._conn, SCHEMA_SCRIPTS)
+        self._use_read_conns = db_path != ':memory:' and self._enable_wal()
+        self._read_conns_lock = threading.Lock()
+        # Read connections not used by any query. None once the storage is closed.
+        self._idle_read_conns = []
+        self._batcher = WriteBatcher(self._conn, self.lock)
+        self.metrics = MetricSet()
         atexit.register(self.close)
 
+    def _enable_wal(self):
+        """
+        :return True | False: True if the database is now in WAL mode.
+        """
+        mode = self._conn.execute('PRAGMA journal_mode = WAL').fetchone()[0]
+        if mode.lower() != 'wal':
+            self.logger.warning('Cannot enable WAL mode for "%s" (mode: %s). Reads will share one connection.',
+                                self.db_path, mode)
+            return False
+        return True
+
     def close(self):
+        self._batcher.flush()
+        with self._read_conns_lock:
+            idle_read_conns, self._idle_read_conns = self._idle_read_conns, None
+        for conn in idle_read_conns or ():
+            conn.close()
         self._cursor.close()
         self._conn.close()
 
+    def _get_read_conn(self):
+        """
+        :return sqlite3.Connection: The connection the current thread should read from. A connection other than the
+        shared one is borrowed for one query, and is given back with _put_read_conn().
+        """
+        if not self._use_read_conns or self._batcher.in_batch() or self._batcher.has_pending_writes():
+            return self._conn
+        with self._read_conns_lock:
+            if self._idle_read_conns:
+                return self._idle_read_conns.pop()
+        conn = sqlite3.connect(self.db_path, isolation_level=None, check_same_thread=False)
+        conn.execute('PRAGMA query_only = ON')
+        return conn
+
+    def _put_read_conn(self, conn):
+        """
+        Give back a connection borrowed with _get_read_conn(). It is closed if enough connections are idle already.
+        :param sqlite3.Connection conn:
+        """
+        with self._read_conns_lock:
+            if self._idle_read_conns is not None and len(self._idle_read_conns) < self.MAX_IDLE_READ_CONNS:
+                self._idle_read_conns.append(conn)
+                return
+        conn.close()
+
+    def _record_timing(self, op, lock_wait_sec, query_sec):
+        self.metrics.timer(op + '.lock_wait').record(lock_wait_sec)
+        self.metrics.timer(op + '.query').record(query_sec)
+
+    def _query(self, op, sql, args=()):
+        """
+        Run a read query and fetch all rows.
+        :param str op: Name of the operation, used in metrics.
+        :param str sql:
+        :param tuple args:
+        :rtype: list[tuple]
+        """
+        conn = self._get_read_conn()
+        start = time.perf_counter()
+        if conn is not self._conn:
+            acquired = start
+            try:
+                rows = conn.execute(sql, args).fetchall()
+            finally:
+                self._put_read_conn(conn)
+        elif self._batcher.in_batch():
+            # The thread holds the write lock for its batch.
+            acquired = start
+            rows = conn.execute(sql, args).fetchall()
+        else:
+            self.lock.acquire_read()
+            acquired = time.perf_counter()
+            try:
+                rows = conn.execute(sql, args).fetchall()
+            finally:
+                self.lock.release_read()
+        self._record_timing(op, acquired - start, time.perf_counter() - acquired)
+        return rows
+
+    @contextmanager
+    def _writing(self, op):
+        """
+        Hold the write lock for the block.
+        :param str op: Name of the operation, used in metrics.
+        """
+        start = time.perf_counter()
+        with self._batcher.locked():
+            acquired = time.perf_counter()
+            try:
+                yield self._batcher
+            finally:
+                self._record_timing(op, acquired - start, time.perf_counter() - acquired)
+
+    def batch(self):
+        """
+        Write records in one transaction which is committed when the block exits, or rolled back if it raises. The
+        block holds the write lock, so keep file system and network work out of it. Writes outside any batch are
+        committed in groups within WriteBatcher.COMMIT_INTERVAL_SEC.
+            with items_store.batch():
+                items_store.update_item(...)
+        """
+        return self._batcher.batch()
+
+    def flush(self):
+        """
+        Commit all pending writes. Returns once they are durable.
+        """
+        self._batcher.flush()
+
     def local_path_to_remote_path(self, path):
         return path.replace(self.drive.config.local_root, self.drive.drive_path + '/root:', 1)
 
@@ -90,6 +262,27 @@ class ItemStorage:
         args = {'item_id': item_id, 'parent_path': parent_path, 'item_name': item_name}
         return self.get_items(args)
 
+    def get_items_by_parent(self, parent_path=None, local_parent_path=None):
+        """
+        Load the records of all items under one parent directory with a single query.
+        :param str parent_path: Path reference of the parent directory. A trailing '/' is ignored.
+        :param str local_parent_path: Local path to the parent directory. Used if parent_path is None.
+        :return dict[str, onedrived.store.items_db.ItemRecord]: All records under the directory indexed by item name.
+        """
+        if local_parent_path is not None:
+            parent_path = self.local_path_to_remote_path(local_parent_path)
+        if parent_path.endswith('/'):
+            parent_path = parent_path[:-1]
+        ret = {}
+        rows = self._query('get_items_by_parent',
+                           'SELECT item_id, type, item_name, parent_id, parent_path, etag, ctag, size, '
+                           'created_time, modified_time, status, crc32_hash, sha1_hash FROM items '
+                           'WHERE parent_path=?', (parent_path,))
+        for row in rows:
+            item = ItemRecord(row)
+            ret[item.item_name] = item
+        return ret
+
     def get_items_by_hash(self, crc32_hash=None, sha1_hash=None):
         """
         Find all qualified records from database whose hash values match either parameter.
@@ -125,25 +318,29 @@ class ItemStorage:
         """
         where, values = self._get_where_clause(args, relation)
         ret = {}
-        self.lock.acquire_read()
-        q = self._conn.execute('SELECT item_id, type, item_name, parent_id, parent_path, etag, ctag, size, '
-                               'created_time, modified_time, status, crc32_hash, sha1_hash FROM items WHERE ' +
-                               where, values)
-        for row in q.fetchall():
+        rows = self._query('get_items',
+                           'SELECT item_id, type, item_name, parent_id, parent_path, etag, ctag, size, '
+                           'created_time, modified_time, status, crc32_hash, sha1_hash FROM items WHERE ' +
+                           where, values)
+        for row in rows:
             item = ItemRecord(row)
             ret[item.item_id] = item
-        self.lock.release_read()
         return ret
 
-    def update_item(self, item, status=ItemRecordStatuses.OK, parent_path=None):
+    def update_item(self, item, status=ItemRecordStatuses.OK, parent_path=None, hashes=None):
         """
         :param onedrived.api.items.OneDriveItem item:
         :param str status: One value of enum ItemRecordStatuses.
         :param str parent_path: If item does not have a parent reference, fallback to this path.
+        :param onedrived.common.hasher.StreamHasher | None hashes: (Optional) Hash values of the content computed
+        locally, e.g., while transferring it. Recorded instead of those the server reports, which may be missing.
         """
         if item.is_folder:
             crc32_hash = None
             sha1_hash = None
+        elif hashes is not None:
+            crc32_hash = hashes.crc32_hex
+            sha1_hash = hashes.sha1
         else:
             file_facet = item.file_props
             crc32_hash = file_facet.hashes.crc32
@@ -155,15 +352,13 @@ class ItemStorage:
             pass
         created_time_str = datetime_to_str(item.created_time)
         modified_time_str = datetime_to_str(item.modified_time)
-        self.lock.acquire_write()
-        self._cursor.execute(
-                'INSERT OR REPLACE INTO items (item_id, type, item_name, parent_id, parent_path, etag, '
-                'ctag, size, created_time, modified_time, status, crc32_hash, sha1_hash)'
-                ' VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
-                (item.id, item.type, item.name, parent_ref.id, parent_path, item.e_tag, item.c_tag,
-                 item.size, created_time_str, modified_time_str, status, crc32_hash, sha1_hash))
-        self._conn.commit()
-        self.lock.release_write()
+        with self._writing('update_item') as batcher:
+            batcher.execute(
+                    'INSERT OR REPLACE INTO items (item_id, type, item_name, parent_id, parent_path, etag, '
+                    'ctag, size, created_time, modified_time, status, crc32_hash, sha1_hash)'
+                    ' VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                    (item.id, item.type, item.name, parent_ref.id, parent_path, item.e_tag, item.c_tag,
+                     item.size, created_time_str, modified_time_str, status, crc32_hash, sha1_hash))
 
     def delete_item(self, item_id=None, parent_path=None, item_name=None, local_parent_path=None, is_folder=False):
         """
@@ -177,20 +372,20 @@ class ItemStorage:
         if local_parent_path is not None:
             parent_path = self.local_path_to_remote_path(local_parent_path)
         where, values = self._get_where_clause({'item_id': item_id, 'parent_path': parent_path, 'item_name': item_name})
-        self.lock.acquire_write()
-        if is_folder:
-            # Translate ID reference to path and name reference.
-            q = self._cursor.execute('SELECT item_id, parent_path, item_name FROM items WHERE ' + where, values)
-            row = q.fetchone()
-            if row is None:
-                self.logger.warning('The folder to delete does not exist: %s, %s', where, str(values))
-            else:
-                item_id, parent_path, item_name = row
-                self._cursor.execute('DELETE FROM items WHERE parent_id=? OR parent_path LIKE ?',
-                                     (item_id, parent_path + '/' + item_name + '/%'))
-        self._cursor.execute('DELETE FROM items WHERE ' + where, values)
-        self._conn.commit()
-        self.lock.release_write()
+        with self._writing('delete_item') as batcher:
+            if is_folder:
+                # Translate ID reference to path and name reference.
+                q = self._cursor.execute('SELECT item_id, parent_path, item_name FROM items WHERE ' + where, values)
+                row = q.fetchone()
+                if row is None:
+                    self.logger.warning('The folder to delete does not exist: %s, %s', where, str(values))
+                else:
+                    item_id, parent_path, item_name = row
+                    path = parent_path + '/' + item_name
+                    batcher.execute('DELETE FROM items WHERE parent_id=? OR parent_path=? OR '
+                                    '(parent_path>=? AND parent_path<?)',
+                                    (item_id, path) + get_descendant_range(path))
+            batcher.execute('DELETE FROM items WHERE ' + where, values)
 
     def update_status(self, status, item_id=None, parent_path=None, item_name=None, local_parent_path=None):
         """
@@ -205,7 +400,155 @@ class ItemStorage:
             parent_path = self.local_path_to_remote_path(local_parent_path)
         where, values = self._get_where_clause({'item_id': item_id, 'parent_path': parent_path, 'item_name': item_name})
         values = (status,) + values
-        self.lock.acquire_write()
-        self._cursor.execute('UPDATE items SET status=? WHERE ' + where, values)
-        self._conn.commit()
-        self.lock.release_write()
+        with self._writing('update_status') as batcher:
+            batcher.execute('UPDATE items SET status=? WHERE ' + where, values)
+
+    def move_item(self, item, old_parent_path, old_item_name, status=ItemRecordStatuses.OK):
+        """
+        Update the record of an item that was moved or renamed. If the item is a directory, also rewrite the parent
+        path of all its children items.
+        :param onedrived.api.items.OneDriveItem item: The item at its new location.
+        :param str old_parent_path: Path reference of the item's parent before the move.
+        :param str old_item_name: Name of the item before the move.
+        :param str status: One value of enum ItemRecordStatuses.
+        """
+        with self.batch():
+            self.update_item(item, status)
+            if not item.is_folder:
+                return
+            old_path = old_parent_path + '/' + old_item_name
+            new_path = item.parent_reference.path + '/' + item.name
+            with self._writing('move_item') as batcher:
+                batcher.execute('UPDATE items SET parent_path=? || substr(parent_path, ?) '
+                                'WHERE parent_path=? OR (parent_path>=? AND parent_path<?)',
+                                (new_path, len(old_path) + 1, old_path) + get_descendant_range(old_path))
+
+    def get_delta_token(self, pending=False):
+        """
+        :param True | False pending: (Optional) Get the token held back for a merge from root instead.
+        :return str | None: The delta token saved by the last change enumeration on the drive, or None.
+        """
+        key = self.PENDING_DELTA_TOKEN_KEY if pending else self.DELTA_TOKEN_KEY
+        rows = self._query('get_delta_token', 'SELECT value FROM drive_state WHERE key=?', (key,))
+        return rows[0][0] if len(rows) > 0 else None
+
+    def get_partial_download(self, item_id):
+        """
+        :param str item_id: ID of the item being downloaded.
+        :return (str, int, int) | None: eTag and size of the item when the download started, and the number of bytes
+        from the start of the file that were downloaded. None if there is no unfinished download of the item.
+        """
+        rows = self._query('get_partial_download', 'SELECT etag, size, done_bytes FROM partial_downloads '
+                                                   'WHERE item_id=?', (item_id,))
+        return rows[0] if len(rows) > 0 else None
+
+    def update_partial_download(self, item, done_bytes):
+        """
+        Save the progress of downloading an item.
+        :param onedrived.api.items.OneDriveItem item: The item being downloaded.
+        :param int done_bytes: Number of bytes from the start of the file that were downloaded.
+        """
+        with self._writing('update_partial_download') as batcher:
+            batcher.execute('INSERT OR REPLACE INTO partial_downloads (item_id, etag, size, done_bytes) '
+                            'VALUES (?, ?, ?, ?)', (item.id, item.e_tag, item.size, done_bytes))
+
+    def delete_partial_download(self, item_id):
+        """
+        :param str item_id: ID of the item whose download finished or was abandoned.
+        """
+        with self._writing('delete_partial_download') as batcher:
+            batcher.execute('DELETE FROM partial_downloads WHERE item_id=?', (item_id,))
+
+    def get_upload_session(self, local_path):
+        """
+        :param str local_path: Local path of the file being uploaded.
+        :return (str, int, float, int) | None: URL of the upload session, size and mtime of the file when the session
+        was created, and the offset of the next fragment to upload. None if there is no unfinished upload of the file.
+        """
+        rows = self._query('get_upload_session', 'SELECT upload_url, size, mtime, next_offset FROM upload_sessions '
+                                                 'WHERE local_path=?', (local_path,))
+        return rows[0] if len(rows) > 0 else None
+
+    def update_upload_session(self, local_path, upload_url, size, mtime, next_offset):
+        """
+        Save the progress of uploading a file by an upload session.
+        :param str local_path: Local path of the file being uploaded.
+        :param str upload_url: URL of the upload session.
+        :param int size: Size of the file when the session was created.
+        :param float mtime: Modification time of the file when the session was created.
+        :param int next_offset: Offset of the next fragment to upload.
+        """
+        with self._writing('update_upload_session') as batcher:
+            batcher.execute('INSERT OR REPLACE INTO upload_sessions (local_path, upload_url, size, mtime, next_offset) '
+                            'VALUES (?, ?, ?, ?, ?)', (local_path, upload_url, size, mtime, next_offset))
+
+    def delete_upload_session(self, local_path):
+        """
+        :param str local_path: Local path of the file whose upload finished or was abandoned.
+        """
+        with self._writing('delete_upload_session') as batcher:
+            batcher.execute('DELETE FROM upload_sessions WHERE local_path=?', (local_path,))
+
+    def get_cached_hashes(self, st):
+        """
+        Look up hash values computed before for the content of a local file. An entry is only valid for the same
+        device, inode, size and modification time, so any change to the file invalidates it.
+        :param os.stat_result st: Current status of the file.
+        :return (str, str) | None: CRC32 and SHA-1 values, in the format of HashFacet. None if nothing is cached.
+        """
+        rows = self._query('get_cached_hashes', 'SELECT crc32_hash, sha1_hash FROM hash_cache '
+                                                'WHERE device=? AND inode=? AND size=? AND mtime_ns=?',
+                           (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns))
+        return rows[0] if len(rows) > 0 else None
+
+    def update_cached_hashes(self, local_path, st, crc32_hash, sha1_hash):
+        """
+        :param str local_path: Path to the local file.
+        :param os.stat_result st: Status of the file when it was hashed.
+        :param str crc32_hash: CRC32 value in the format of HashFacet.
+        :param str sha1_hash: SHA-1 value in the format of HashFacet.
+        """
+        local_parent_path, item_name = os.path.split(local_path)
+        with self._writing('update_cached_hashes') as batcher:
+            batcher.execute('INSERT OR REPLACE INTO hash_cache (device, inode, size, mtime_ns, local_parent_path, '
+                            'item_name, crc32_hash, sha1_hash) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                            (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns, local_parent_path, item_name,
+                             crc32_hash, sha1_hash))
+
+    def evict_cached_hashes(self, local_path):
+        """
+        Remove cached hash values of a deleted local file, or of all files under a deleted local directory.
+        :param str local_path:
+        """
+        local_parent_path, item_name = os.path.split(local_path)
+        with self._writing('evict_cached_hashes') as batcher:
+            batcher.execute('DELETE FROM hash_cache WHERE local_parent_path=? AND item_name=? OR local_parent_path=? '
+                            'OR local_parent_path>=? AND local_parent_path<?',
+                            (local_parent_path, item_name, local_path) + get_descendant_range(local_path))
+
+    def prune_cached_hashes(self, local_parent_path, item_names):
+        """
+        Remove cached hash values of files in a local directory that no longer exist.
+        :param str local_parent_path: Path to the local directory.
+        :param set[str] item_names: Names of all entries in the directory.
+        """
+        rows = self._query('prune_cached_hashes', 'SELECT item_name FROM hash_cache WHERE local_parent_path=?',
+                           (local_parent_path,))
+        gone = [(local_parent_path, row[0]) for row in rows if row[0] not in item_names]
+        if len(gone) > 0:
+            with self._writing('prune_cached_hashes') as batcher:
+                for args in gone:
+                    batcher.execute('DELETE FROM hash_cache WHERE local_parent_path=? AND item_name=?', args)
+
+    def update_delta_token(self, token, pending=False):
+        """
+        Save the delta token of the drive.
+        :param str | None token: The new token. None to discard the stored token.
+        :param True | False pending: (Optional) Save the token held back for a merge from root instead.
+        """
+        key = self.PENDING_DELTA_TOKEN_KEY if pending else self.DELTA_TOKEN_KEY
+        with self._writing('update_delta_token') as batcher:
+            if token is None:
+                batcher.execute('DELETE FROM drive_state WHERE key=?', (key,))
+            else:
+                batcher.execute('INSERT OR REPLACE INTO drive_state (key, value) VALUES (?, ?)', (key, token))
@@ -0,0 +1,44 @@
+"""
+Versioned schema upgrades for SQLite stores. The schema version of a database is kept in its user_version pragma, and
+the n-th script in the upgrade list of a store brings the schema from version n-1 to version n. Released scripts must
+never be edited; append a new script instead.
+"""
+
+import sqlite3
+
+from onedrived import get_content
+from onedrived.common import logger_factory
+
+logger = logger_factory.get_logger('Schema')
+
+
+def get_version(conn):
+    """
+    :param sqlite3.Connection conn:
+    :return int: Schema version of the database. 0 for a database that has never been upgraded.
+    """
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def upgrade(conn, scripts):
+    """
+    Apply, in order, all scripts that the database has not applied yet. Each script runs in one transaction together
+    with the version bump, so a failed upgrade leaves the database at the last good version.
+    :param sqlite3.Connection conn: A connection in autocommit mode (isolation_level=None).
+    :param [str] scripts: File names of the SQL scripts in data/, oldest first.
+    :return int: The schema version after upgrade.
+    :raise ValueError: If the database was created by a newer version of the program.
+    """
+    version = get_version(conn)
+    if version > len(scripts):
+        raise ValueError('Database schema version %d is newer than the latest known version %d.' %
+                         (version, len(scripts)))
+    for i in range(version, len(scripts)):
+        logger.info('Upgrading database schema to version %d with "%s".', i + 1, scripts[i])
+        try:
+            conn.executescript('BEGIN;\n%s\nPRAGMA user_version = %d;\nCOMMIT;' % (get_content(scripts[i]), i + 1))
+        except sqlite3.Error:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            raise
+    return len(scripts)
@@ -0,0 +1,113 @@
+import atexit
+import json
+import sqlite3
+
+from onedrived.common import logger_factory
+from onedrived.store import schema
+
+# Scripts to upgrade the schema of snapshot indexes, oldest first. See onedrived.store.schema.
+SCHEMA_SCRIPTS = ['onedrive_snapshot.sql']
+
+# Fields of an entry in a directory record.
+INODE = 0
+SIZE = 1
+MTIME_NS = 2
+IS_DIR = 3
+
+
+class SnapshotIndex:
+    """
+    The state of local trees as last scanned, for finding what changed since. Each directory has one record: its own
+    mtime_ns, and a map from the name of each entry in it to [inode, size, mtime_ns, is_dir]. Size and mtime_ns are 0
+    for directories, whose own mtime_ns is in their records. One row per directory keeps the database small, and a
+    directory whose mtime_ns did not change can be skipped without reading its entries.
+
+    All records are loaded in memory. Changes are written when commit() is called, in one transaction. Not
+    thread-safe.
+    """
+
+    logger = logger_factory.get_logger('SnapshotIndex')
+
+    def __init__(self, db_path=':memory:'):
+        """
+        :param str db_path: (Optional) Path to the snapshot database. The snapshot is not kept on disk by default.
+        """
+        self._conn = sqlite3.connect(db_path, isolation_level=None, check_same_thread=False)
+        schema.upgrade(self._conn, SCHEMA_SCRIPTS)
+        self._dirs = {}
+        # Paths of records changed or removed since the last commit.
+        self._dirty = set()
+        for path, mtime_ns, entries in self._conn.execute('SELECT path, mtime_ns, entries FROM dirs'):
+            try:
+                self._dirs[path] = (mtime_ns, json.loads(entries))
+            except ValueError as e:
+                # The directory is scanned as if it were new.
+                self.logger.warning('Discarded snapshot of directory "%s": %s.', path, e)
+                self._dirty.add(path)
+        atexit.register(self.close)
+
+    def __len__(self):
+        return len(self._dirs)
+
+    def get(self, path):
+        """
+        :param str path: Path of a directory, without trailing '/'.
+        :return (int, dict[str, list]) | None: mtime_ns and entries of the directory, or None if it has no record.
+        """
+        return self._dirs.get(path)
+
+    def put(self, path, mtime_ns, entries):
+        """
+        Set the record of a directory. Call it again after changing the entries of a record in place.
+        :param str path: Path of a directory, without trailing '/'.
+        :param int mtime_ns:
+        :param dict[str, list] entries:
+        """
+        self._dirs[path] = (mtime_ns, entries)
+        self._dirty.add(path)
+
+    def pop_subtree(self, path):
+        """
+        Remove the records of a directory and all directories under it, following the directory entries of records.
+        :param str path: Path of a directory, without trailing '/'.
+        :return dict[str, (int, dict[str, list])]: The removed records, keyed by path.
+        """
+        ret = {}
+        stack = [path]
+        while len(stack) > 0:
+            p = stack.pop()
+            record = self._dirs.pop(p, None)
+            if record is None:
+                continue
+            self._dirty.add(p)
+            ret[p] = record
+            stack.extend(p + '/' + name for name, ent in record[1].items() if ent[IS_DIR])
+        return ret
+
+    def commit(self):
+        """
+        Write all records changed or removed since the last commit.
+        """
+        if len(self._dirty) == 0:
+            return
+        self._conn.execute('BEGIN')
+        try:
+            for path in self._dirty:
+                record = self._dirs.get(path)
+                if record is None:
+                    self._conn.execute('DELETE FROM dirs WHERE path=?', (path,))
+                else:
+                    self._conn.execute('INSERT OR REPLACE INTO dirs (path, mtime_ns, entries) VALUES (?, ?, ?)',
+                                       (path, record[0], json.dumps(record[1], separators=(',', ':'))))
+            self._conn.execute('COMMIT')
+        except sqlite3.Error:
+            self._conn.execute('ROLLBACK')
+            raise
+        self._dirty.clear()
+
+    def close(self):
+        if self._conn is None:
+            return
+        self.commit()
+        self._conn.close()
+        self._conn = None
@@ -0,0 +1,111 @@
+import atexit
+import sqlite3
+
+from onedrived.common import logger_factory
+from onedrived.store import schema
+from onedrived.store.write_batch import WriteBatcher
+from onedrived.vendor.rwlock import ReadWriteLock
+
+# Scripts to upgrade the schema of task journals, oldest first. See onedrived.store.schema.
+SCHEMA_SCRIPTS = ['onedrive_tasks.sql']
+
+
+class TaskJournal:
+    """
+    A SQLite journal of queued tasks, so that pending work survives a restart of the daemon. A task is recorded when
+    it is queued and deleted when it completes. Both writes go through group commit, so a crash loses at most the
+    last commit interval of journal updates: a lost record is rediscovered by merging, and a lost deletion only runs
+    an idempotent task once more.
+    """
+
+    logger = logger_factory.get_logger('TaskJournal')
+
+    def __init__(self, db_path, task_types):
+        """
+        :param str db_path: Path to the journal database.
+        :param [type] task_types: Task classes whose instances can be loaded from the journal.
+        """
+        self.lock = ReadWriteLock()
+        self._conn = sqlite3.connect(db_path, isolation_level=None, check_same_thread=False)
+        schema.upgrade(self._conn, SCHEMA_SCRIPTS)
+        self._batcher = WriteBatcher(self._conn, self.lock)
+        self.task_types = {t.__name__: t for t in task_types}
+        atexit.register(self.close)
+
+    def close(self):
+        self._batcher.flush()
+        self._conn.close()
+
+    def flush(self):
+        """
+        Commit all pending journal updates.
+        """
+        self._batcher.flush()
+
+    def record(self, task):
+        """
+        Record a queued task, unless it is already recorded or it cannot be serialized.
+        :param onedrived.common.tasks.TaskBase task:
+        """
+        if getattr(task, 'journal_id', None) is not None or type(task).__name__ not in self.task_types:
+            return
+        s = task.dump()
+        if s is None:
+            return
+        self.lock.acquire_write()
+        try:
+            cursor = self._batcher.execute('INSERT INTO tasks (drive_id, task_type, task_dump) VALUES (?, ?, ?)',
+                                           (task.drive.drive_id, type(task).__name__, s))
+            task.journal_id = cursor.lastrowid
+        finally:
+            self.lock.release_write()
+
+    def complete(self, task):
+        """
+        Remove a task that completed, or will never run, from the journal.
+        :param onedrived.common.tasks.TaskBase task:
+        """
+        journal_id = getattr(task, 'journal_id', None)
+        if journal_id is None:
+            return
+        self.lock.acquire_write()
+        try:
+            self._batcher.execute('DELETE FROM tasks WHERE task_id=?', (journal_id,))
+            task.journal_id = None
+        finally:
+            self.lock.release_write()
+
+    def load_tasks(self, get_parent_task):
+        """
+        Re-create all recorded tasks, in the order they were recorded. Records that cannot be loaded are discarded.
+        :param get_parent_task: A function that maps a drive ID to a task providing the drive, item storage and task
+        pool for loaded tasks, or to None if the drive no longer exists.
+        :return [onedrived.common.tasks.TaskBase]: Loaded tasks, each with its journal_id set.
+        """
+        self.lock.acquire_read()
+        try:
+            rows = self._conn.execute('SELECT task_id, drive_id, task_type, task_dump FROM tasks '
+                                      'ORDER BY task_id').fetchall()
+        finally:
+            self.lock.release_read()
+        ret = []
+        bad_ids = []
+        for task_id, drive_id, task_type, task_dump in rows:
+            parent_task = get_parent_task(drive_id)
+            try:
+                if parent_task is None:
+                    raise ValueError('drive "%s" is not found' % drive_id)
+                if task_type not in self.task_types:
+                    raise ValueError('unknown task type "%s"' % task_type)
+                task = self.task_types[task_type].load(parent_task, task_dump)
+            except (KeyError, TypeError, ValueError) as e:
+                self.logger.warning('Discarded journaled task %d: %s.', task_id, e)
+                bad_ids.append(task_id)
+                continue
+            task.journal_id = task_id
+            ret.append(task)
+        if len(bad_ids) > 0:
+            with self._batcher.batch():
+                for task_id in bad_ids:
+                    self._batcher.execute('DELETE FROM tasks WHERE task_id=?', (task_id,))
+        return ret
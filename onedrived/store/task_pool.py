@@ -1,9 +1,25 @@
+import heapq
+import itertools
 import threading
+import time
+
+from onedrived.common.metrics import MetricSet
+from onedrived.common.path_trie import PathTrie, normalize_path
 
 
 class TaskPool:
     """
     An in-memory storage singleton for tasks.
+
+    Tasks are queued in one heap per task class, ordered by enqueue time plus the priority delay of the task (see
+    TaskBase.priority_delay) and then by an increasing sequence number, so popping the most urgent task, of any class
+    or of a given class, only compares the heads of the heaps. Queued tasks are also indexed by path in a PathTrie so
+    that the tasks under a directory are removed without scanning the heaps; removed tasks are only marked in their
+    heap entries and dropped when they reach the head. Both the trie and tasks_by_path key tasks by their normalized
+    local paths (see path_trie.normalize_path), so that paths differing only in empty components, e.g., a trailing
+    '/', are taken for one path in both.
+
+    Time tasks spent in queue is recorded in `metrics` as "wait.<priority class>".
     """
 
     @classmethod
@@ -13,59 +29,113 @@ class TaskPool:
         return cls._instance
 
     def __init__(self):
+        # Normalized local path -> task queued, or popped and held, on the path.
         self.tasks_by_path = {}
-        self.queued_tasks = []
         self.semaphore = threading.Semaphore(0)
         self._lock = threading.Lock()
+        self._seq = itertools.count()
+        # Task class -> heap of entries [due time, sequence number, task, priority class, enqueue time]. Task is None
+        # if the entry was removed.
+        self._queues = {}
+        # Local path -> heap entry of each queued task.
+        self._entries = PathTrie()
+        self.metrics = MetricSet()
+        # An optional onedrived.store.task_journal.TaskJournal that queued tasks are recorded into.
+        self.journal = None
+
+    def __len__(self):
+        """
+        :return int: Number of queued tasks.
+        """
+        return len(self._entries)
 
     def add_task(self, task):
         """
         Add a task to internal storage. It will not add if there is already a task on the path.
         :param onedrived.common.tasks.TaskBase task: The task to add.
+        :return True | False: True if the task was added.
         """
-        self._lock.acquire()
-        if task.local_path in self.tasks_by_path:
-            self._lock.release()
-            return
-        self.queued_tasks.append(task)
-        self.tasks_by_path[task.local_path] = task
-        self._lock.release()
+        key = normalize_path(task.local_path)
+        # Outside the lock, since it may stat the file of the task.
+        priority_delay, priority_class = task.priority
+        with self._lock:
+            if key in self.tasks_by_path:
+                return False
+            now = time.monotonic()
+            entry = [now + priority_delay, next(self._seq), task, priority_class, now]
+            heapq.heappush(self._queues.setdefault(type(task), []), entry)
+            self._entries.add(key, entry)
+            self.tasks_by_path[key] = task
+            if self.journal is not None:
+                self.journal.record(task)
         self.semaphore.release()
+        return True
+
+    @staticmethod
+    def _get_head(queue):
+        """
+        :param list queue: A heap of entries.
+        :return list | None: The first live entry of the heap.
+        """
+        while len(queue) > 0 and queue[0][2] is None:
+            heapq.heappop(queue)
+        return queue[0] if len(queue) > 0 else None
 
     def pop_task(self, task_class=None):
         """
-        Pop the oldest task. It's required that the caller first acquire the semaphore.
+        Pop the most urgent task. It's required that the caller first acquire the semaphore.
         :param task_class: (Optional) Pop the first task of this given type.
         :return onedrived.common.tasks.TaskBase | None: The first qualified task, or None.
         """
-        self._lock.acquire()
-        ret = None
-        if len(self.queued_tasks) > 0:
-            if task_class is None:
-                ret = self.queued_tasks.pop(0)
-            else:
-                for t in self.queued_tasks:
-                    if isinstance(t, task_class):
-                        ret = t
-                        self.queued_tasks.remove(t)
-                        break
-        if ret is not None and not ret.should_hold:
-            del self.tasks_by_path[ret.local_path]
-        self._lock.release()
-        return ret
+        with self._lock:
+            first_queue = None
+            first_head = None
+            for cls, queue in self._queues.items():
+                if task_class is not None and not issubclass(cls, task_class):
+                    continue
+                head = self._get_head(queue)
+                if head is not None and (first_head is None or head[:2] < first_head[:2]):
+                    first_queue, first_head = queue, head
+            if first_queue is None:
+                return None
+            heapq.heappop(first_queue)
+            ret, priority_class, enqueue_time = first_head[2:]
+            self.metrics.timer('wait.' + priority_class).record(time.monotonic() - enqueue_time)
+            key = normalize_path(ret.local_path)
+            self._entries.remove(key)
+            if not ret.should_hold:
+                del self.tasks_by_path[key]
+            return ret
+
+    def complete_task(self, task):
+        """
+        Mark a popped task as done.
+        :param onedrived.common.tasks.TaskBase task:
+        """
+        if self.journal is not None:
+            self.journal.complete(task)
 
     def has_pending_task(self, local_path):
         with self._lock:
-            return local_path in self.tasks_by_path
+            return normalize_path(local_path) in self.tasks_by_path
 
     def clear_hold(self, task):
-        if task.local_path in self.tasks_by_path and self.tasks_by_path[task.local_path] is task:
-            with self._lock:
-                del self.tasks_by_path[task.local_path]
+        key = normalize_path(task.local_path)
+        with self._lock:
+            if self.tasks_by_path.get(key) is task:
+                del self.tasks_by_path[key]
 
     def remove_children_tasks(self, local_parent_path):
+        """
+        Remove the queued tasks on the given path and all paths under it.
+        :param str local_parent_path:
+        """
         with self._lock:
-            for t in self.queued_tasks[:]:
-                if t.local_path.startswith(local_parent_path):
-                    self.queued_tasks.remove(t)
-                    del self.tasks_by_path[t.local_path]
+            for path, entry in self._entries.pop_subtree(local_parent_path):
+                del self.tasks_by_path[path]
+                self.complete_task(entry[2])
+                entry[2].discard()
+                entry[2] = None
+                # Keep the semaphore in step with the queue. A consumer that has already passed the semaphore will
+                # pop None instead.
+                self.semaphore.acquire(blocking=False)
@@ -0,0 +1,188 @@
+"""
+Group commit for SQLite stores. Instead of committing every statement, writes are executed right away inside an open
+transaction, which is committed when it holds enough rows, when it gets old enough, or when an explicit batch ends.
+A batch holds the write lock while it is open, so that it can be rolled back without touching other writes.
+Readers on the same connection see the pending writes immediately, readers on other connections see them once they
+are committed; a crash can lose at most the writes of the last commit interval, and never leaves a partially written
+transaction behind.
+
+Losing the last interval is a deliberate trade of durability for throughput: the stores hold state that the daemon
+rebuilds by syncing again, and writes are committed in the order they are made, so, e.g., a delta token is never
+committed without the changes it covers. A store that needs every write durable when execute() returns uses
+max_rows=1.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+
+from onedrived.common import logger_factory
+from onedrived.common.scheduler import Scheduler
+
+
+class WriteBatcher:
+    COMMIT_MAX_ROWS = 1000
+    COMMIT_INTERVAL_SEC = 0.2
+
+    logger = logger_factory.get_logger('WriteBatcher')
+
+    def __init__(self, conn, lock, max_rows=COMMIT_MAX_ROWS, interval_sec=COMMIT_INTERVAL_SEC, scheduler=None):
+        """
+        :param sqlite3.Connection conn: A connection in autocommit mode (isolation_level=None).
+        :param onedrived.vendor.rwlock.ReadWriteLock lock: The write lock guarding the connection.
+        :param int max_rows: Commit once the open transaction holds this many written rows. 1 commits every write.
+        :param float interval_sec: Commit a transaction at the latest this many seconds after it was opened.
+        :param onedrived.common.scheduler.Scheduler | None scheduler: (Optional) The scheduler to run timed commits.
+        The shared one by default.
+        """
+        self._conn = conn
+        self._scheduler = scheduler
+        self._lock = lock
+        self.max_rows = max_rows
+        self.interval_sec = interval_sec
+        self._pending_rows = 0
+        # Identifier of the thread in a batch, which holds the write lock until the outermost batch exits.
+        self._batch_owner = None
+        self._batch_depth = 0
+        self._timer = None
+        # Incremented for every timer started, so that a timer that fires late does not clear a newer one.
+        self._timer_gen = 0
+        self._writer_threads = set()
+        self.num_commits = 0
+
+    @property
+    def pending_rows(self):
+        """
+        :return int: Number of rows written but not committed yet.
+        """
+        return self._pending_rows
+
+    def has_pending_writes(self, thread_id=None):
+        """
+        :param int | None thread_id: Identifier of a thread. Default to the current thread.
+        :return True | False: True if the thread wrote rows that are not committed yet.
+        """
+        if thread_id is None:
+            thread_id = threading.get_ident()
+        return thread_id in self._writer_threads
+
+    def in_batch(self):
+        """
+        :return True | False: True if the current thread is in a batch, and thus holds the write lock.
+        """
+        return self._batch_owner == threading.get_ident()
+
+    @contextmanager
+    def locked(self):
+        """
+        Hold the write lock for the block, unless the current thread already holds it for a batch.
+        """
+        if self.in_batch():
+            yield self
+            return
+        self._lock.acquire_write()
+        try:
+            yield self
+        finally:
+            self._lock.release_write()
+
+    def execute(self, sql, args=()):
+        """
+        Execute a write statement in the open transaction. The caller must hold the write lock.
+        :param str sql:
+        :param tuple args:
+        :rtype: sqlite3.Cursor
+        """
+        if not self._conn.in_transaction:
+            self._conn.execute('BEGIN')
+            self._start_timer()
+        cursor = self._conn.execute(sql, args)
+        self._pending_rows += max(cursor.rowcount, 1)
+        self._writer_threads.add(threading.get_ident())
+        if self._batch_owner is None and self._pending_rows >= self.max_rows:
+            self._commit()
+        return cursor
+
+    def _start_timer(self):
+        if self.max_rows > 1 and self._timer is None:
+            if self._scheduler is None:
+                self._scheduler = Scheduler.get_instance()
+            self._timer_gen += 1
+            self._timer = self._scheduler.call_later(self.interval_sec, self._on_timer, self._timer_gen)
+
+    def _on_timer(self, gen):
+        """
+        :param int gen: Value of _timer_gen when the timer was started.
+        """
+        self._lock.acquire_write()
+        try:
+            # The transaction of a stale timer was committed already, and the open one, if any, has its own timer.
+            if gen != self._timer_gen or self._timer is None:
+                return
+            self._timer = None
+            self._commit()
+        finally:
+            self._lock.release_write()
+
+    def _commit(self):
+        """ Commit the open transaction, if any. The caller must hold the write lock. """
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._conn.in_transaction:
+            start = time.time()
+            self._conn.commit()
+            self.num_commits += 1
+            self.logger.debug('Committed %d rows in %f sec.', self._pending_rows, time.time() - start)
+        self._pending_rows = 0
+        self._writer_threads.clear()
+
+    def flush(self):
+        """ Commit all pending writes now. Returns once they are durable. """
+        self._lock.acquire_write()
+        try:
+            self._commit()
+        finally:
+            self._lock.release_write()
+
+    @contextmanager
+    def batch(self):
+        """
+        Group all writes made inside the block into one transaction that is committed when the outermost block exits.
+        If the block raises, its writes are rolled back. The block holds the write lock, so it should only run
+        statements: other writers, and readers of the shared connection, wait until it exits.
+        """
+        if self.in_batch():
+            yield from self._savepoint()
+            return
+        self._lock.acquire_write()
+        try:
+            self._batch_owner = threading.get_ident()
+            try:
+                yield from self._savepoint()
+            finally:
+                self._batch_owner = None
+                self._commit()
+        finally:
+            self._lock.release_write()
+
+    def _savepoint(self):
+        """
+        Run the body of a batch in a savepoint of the open transaction. The caller must be the batch owner.
+        """
+        if not self._conn.in_transaction:
+            self._conn.execute('BEGIN')
+            self._start_timer()
+        self._batch_depth += 1
+        name = 'batch%d' % self._batch_depth
+        pending_rows = self._pending_rows
+        self._conn.execute('SAVEPOINT ' + name)
+        try:
+            yield self
+        except BaseException:
+            self._conn.execute('ROLLBACK TO ' + name)
+            self._pending_rows = pending_rows
+            raise
+        finally:
+            self._conn.execute('RELEASE ' + name)
+            self._batch_depth -= 1
@@ -34,7 +34,7 @@ test_requires = [
 
 readme = open('README.md').read()
 
-packages = find_packages(exclude=["*.tests", "*.tests.*", "tests.*", "tests"])
+packages = find_packages(exclude=["*.tests", "*.tests.*", "tests.*", "tests", "benchmarks", "benchmarks.*"])
 
 python_version = sys.version_info
 
@@ -1,18 +1,23 @@
 import io
+import tempfile
+import tracemalloc
 import unittest
 
 import requests_mock
 from requests import codes
 
 from onedrived.api import drives
+from onedrived.api import errors
 from onedrived.api import facets
+from onedrived.api import fragment_sizer
 from onedrived.api import items
 from onedrived.api import options
 from onedrived.api import resources
 from onedrived.common import drive_config
+from onedrived.common import hasher
 from onedrived.common.dateparser import str_to_datetime
 from tests import get_data
-from tests.factory import drive_factory
+from tests.factory import drive_factory, server_factory
 
 
 class TestDriveObject(unittest.TestCase):
@@ -72,6 +77,20 @@ class TestDriveObject(unittest.TestCase):
                                  self.drive.get_item_uri(None, 'foo/bar') + '/view.search?q=try&select=name,size',
                                  {'item_path': 'foo/bar', 'keyword': 'try', 'select': ['name', 'size']})
 
+    def test_get_changes(self):
+        with requests_mock.Mocker() as mock:
+            def callback(request, context):
+                self.assertEqual(['abc'], request.qs['token'])
+                context.status_code = codes.ok
+                return {'value': get_data('item_collection.json')['value'], '@delta.token': 'def'}
+
+            mock.get(self.drive.get_item_uri(None, None) + '/view.delta', json=callback)
+            changes = self.drive.get_changes(token='abc')
+            self.assertIsInstance(changes, items.DeltaCollection)
+            self.assertEqual(4, len(changes.get_next()))
+            self.assertFalse(changes.has_next)
+            self.assertEqual('def', changes.delta_token)
+
     def assert_create_dir(self, url, parent_id=None, parent_path=None):
         """
         https://github.com/OneDrive/onedrive-api-docs/blob/master/items/create.md
@@ -160,6 +179,15 @@ class TestDriveObject(unittest.TestCase):
             self.drive.download_file(file=output, size=len(data), item_id='123')
             self.assertEqual(data, output.getvalue())
 
+    def test_download_truncated_file(self):
+        """ A whole-file body shorter or longer than the item is an error. """
+        self.drive.config = drive_config.DriveConfig({'max_get_size_bytes': 10})
+        for data in (b'123', b'1234567'):
+            with requests_mock.Mocker() as mock:
+                mock.get(self.drive.get_item_uri(item_id='123', item_path=None) + '/content', content=data,
+                         status_code=codes.ok)
+                self.assertRaises(IOError, self.drive.download_file, file=io.BytesIO(), size=5, item_id='123')
+
     def test_download_large_file(self):
         self.drive.config = drive_config.DriveConfig({'max_get_size_bytes': 2})
         in_data = b'12345'
@@ -198,7 +226,7 @@ class TestDriveObject(unittest.TestCase):
             self.assertIsInstance(item, items.OneDriveItem)
 
     def test_upload_large_file(self):
-        self.drive.config = drive_config.DriveConfig({'max_put_size_bytes': 2})
+        self.drive.config = drive_config.DriveConfig({'max_put_size_bytes': 2, 'max_put_fragment_bytes': 2})
         session_url = 'https://foo/bar/accept_data'
         input = io.BytesIO(b'12345')
         output = io.BytesIO()
@@ -230,6 +258,92 @@ class TestDriveObject(unittest.TestCase):
                                    conflict_behavior=options.NameConflictBehavior.RENAME)
             self.assertEqual(input.getvalue(), output.getvalue())
 
+    def test_read_fragment(self):
+        buf = memoryview(bytearray(3))
+        data = io.BytesIO(b'12345')
+        self.assertEqual(b'234', self.drive._read_fragment(data, 1, buf).tobytes())
+        self.assertRaises(IOError, self.drive._read_fragment, data, 3, buf)
+
+    def test_resume_upload_session(self):
+        self.drive.config = drive_config.DriveConfig({'max_put_size_bytes': 2, 'max_put_fragment_bytes': 2})
+        session_url = 'https://foo/bar/accept_data'
+        session = resources.UploadSession.build(session_url, 0)
+        progress = []
+        with requests_mock.Mocker() as mock:
+            mock.get(session_url, json={'nextExpectedRanges': ['2-']})
+            mock.put(session_url, [{'json': {'nextExpectedRanges': ['4-']}, 'status_code': codes.accepted},
+                                   {'json': get_data('image_item.json'), 'status_code': codes.created}])
+            stream_hasher = hasher.StreamHasher()
+            item = self.drive.upload_file('test', data=io.BytesIO(b'12345'), size=5, parent_id='123',
+                                          session=session, on_progress=lambda s, n: progress.append(n),
+                                          stream_hasher=stream_hasher)
+            self.assertEqual(['2-3/5', '4-4/5'], [r.headers['Content-Range'] for r in mock.request_history
+                                                   if r.method == 'PUT'])
+        self.assertIsInstance(item, items.OneDriveItem)
+        self.assertListEqual([2, 4], progress)
+        self.assertEqual('8CB2237D0679CA88DB6464EAC60DA96345513964', stream_hasher.sha1)
+
+    def test_upload_session_expired(self):
+        self.drive.config = drive_config.DriveConfig({'max_put_size_bytes': 4, 'max_put_fragment_bytes': 4})
+        old_url = 'https://foo/bar/expired'
+        new_url = 'https://foo/bar/accept_data'
+        with requests_mock.Mocker() as mock:
+            mock.get(old_url, json=get_data('error_type2.json'), status_code=codes.not_found)
+            mock.post(self.drive.get_item_uri(item_id='123', item_path=None) + ':/test:/upload.createSession',
+                      json={'uploadUrl': new_url, 'nextExpectedRanges': ['0-']})
+            mock.put(new_url, [{'json': {'nextExpectedRanges': ['4-']}, 'status_code': codes.accepted},
+                               {'json': get_data('image_item.json'), 'status_code': codes.created}])
+            self.drive.upload_file('test', data=io.BytesIO(b'12345'), size=5, parent_id='123',
+                                   session=resources.UploadSession.build(old_url, 3))
+            self.assertEqual(['0-3/5', '4-4/5'], [r.headers['Content-Range'] for r in mock.request_history
+                                                   if r.method == 'PUT'])
+
+    def test_upload_fragment_received_before_error(self):
+        """ A fragment sent again after a broken connection is rejected, and the upload continues after it. """
+        self.drive.config = drive_config.DriveConfig({'max_put_size_bytes': 2, 'max_put_fragment_bytes': 2})
+        session_url = 'https://foo/bar/accept_data'
+        with requests_mock.Mocker() as mock:
+            mock.post(self.drive.get_item_uri(item_id='123', item_path=None) + ':/test:/upload.createSession',
+                      json={'uploadUrl': session_url, 'nextExpectedRanges': ['0-']})
+            mock.get(session_url, json={'nextExpectedRanges': ['2-']})
+            mock.put(session_url, [{'json': get_data('error_server_internal.json'), 'status_code': 416},
+                                   {'json': {'nextExpectedRanges': ['4-']}, 'status_code': codes.accepted},
+                                   {'json': get_data('image_item.json'), 'status_code': codes.created}])
+            stream_hasher = hasher.StreamHasher()
+            self.drive.upload_file('test', data=io.BytesIO(b'12345'), size=5, parent_id='123',
+                                   stream_hasher=stream_hasher)
+            self.assertEqual('8CB2237D0679CA88DB6464EAC60DA96345513964', stream_hasher.sha1)
+            self.assertEqual(['0-1/5', '2-3/5', '4-4/5'], [r.headers['Content-Range'] for r in mock.request_history
+                                                            if r.method == 'PUT'])
+
+    def test_upload_error_without_progress(self):
+        self.drive.config = drive_config.DriveConfig({'max_put_size_bytes': 2, 'max_put_fragment_bytes': 2})
+        session_url = 'https://foo/bar/accept_data'
+        with requests_mock.Mocker() as mock:
+            mock.get(session_url, json={'nextExpectedRanges': ['0-']})
+            mock.put(session_url, json=get_data('error_type1.json'), status_code=416)
+            self.assertRaises(errors.OneDriveError, self.drive.upload_file, 'test', data=io.BytesIO(b'12345'),
+                              size=5, parent_id='123', session=resources.UploadSession.build(session_url, 0))
+
+    def test_upload_retry_smaller_fragment(self):
+        """ A fragment the server received none of is sent again, halved, instead of failing the upload. """
+        unit = fragment_sizer.FragmentSizer.UNIT_BYTES
+        self.drive.config = drive_config.DriveConfig({'max_put_size_bytes': 2 * unit,
+                                                      'max_put_fragment_bytes': 4 * unit})
+        session_url = 'https://foo/bar/accept_data'
+        size = 3 * unit
+        with requests_mock.Mocker() as mock:
+            mock.post(self.drive.get_item_uri(item_id='123', item_path=None) + ':/test:/upload.createSession',
+                      json={'uploadUrl': session_url, 'nextExpectedRanges': ['0-']})
+            mock.get(session_url, json={'nextExpectedRanges': ['0-']})
+            mock.put(session_url, [{'json': get_data('error_type1.json'), 'status_code': 416},
+                                   {'json': {'nextExpectedRanges': [str(unit) + '-']}, 'status_code': codes.accepted},
+                                   {'json': get_data('image_item.json'), 'status_code': codes.created}])
+            item = self.drive.upload_file('test', data=io.BytesIO(b'0' * size), size=size, parent_id='123')
+            ranges = [r.headers['Content-Range'] for r in mock.request_history if r.method == 'PUT']
+        self.assertIsInstance(item, items.OneDriveItem)
+        self.assertListEqual(['0-%d/%d' % (2 * unit - 1, size), '0-%d/%d' % (unit - 1, size)], ranges[:2])
+
     def test_copy_item(self):
         new_parent = resources.ItemReference.build(id='123abc', path='/foo/bar')
         new_name = '456.doc'
@@ -269,5 +383,59 @@ class TestDriveObject(unittest.TestCase):
         self.assertEqual(0, len(drive_root._cached_drives))
 
 
+class NullWriter:
+    """ A file object that only counts the bytes written. """
+
+    def __init__(self):
+        self.size = 0
+
+    def write(self, data):
+        self.size += len(data)
+
+
+class TestDownloadStreaming(unittest.TestCase):
+    def setUp(self):
+        self.drive = drive_factory.get_sample_drive_object()
+        self.drive.root.account.session.session.trust_env = False
+
+    def get_peak_memory(self, size, max_get_size_bytes):
+        self.drive.config = drive_config.DriveConfig({'max_get_size_bytes': max_get_size_bytes})
+        output = NullWriter()
+        with server_factory.ContentServer(size) as server:
+            self.drive.drive_uri = server.url
+            tracemalloc.start()
+            try:
+                digests = self.drive.download_file(file=output, size=size, item_id='123')
+                peak = tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+        self.assertEqual(size, output.size)
+        self.assertEqual(server_factory.get_content_hashes(size).sha1, digests.sha1)
+        return peak
+
+    def test_parallel_ranges(self):
+        size = (4 << 20) + 123
+        self.drive.config = drive_config.DriveConfig({'max_get_size_bytes': 1 << 20, 'max_get_concurrency': 3})
+        with server_factory.ContentServer(size, bytes_per_sec=16 << 20) as server, \
+                tempfile.TemporaryFile(mode='w+b') as output:
+            self.drive.drive_uri = server.url
+            digests = self.drive.download_file(file=output, size=size, item_id='123')
+            self.assertEqual(5, len(server.requests))
+            self.assertEqual(3, server.max_active)
+            output.seek(0)
+            written = hasher.StreamHasher()
+            written.update(output.read())
+        expected = server_factory.get_content_hashes(size)
+        self.assertEqual(expected.sha1, written.sha1)
+        self.assertEqual(expected.sha1, digests.sha1)
+        self.assertEqual(expected.crc32, digests.crc32)
+
+    def test_constant_memory(self):
+        """ Peak memory of a download does not grow with file size or fragment size. """
+        limit = 8 * drives.DriveObject.DOWNLOAD_BUFFER_BYTES
+        for size, max_get_size_bytes in [(1 << 20, 1 << 30), (32 << 20, 1 << 30), (32 << 20, 8 << 20)]:
+            self.assertLess(self.get_peak_memory(size, max_get_size_bytes), limit)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -32,6 +32,9 @@ class TestOneDriveTokenErrorConversion(unittest.TestCase):
     def test_parse_server_internal_error(self):
         self.raise_error('error_server_internal.json', errors.OneDriveServerInternalError)
 
+    def test_parse_resync_required_error(self):
+        self.raise_error('error_resync_required.json', errors.OneDriveResyncRequiredError)
+
 
 class TestOneDriveRecoverableError(unittest.TestCase):
     def test_parse(self):
@@ -0,0 +1,60 @@
+import unittest
+
+from onedrived.api.fragment_sizer import FragmentSizer
+
+UNIT = FragmentSizer.UNIT_BYTES
+
+
+class TestFragmentSizer(unittest.TestCase):
+    def test_initial_size_is_allowed(self):
+        self.assertEqual(UNIT, FragmentSizer(524288).fragment_bytes)
+        self.assertEqual(FragmentSizer.MAX_BYTES, FragmentSizer(1 << 30, 1 << 30).fragment_bytes)
+
+    def test_grow_to_throughput(self):
+        sizer = FragmentSizer(UNIT)
+        sizer.on_request(0.1)
+        # 10 MB/s and 0.1 sec RTT make a fragment of 8 RTTs about 8 MB, reached by doubling.
+        sizes = []
+        for _ in range(6):
+            size = sizer.fragment_bytes
+            sizer.on_success(size, 0.1 + size / 10e6)
+            sizes.append(sizer.fragment_bytes)
+        self.assertListEqual([2 * UNIT, 4 * UNIT, 8 * UNIT, 16 * UNIT], sizes[:4])
+        self.assertEqual(int(8 * 0.1 * 10e6) // UNIT * UNIT, sizes[-1])
+        for size in sizes:
+            self.assertEqual(0, size % UNIT)
+
+    def test_limits(self):
+        sizer = FragmentSizer(UNIT, 3 * UNIT)
+        for _ in range(4):
+            sizer.on_success(sizer.fragment_bytes, 0)
+        self.assertEqual(3 * UNIT, sizer.fragment_bytes)
+        for _ in range(4):
+            sizer.on_failure()
+        self.assertEqual(UNIT, sizer.fragment_bytes)
+
+    def test_shrink_on_slow_connection(self):
+        sizer = FragmentSizer(64 * UNIT)
+        sizer.on_request(1)
+        sizer.on_success(64 * UNIT, 61)
+        # The next fragment takes 8 RTTs at the measured throughput.
+        self.assertEqual(int(64 * UNIT / 60 * 8) // UNIT * UNIT, sizer.fragment_bytes)
+
+    def test_max_fragment_time(self):
+        sizer = FragmentSizer(64 * UNIT)
+        sizer.on_request(10)
+        sizer.on_success(64 * UNIT, 50)
+        self.assertEqual(int(64 * UNIT / 40 * FragmentSizer.MAX_FRAGMENT_SEC) // UNIT * UNIT, sizer.fragment_bytes)
+
+    def test_fixed_size(self):
+        for size in (2, 16 * UNIT):
+            sizer = FragmentSizer(size, size)
+            sizer.on_request(0.001)
+            sizer.on_success(size, 1)
+            self.assertEqual(size, sizer.fragment_bytes)
+            sizer.on_failure()
+            self.assertEqual(size, sizer.fragment_bytes)
+
+
+if __name__ == '__main__':
+    unittest.main()
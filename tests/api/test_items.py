@@ -1,5 +1,8 @@
+import threading
+import time
 import unittest
 
+from onedrived.api import errors
 from onedrived.api import facets
 from onedrived.api import items
 from onedrived.api import resources
@@ -124,5 +127,69 @@ class TestOneDriveItemTimestamps(unittest.TestCase):
         self.assert_timestamps(self.data['fileSystemInfo'], item.fs_info)
 
 
+class FakeCollection:
+    """
+    A collection of pages of one item each, which counts the pages fetched and raises an error at a given page.
+    """
+
+    def __init__(self, num_pages, fail_at=None):
+        self.num_pages = num_pages
+        self.fail_at = fail_at
+        self.fetched = 0
+        self.cond = threading.Condition()
+
+    @property
+    def has_next(self):
+        return self.fetched < self.num_pages
+
+    def get_next(self):
+        with self.cond:
+            if self.fetched == self.fail_at:
+                error = {'code': 'serviceNotAvailable', 'message': 'page %d' % self.fetched}
+                raise errors.OneDriveError({'error': error})
+            self.fetched += 1
+            self.cond.notify_all()
+            return [self.fetched]
+
+    def wait_fetched(self, n):
+        with self.cond:
+            return self.cond.wait_for(lambda: self.fetched >= n, timeout=5)
+
+
+class TestIterPages(unittest.TestCase):
+    def test_no_prefetch(self):
+        collection = FakeCollection(3)
+        pages = items.iter_pages(collection)
+        self.assertEqual([1], next(pages))
+        self.assertEqual(1, collection.fetched)
+        self.assertEqual([[2], [3]], list(pages))
+
+    def test_prefetch_depth(self):
+        collection = FakeCollection(10)
+        pages = items.iter_pages(collection, prefetch=2)
+        self.assertEqual([1], next(pages))
+        self.assertTrue(collection.wait_fetched(3))
+        time.sleep(0.05)
+        self.assertEqual(3, collection.fetched)
+        self.assertEqual([[i] for i in range(2, 11)], list(pages))
+
+    def test_prefetch_error(self):
+        collection = FakeCollection(5, fail_at=2)
+        pages = items.iter_pages(collection, prefetch=4)
+        self.assertEqual([1], next(pages))
+        self.assertEqual([2], next(pages))
+        self.assertRaises(errors.OneDriveError, next, pages)
+
+    def test_prefetch_close(self):
+        collection = FakeCollection(10)
+        pages = items.iter_pages(collection, prefetch=1)
+        self.assertEqual([1], next(pages))
+        self.assertTrue(collection.wait_fetched(2))
+        pages.close()
+        time.sleep(0.05)
+        self.assertEqual(2, collection.fetched)
+        self.assertNotIn('prefetch', [t.name for t in threading.enumerate()])
+
+
 if __name__ == '__main__':
     unittest.main()
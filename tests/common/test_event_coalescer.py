@@ -0,0 +1,109 @@
+import unittest
+
+from onedrived.common.event_coalescer import EventCoalescer, Intent, Intents
+from onedrived.common.inotify import IN_CLOSE_WRITE, IN_CREATE, IN_DELETE, IN_ISDIR, IN_MOVED_FROM, IN_MOVED_TO
+
+WINDOW = 2
+
+
+class TestEventCoalescer(unittest.TestCase):
+    def setUp(self):
+        self.coalescer = EventCoalescer(WINDOW)
+        self.now = 0
+
+    def add(self, mask, path, cookie=0):
+        parent, name = path.rsplit('/', 1)
+        self.coalescer.add(parent + '/', mask, cookie, name, self.now)
+        self.now += 0.1
+
+    def pop_all(self):
+        return self.coalescer.pop_due(self.now + WINDOW)
+
+    def test_save_by_rename(self):
+        self.add(IN_CREATE, '/d/.foo.swp')
+        self.add(IN_CLOSE_WRITE, '/d/.foo.swp')
+        self.add(IN_MOVED_FROM, '/d/.foo.swp', cookie=1)
+        self.add(IN_MOVED_TO, '/d/foo', cookie=1)
+        self.assertListEqual([Intent(Intents.UPLOAD, '/d/foo', False, None)], self.pop_all())
+        self.assertEqual(0, len(self.coalescer))
+
+    def test_debounce(self):
+        self.add(IN_CLOSE_WRITE, '/d/foo')
+        self.assertEqual(WINDOW, self.coalescer.next_deadline())
+        self.now += WINDOW - 0.5
+        self.add(IN_CLOSE_WRITE, '/d/foo')
+        self.assertListEqual([], self.coalescer.pop_due(WINDOW + 0.1))
+        self.assertEqual(self.now - 0.1 + WINDOW, self.coalescer.next_deadline())
+        self.assertListEqual([Intent(Intents.UPLOAD, '/d/foo', False, None)], self.pop_all())
+        self.assertIsNone(self.coalescer.next_deadline())
+
+    def test_create_and_delete(self):
+        self.add(IN_CREATE, '/d/foo')
+        self.add(IN_CLOSE_WRITE, '/d/foo')
+        self.add(IN_DELETE, '/d/foo')
+        self.assertListEqual([], self.pop_all())
+
+    def test_delete_existing(self):
+        self.add(IN_CLOSE_WRITE, '/d/foo')
+        self.add(IN_DELETE, '/d/foo')
+        self.assertListEqual([Intent(Intents.DELETE, '/d/foo', False, None)], self.pop_all())
+
+    def test_move(self):
+        self.add(IN_MOVED_FROM, '/d/foo', cookie=1)
+        self.add(IN_MOVED_TO, '/d/bar', cookie=1)
+        self.add(IN_MOVED_FROM, '/d/bar', cookie=2)
+        self.add(IN_MOVED_TO, '/d/baz', cookie=2)
+        self.assertListEqual([Intent(Intents.MOVE, '/d/baz', False, '/d/foo')], self.pop_all())
+
+    def test_move_and_modify(self):
+        self.add(IN_MOVED_FROM, '/d/foo', cookie=1)
+        self.add(IN_MOVED_TO, '/d/bar', cookie=1)
+        self.add(IN_CLOSE_WRITE, '/d/bar')
+        self.assertListEqual([Intent(Intents.MOVE, '/d/bar', False, '/d/foo'),
+                              Intent(Intents.UPLOAD, '/d/bar', False, None)], self.pop_all())
+
+    def test_move_and_delete(self):
+        self.add(IN_MOVED_FROM, '/d/foo', cookie=1)
+        self.add(IN_MOVED_TO, '/d/bar', cookie=1)
+        self.add(IN_DELETE, '/d/bar')
+        self.assertListEqual([Intent(Intents.DELETE, '/d/foo', False, None)], self.pop_all())
+
+    def test_move_in_and_out(self):
+        self.add(IN_MOVED_FROM | IN_ISDIR, '/d/foo', cookie=1)
+        self.add(IN_MOVED_TO | IN_ISDIR, '/d/bar', cookie=2)
+        self.assertListEqual([Intent(Intents.DELETE, '/d/foo', True, None),
+                              Intent(Intents.CREATE_DIR, '/d/bar', True, None)], self.pop_all())
+
+    def test_move_dir_with_pending_children(self):
+        self.add(IN_CREATE | IN_ISDIR, '/d/foo')
+        self.add(IN_CREATE, '/d/foo/a')
+        self.add(IN_MOVED_FROM | IN_ISDIR, '/d/foo', cookie=1)
+        self.add(IN_MOVED_TO | IN_ISDIR, '/d/bar', cookie=1)
+        self.assertListEqual([Intent(Intents.UPLOAD, '/d/bar/a', False, None),
+                              Intent(Intents.CREATE_DIR, '/d/bar', True, None)], self.pop_all())
+
+    def test_replace_file_with_dir(self):
+        self.add(IN_DELETE, '/d/foo')
+        self.add(IN_CREATE | IN_ISDIR, '/d/foo')
+        self.assertListEqual([Intent(Intents.DELETE, '/d/foo', False, None),
+                              Intent(Intents.CREATE_DIR, '/d/foo', True, None)], self.pop_all())
+
+    def test_replace_file(self):
+        self.add(IN_DELETE, '/d/foo')
+        self.add(IN_CREATE, '/d/foo')
+        self.add(IN_CLOSE_WRITE, '/d/foo')
+        self.assertListEqual([Intent(Intents.UPLOAD, '/d/foo', False, None)], self.pop_all())
+        self.add(IN_DELETE, '/d/foo')
+        self.add(IN_CREATE, '/d/foo')
+        self.add(IN_DELETE, '/d/foo')
+        self.assertListEqual([Intent(Intents.DELETE, '/d/foo', False, None)], self.pop_all())
+
+    def test_delete_dir_drops_children(self):
+        self.add(IN_CLOSE_WRITE, '/d/foo/a')
+        self.add(IN_DELETE, '/d/foo/a')
+        self.add(IN_DELETE | IN_ISDIR, '/d/foo')
+        self.assertListEqual([Intent(Intents.DELETE, '/d/foo', True, None)], self.pop_all())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,139 @@
+import shutil
+import tempfile
+import time
+import unittest
+
+from onedrived.api import drives
+from onedrived.api.items import OneDriveItem
+from onedrived.common import drive_config
+from onedrived.common.fsmonitor import FileSystemMonitor
+from onedrived.common.inotify import IN_CLOSE_WRITE, IN_CREATE, IN_ISDIR, IN_MOVED_FROM, IN_MOVED_TO
+from onedrived.common.tasks.delete_task import DeleteItemTask
+from onedrived.common.tasks.merge_task import MergeDirTask
+from onedrived.common.tasks.move_task import MoveItemTask
+from onedrived.common.tasks.up_task import UploadFileTask
+from tests import get_data, mock
+from tests.factory import db_factory, drive_factory
+
+
+class TestFileSystemMonitor(unittest.TestCase):
+    def setUp(self):
+        self.drive = drive_factory.get_sample_drive_object()
+        drive_store = mock.Mock(get_all_drives=mock.Mock(return_value={self.drive.drive_id: self.drive}))
+        self.items_store_man = db_factory.get_sample_item_storage_manager()
+        self.task_pool = mock.Mock(has_pending_task=mock.Mock(return_value=False))
+        self.monitor = FileSystemMonitor(drive_store, self.items_store_man, self.task_pool, coalesce_window_sec=2)
+        self.root = self.drive.config.local_root
+
+    def flush(self):
+        self.monitor._flush(now=10)
+        return [c[0][0] for c in self.task_pool.add_task.call_args_list]
+
+    def test_upload_once(self):
+        for mask in (IN_CREATE, IN_CLOSE_WRITE, IN_CLOSE_WRITE):
+            self.monitor._process_event(mask, self.root + '/Public/', 'foo', now=0)
+        self.monitor._process_event(IN_CLOSE_WRITE, self.root + '/', '.foo.!od', now=0)
+        tasks = self.flush()
+        self.assertEqual(1, len(tasks))
+        self.assertIsInstance(tasks[0], UploadFileTask)
+        self.assertEqual(self.root + '/Public/foo', tasks[0].local_path)
+        self.assertEqual(3, self.monitor.metrics.counter('events').value)
+        self.assertEqual(1, self.monitor.metrics.counter('intents').value)
+
+    def test_new_dir(self):
+        self.monitor._process_event(IN_CREATE | IN_ISDIR, self.root + '/Public/', 'foo', now=0)
+        tasks = self.flush()
+        self.assertEqual(1, len(tasks))
+        self.assertIsInstance(tasks[0], MergeDirTask)
+        self.assertEqual(self.root + '/Public', tasks[0].local_path)
+
+    def test_move(self):
+        item = OneDriveItem(self.drive, get_data('image_item.json'))
+        self.items_store_man.get_item_storage(self.drive).update_item(item)
+        self.monitor._process_event(IN_MOVED_FROM, self.root + '/', item.name, cookie=1, now=0)
+        self.monitor._process_event(IN_MOVED_TO, self.root + '/Public/', 'bar', cookie=1, now=0)
+        tasks = self.flush()
+        self.assertEqual(1, len(tasks))
+        self.assertIsInstance(tasks[0], MoveItemTask)
+        self.assertEqual(self.root + '/Public/bar', tasks[0].local_path)
+        self.assertEqual('/drive/root:/' + item.name, tasks[0]._old_remote_item_path)
+
+    def test_move_and_modify(self):
+        """ A file modified and then moved is uploaded after the move, though the pool takes one task per path. """
+        task_pool = db_factory.get_sample_task_pool()
+        drive_store = mock.Mock(get_all_drives=mock.Mock(return_value={self.drive.drive_id: self.drive}))
+        monitor = FileSystemMonitor(drive_store, self.items_store_man, task_pool, coalesce_window_sec=2)
+        item = OneDriveItem(self.drive, get_data('image_item.json'))
+        self.items_store_man.get_item_storage(self.drive).update_item(item)
+        monitor._process_event(IN_CLOSE_WRITE, self.root + '/', item.name, now=0)
+        monitor._process_event(IN_MOVED_FROM, self.root + '/', item.name, cookie=1, now=0)
+        monitor._process_event(IN_MOVED_TO, self.root + '/Public/', 'bar', cookie=1, now=0)
+        monitor._flush(now=10)
+        self.assertEqual(1, len(task_pool))
+        task = task_pool.pop_task()
+        self.assertIsInstance(task, MoveItemTask)
+        self.drive.update_item = mock.Mock(return_value=item)
+        task.handle()
+        task = task_pool.pop_task()
+        self.assertIsInstance(task, UploadFileTask)
+        self.assertEqual(self.root + '/Public/bar', task.local_path)
+
+    def test_loop_lag(self):
+        """ Loop lag is how late settled changes are handled, and batch time how long handling takes. """
+        self.monitor._process_event(IN_CREATE, self.root + '/', 'foo', now=time.monotonic() - 3)
+
+        def read(timeout_sec):
+            self.monitor._running = False
+            return []
+
+        self.monitor._watcher = mock.Mock(read=read, watch_count=0)
+        self.monitor._running = True
+        self.monitor._watch()
+        self.assertEqual(1, self.monitor.metrics.timer('loop_lag').count)
+        self.assertGreaterEqual(self.monitor.metrics.timer('loop_lag').max_sec, 1)
+        self.assertEqual(1, self.monitor.metrics.timer('batch_time').count)
+        self.assertEqual(1, len(self.task_pool.add_task.call_args_list))
+
+    def test_route_nested_roots(self):
+        config = drive_config.DriveConfig(dict(get_data('drive_config.json'), local_root=self.root + '/Public'))
+        nested = drives.DriveObject(root=self.drive.root, data=dict(get_data('drive.json'), id='nested'), config=config)
+        drive_store = mock.Mock(get_all_drives=mock.Mock(return_value={'a': self.drive, 'b': nested}))
+        monitor = FileSystemMonitor(drive_store, self.items_store_man, self.task_pool)
+        self.assertTupleEqual((nested, '/foo/bar'), monitor._route(self.root + '/Public/foo/bar'))
+        self.assertTupleEqual((nested, ''), monitor._route(self.root + '/Public'))
+        self.assertTupleEqual((self.drive, '/Public2'), monitor._route(self.root + '/Public2'))
+        self.assertTupleEqual((None, None), monitor._route('/foo'))
+
+    def test_move_unrecorded(self):
+        self.monitor._process_event(IN_MOVED_FROM, self.root + '/', 'foo', cookie=1, now=0)
+        self.monitor._process_event(IN_MOVED_TO, self.root + '/', 'bar', cookie=1, now=0)
+        self.monitor._process_event(IN_MOVED_FROM, self.root + '/', 'baz', cookie=2, now=0)
+        tasks = self.flush()
+        self.assertListEqual([DeleteItemTask, UploadFileTask], [t.__class__ for t in tasks])
+        self.assertEqual(self.root + '/baz', tasks[0].local_path)
+        self.assertEqual(self.root + '/bar', tasks[1].local_path)
+
+    def test_poll(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        config = drive_config.DriveConfig(dict(get_data('drive_config.json'), local_root=root))
+        drive = drives.DriveObject(root=self.drive.root, data=get_data('drive.json'), config=config)
+        drive_store = mock.Mock(get_all_drives=mock.Mock(return_value={drive.drive_id: drive}))
+        monitor = FileSystemMonitor(drive_store, self.items_store_man, self.task_pool, coalesce_window_sec=0,
+                                    poll=True, poll_interval_sec=0.01)
+        monitor.start()
+        while monitor.metrics.timer('scan').count == 0:
+            time.sleep(0.01)
+        with open(root + '/foo', 'w'):
+            pass
+        deadline = time.monotonic() + 5
+        while not self.task_pool.add_task.called and time.monotonic() < deadline:
+            time.sleep(0.01)
+        monitor.close()
+        monitor.join()
+        self.assertIsInstance(self.task_pool.add_task.call_args[0][0], UploadFileTask)
+        self.assertEqual(root + '/foo', self.task_pool.add_task.call_args[0][0].local_path)
+
+
+if __name__ == '__main__':
+    unittest.main()
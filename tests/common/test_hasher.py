@@ -1,6 +1,11 @@
+import base64
 import io
+import os
+import shutil
+import tempfile
 import unittest
 
+from onedrived.api.facets import HashFacet
 from onedrived.common import hasher
 from tests import mock
 
@@ -23,6 +28,127 @@ class TestHasher(unittest.TestCase):
     def test_sha1(self):
         self.assert_func(hasher.hash_value, {}, '430CE34D020724ED75A196DFC2AD67C77772D169')
 
+    def test_sha1_state_not_shared(self):
+        self.assert_func(hasher.hash_value, {}, '430CE34D020724ED75A196DFC2AD67C77772D169')
+        self.data = io.BytesIO(b'hello world!')
+        self.assert_func(hasher.hash_value, {}, '430CE34D020724ED75A196DFC2AD67C77772D169')
+
+    def test_stream_hasher(self):
+        h = hasher.StreamHasher()
+        h.update(b'hello ')
+        h.update(memoryview(b'world!'))
+        self.assertEqual(12, h.size)
+        self.assertEqual('62177901', h.crc32)
+        self.assertEqual('430CE34D020724ED75A196DFC2AD67C77772D169', h.sha1)
+
+    def test_stream_hasher_matches(self):
+        h = hasher.StreamHasher()
+        h.update(b'hello world!')
+        self.assertEqual('6DC2B403', h.crc32_hex)
+        self.assertTrue(h.matches(HashFacet({'sha1Hash': '430ce34d020724ed75a196dfc2ad67c77772d169'})))
+        self.assertTrue(h.matches(HashFacet({'crc32Hash': '6dc2b403'})))
+        self.assertFalse(h.matches(HashFacet({'sha1Hash': '0' * 40, 'crc32Hash': '6DC2B403'})))
+        self.assertIsNone(h.matches(HashFacet({})))
+        self.assertIsNone(h.matches(None))
+
+    def test_ordered_range_hasher(self):
+        with tempfile.TemporaryFile() as f:
+            f.write(b'hello world!')
+            f.flush()
+            h = hasher.OrderedRangeHasher(f.fileno(), [(0, 3), (4, 7), (8, 11)], block_size=3)
+            h.complete(2)
+            h.complete(1)
+            self.assertEqual(0, h.hasher.size)
+            h.complete(0)
+            self.assertEqual('430CE34D020724ED75A196DFC2AD67C77772D169', h.hasher.sha1)
+
+    def test_ordered_range_hasher_from_memory(self):
+        """ Data written next in file order is hashed as it is written, and only data written ahead is read back. """
+        content = b'hello world!'
+        ranges = [(0, 3), (4, 7), (8, 11)]
+        with tempfile.TemporaryFile() as f:
+            h = hasher.OrderedRangeHasher(f.fileno(), ranges, block_size=3)
+
+            def write(i, first, last):
+                f.seek(first)
+                f.write(content[first:last + 1])
+                f.flush()
+                h.update(i, first, content[first:last + 1])
+
+            write(2, 8, 11)
+            h.complete(2)
+            write(0, 0, 1)
+            write(1, 4, 7)
+            write(0, 2, 3)
+            h.complete(0)
+            # Data of range 1 written so far follows, though the range is not complete.
+            self.assertEqual(8, h.hasher.size)
+            h.complete(1)
+            self.assertEqual('430CE34D020724ED75A196DFC2AD67C77772D169', h.hasher.sha1)
+            # Only the ranges written ahead of the data hashed were read back.
+            self.assertEqual(8, h.bytes_read_back)
+
+
+def quick_xor_by_byte(data):
+    """ The QuickXorHash algorithm as specified, one byte at a time. """
+    state = 0
+    for i, b in enumerate(data):
+        shift = (11 * i) % 160
+        state ^= ((b << shift) | (b >> (160 - shift))) & ((1 << 160) - 1)
+    state ^= len(data) << 96
+    return base64.b64encode(state.to_bytes(20, 'little')).decode('ascii')
+
+
+class TestQuickXorHash(unittest.TestCase):
+    def test_empty(self):
+        h = hasher.StreamHasher([hasher.QUICK_XOR])
+        self.assertEqual('AAAAAAAAAAAAAAAAAAAAAAAAAAA=', h.quick_xor)
+        self.assertDictEqual({hasher.QUICK_XOR: h.quick_xor}, h.values())
+
+    def test_same_as_by_byte(self):
+        data = bytes(range(256)) * 13 + b'\xff' * 7
+        for pieces in ([data], [data[:1], data[1:161], data[161:]], [data[i:i + 97] for i in range(0, len(data), 97)]):
+            h = hasher.StreamHasher([hasher.QUICK_XOR])
+            for piece in pieces:
+                h.update(piece)
+            self.assertEqual(quick_xor_by_byte(data), h.quick_xor)
+
+    def test_matches(self):
+        h = hasher.StreamHasher([hasher.QUICK_XOR, hasher.CRC32])
+        h.update(b'hello world!')
+        self.assertTrue(h.matches(HashFacet({'quickXorHash': quick_xor_by_byte(b'hello world!'), 'crc32Hash': 'X'})))
+        self.assertIsNone(h.matches(HashFacet({'sha1Hash': '430CE34D020724ED75A196DFC2AD67C77772D169'})))
+
+
+class TestHashFile(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'foo')
+        with open(self.path, 'wb') as f:
+            f.write(b'hello world!')
+
+    def test_hash_file(self):
+        h = hasher.hash_file(self.path, block_size=5, digests=[hasher.SHA1, hasher.CRC32, hasher.QUICK_XOR])
+        self.assertDictEqual({hasher.SHA1: '430CE34D020724ED75A196DFC2AD67C77772D169', hasher.CRC32: '6DC2B403',
+                              hasher.QUICK_XOR: quick_xor_by_byte(b'hello world!')}, h.values())
+
+    def test_pool(self):
+        values = hasher.submit_hash_file(self.path).result()
+        self.assertDictEqual(hasher.hash_file(self.path).values(), values)
+        with mock.patch('onedrived.common.hasher.submit_hash_file') as m:
+            hasher.get_file_values(self.path, 12)
+            m.assert_not_called()
+
+    def test_pool_before_py37(self):
+        """ The pool is built without a start method where ProcessPoolExecutor takes none. """
+        with mock.patch('onedrived.common.hasher._pool', None), mock.patch('sys.version_info', (3, 3, 0)), \
+                mock.patch('onedrived.common.hasher.ProcessPoolExecutor') as m, mock.patch('atexit.register'):
+            hasher._get_pool()
+        m.assert_called_once_with(max_workers=hasher.multiprocessing.cpu_count())
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
 
 if __name__ == '__main__':
     unittest.main()
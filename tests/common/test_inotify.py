@@ -0,0 +1,88 @@
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+
+from onedrived.common import inotify
+
+
+def pack_event(wd, mask, cookie, name):
+    name = name.encode('utf-8')
+    if len(name) > 0:
+        name += b'\0' * (16 - len(name) % 16)
+    return struct.pack('iIII', wd, mask, cookie, len(name)) + name
+
+
+class TestParseEvents(unittest.TestCase):
+    def test_parse_events(self):
+        buf = pack_event(1, inotify.IN_CREATE | inotify.IN_ISDIR, 0, 'foo') + \
+            pack_event(2, inotify.IN_MOVED_TO, 7, 'a' * 16) + pack_event(-1, inotify.IN_Q_OVERFLOW, 0, '')
+        events = inotify.parse_events(buf)
+        self.assertListEqual([inotify.Event(1, inotify.IN_CREATE | inotify.IN_ISDIR, 0, 'foo'),
+                              inotify.Event(2, inotify.IN_MOVED_TO, 7, 'a' * 16),
+                              inotify.Event(-1, inotify.IN_Q_OVERFLOW, 0, '')], events)
+
+    def test_event_names(self):
+        self.assertEqual('CREATE,ISDIR', inotify.event_names(inotify.IN_CREATE | inotify.IN_ISDIR))
+        self.assertEqual('CLOSE_WRITE', inotify.event_names(inotify.IN_CLOSE_WRITE))
+
+
+class TestTreeWatcher(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        os.makedirs(self.root + '/a/b')
+        self.watcher = inotify.TreeWatcher()
+        self.watcher.add_tree(self.root)
+
+    def read_all(self):
+        events = []
+        while True:
+            batch = self.watcher.read(0.1)
+            if len(batch) == 0:
+                return [(e.local_parent_path, inotify.event_names(e.mask), e.name) for e in events]
+            events.extend(batch)
+
+    def test_watch_tree(self):
+        self.assertEqual(3, self.watcher.watch_count)
+        os.makedirs(self.root + '/a/c/d')
+        self.assertListEqual([(self.root + '/a/', 'CREATE,ISDIR', 'c')], self.read_all())
+        # Directories created under a new directory before it was watched are watched as well.
+        self.assertEqual(5, self.watcher.watch_count)
+        with open(self.root + '/a/c/d/foo', 'w'):
+            pass
+        self.assertListEqual([(self.root + '/a/c/d/', 'CREATE', 'foo'), (self.root + '/a/c/d/', 'CLOSE_WRITE', 'foo')],
+                             self.read_all())
+
+    def test_move_tree(self):
+        os.rename(self.root + '/a', self.root + '/x')
+        events = self.read_all()
+        self.assertListEqual([(self.root + '/', 'MOVED_FROM,ISDIR', 'a'), (self.root + '/', 'MOVED_TO,ISDIR', 'x')],
+                             events)
+        self.assertEqual(3, self.watcher.watch_count)
+        os.rmdir(self.root + '/x/b')
+        self.assertListEqual([(self.root + '/x/', 'DELETE,ISDIR', 'b')], self.read_all())
+        self.assertEqual(2, self.watcher.watch_count)
+
+    def test_move_out(self):
+        outside = tempfile.mkdtemp()
+        try:
+            os.rename(self.root + '/a', outside + '/a')
+            self.assertListEqual([(self.root + '/', 'MOVED_FROM,ISDIR', 'a')], self.read_all())
+            self.assertEqual(1, self.watcher.watch_count)
+            os.mkdir(outside + '/a/c')
+            self.assertListEqual([], self.read_all())
+        finally:
+            shutil.rmtree(outside)
+
+    def test_wake(self):
+        self.watcher.wake()
+        self.assertListEqual([], self.watcher.read())
+
+    def tearDown(self):
+        self.watcher.close()
+        shutil.rmtree(self.root)
+
+
+if __name__ == '__main__':
+    unittest.main()
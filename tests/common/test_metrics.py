@@ -0,0 +1,29 @@
+import unittest
+
+from onedrived.common import metrics
+
+
+class TestMetricSet(unittest.TestCase):
+    def setUp(self):
+        self.metrics = metrics.MetricSet()
+
+    def test_timer(self):
+        timer = self.metrics.timer('op')
+        self.assertIs(timer, self.metrics.timer('op'))
+        self.assertEqual(0.0, timer.mean_sec)
+        timer.record(1.0)
+        timer.record(3.0)
+        self.assertDictEqual({'count': 2, 'total_sec': 4.0, 'max_sec': 3.0, 'mean_sec': 2.0}, timer.snapshot())
+
+    def test_counter(self):
+        self.metrics.counter('bytes').add(3)
+        self.metrics.counter('bytes').add()
+        self.assertDictEqual({'bytes': 4}, self.metrics.snapshot())
+
+    def test_type_mismatch(self):
+        self.metrics.counter('x')
+        self.assertRaises(TypeError, self.metrics.timer, 'x')
+
+
+if __name__ == '__main__':
+    unittest.main()
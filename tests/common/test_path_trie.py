@@ -0,0 +1,54 @@
+import unittest
+
+from onedrived.common.path_trie import PathTrie
+
+
+class TestPathTrie(unittest.TestCase):
+    def setUp(self):
+        self.trie = PathTrie()
+        for path in ['/a', '/a/b', '/a/b/c', '/a/bc', '/d/e']:
+            self.trie.add(path, path.upper())
+
+    def test_get(self):
+        self.assertEqual(5, len(self.trie))
+        self.assertEqual('/A/B', self.trie.get('/a/b'))
+        self.assertEqual('/A/B', self.trie.get('/a/b/'))
+        self.assertIsNone(self.trie.get('/d'))
+        self.assertNotIn('/d', self.trie)
+        self.assertIn('/d/e', self.trie)
+        self.trie.add('/a/b', 'x')
+        self.assertEqual('x', self.trie.get('/a/b'))
+        self.assertEqual(5, len(self.trie))
+
+    def test_longest_prefix(self):
+        self.assertTupleEqual(('/a/b/c', '/A/B/C'), self.trie.longest_prefix('/a/b/c/d/e'))
+        self.assertTupleEqual(('/a/b', '/A/B'), self.trie.longest_prefix('/a/b/'))
+        self.assertTupleEqual(('/a', '/A'), self.trie.longest_prefix('/a/bcd'))
+        self.assertTupleEqual((None, 'x'), self.trie.longest_prefix('/d', 'x'))
+        self.assertTupleEqual((None, None), self.trie.longest_prefix('/'))
+        self.trie.add('/', 'root')
+        self.assertTupleEqual(('/', 'root'), self.trie.longest_prefix('/d'))
+
+    def test_remove(self):
+        self.assertEqual('/A/B', self.trie.remove('/a/b'))
+        self.assertNotIn('/a/b', self.trie)
+        self.assertIn('/a/b/c', self.trie)
+        self.assertRaises(KeyError, self.trie.remove, '/a/b')
+        self.assertRaises(KeyError, self.trie.remove, '/x')
+        self.trie.remove('/d/e')
+        # Nodes left without entries are pruned.
+        self.assertNotIn('d', self.trie._root.children)
+        self.assertEqual(3, len(self.trie))
+
+    def test_pop_subtree(self):
+        popped = self.trie.pop_subtree('/a/b')
+        self.assertListEqual([('/a/b', '/A/B'), ('/a/b/c', '/A/B/C')], sorted(popped))
+        self.assertIn('/a/bc', self.trie)
+        self.assertEqual(3, len(self.trie))
+        self.assertListEqual([], self.trie.pop_subtree('/x'))
+        self.assertListEqual(['/a', '/a/bc', '/d/e'], sorted(p for p, v in self.trie.pop_subtree('/')))
+        self.assertEqual(0, len(self.trie))
+
+
+if __name__ == '__main__':
+    unittest.main()
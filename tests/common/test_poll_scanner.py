@@ -0,0 +1,124 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from onedrived.common.inotify import IN_CLOSE_WRITE, IN_CREATE, IN_DELETE, IN_ISDIR, IN_MOVED_FROM, IN_MOVED_TO
+from onedrived.common.poll_scanner import PollingScanner
+from onedrived.store.snapshot_db import SnapshotIndex
+from tests import mock
+
+
+class TestPollingScanner(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        os.makedirs(self.root + '/a/b')
+        self.write('/a/b/foo', 'foo')
+        self.write('/bar', 'bar')
+        # Directories changed within a tick of a scan are listed again by the next one, so make them older.
+        t = time.time() - 60
+        for path in ('', '/a', '/a/b'):
+            os.utime(self.root + path, (t, t))
+        self.index = SnapshotIndex()
+        self.scanner = PollingScanner([self.root, self.root + '/a'], self.index)
+        self.assertListEqual([], self.scan())
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def write(self, path, content, mode='w'):
+        with open(self.root + path, mode) as f:
+            f.write(content)
+
+    def scan(self, check_files=False):
+        events = []
+        self.scanner.scan(lambda mask, parent, name, cookie: events.append(
+            (mask, parent[len(self.root):], name, cookie)), check_files=check_files)
+        return events
+
+    def test_nested_roots(self):
+        self.assertListEqual([self.root], self.scanner.roots)
+
+    def test_unchanged(self):
+        self.assertListEqual([], self.scan(check_files=True))
+        self.assertEqual(3, self.scanner.metrics.counter('dirs_listed').value)
+        self.assertEqual(3, self.scanner.metrics.counter('dirs_skipped').value)
+
+    def test_create_and_delete(self):
+        os.remove(self.root + '/bar')
+        os.mkdir(self.root + '/a/c')
+        self.write('/a/c/baz', 'baz')
+        self.assertListEqual([(IN_DELETE, '/', 'bar', 0), (IN_CREATE | IN_ISDIR, '/a/', 'c', 0)], self.scan())
+        self.assertIsNotNone(self.index.get(self.root + '/a/c'))
+        shutil.rmtree(self.root + '/a')
+        self.assertListEqual([(IN_DELETE | IN_ISDIR, '/', 'a', 0)], self.scan())
+        self.assertEqual(1, len(self.index))
+
+    def test_racy_dir(self):
+        """ An entry created in the same mtime tick as the listing of its directory is found by the next scan. """
+        os.utime(self.root + '/a/b')
+        self.assertListEqual([], self.scan())
+        self.assertEqual(1, self.scanner.metrics.counter('dirs_racy').value)
+        st = os.stat(self.root + '/a/b')
+        self.write('/a/b/baz', 'baz')
+        # As on a file system with coarse timestamps, the mtime of the directory stays the same.
+        os.utime(self.root + '/a/b', ns=(st.st_atime_ns, st.st_mtime_ns))
+        self.assertListEqual([(IN_CREATE, '/a/b/', 'baz', 0)], self.scan())
+
+    def test_list_without_scandir(self):
+        """ Where os.scandir() is missing, directories are listed with os.listdir() into the same entries. """
+        for path in (self.root, self.root + '/a/b'):
+            entries = self.scanner._list_dir(path)
+            with mock.patch('os.scandir', None):
+                self.assertDictEqual(entries, self.scanner._list_dir(path))
+
+    def test_write_in_place(self):
+        self.write('/a/b/foo', 'more', mode='a')
+        # The directory has no new entry, so the file is only found when files are checked.
+        self.assertListEqual([], self.scan())
+        self.assertListEqual([(IN_CLOSE_WRITE, '/a/b/', 'foo', 0)], self.scan(check_files=True))
+        self.assertListEqual([], self.scan(check_files=True))
+
+    def test_move_dir(self):
+        os.rename(self.root + '/a', self.root + '/c')
+        self.write('/c/b/baz', 'baz')
+        events = self.scan()
+        self.assertListEqual([(IN_MOVED_FROM | IN_ISDIR, '/', 'a'), (IN_MOVED_TO | IN_ISDIR, '/', 'c'),
+                              (IN_CREATE, '/c/b/', 'baz')], [e[:3] for e in events])
+        self.assertEqual(events[0][3], events[1][3])
+        self.assertIsNone(self.index.get(self.root + '/a/b'))
+        self.assertIsNotNone(self.index.get(self.root + '/c/b'))
+
+    def test_swap_files(self):
+        os.rename(self.root + '/bar', self.root + '/tmp')
+        os.rename(self.root + '/a/b/foo', self.root + '/bar')
+        os.rename(self.root + '/tmp', self.root + '/a/b/foo')
+        events = self.scan()
+        self.assertListEqual([IN_MOVED_FROM, IN_MOVED_FROM, IN_MOVED_TO, IN_MOVED_TO], [e[0] for e in events])
+        moves = {e[3]: [] for e in events}
+        for e in events:
+            moves[e[3]].append(e[1] + e[2])
+        self.assertListEqual([['/a/b/foo', '/bar'], ['/bar', '/a/b/foo']], sorted(moves.values()))
+
+    def test_replace_file(self):
+        self.write('/tmp', 'new bar')
+        os.rename(self.root + '/tmp', self.root + '/bar')
+        self.assertListEqual([(IN_DELETE, '/', 'bar', 0), (IN_CREATE, '/', 'bar', 0)], self.scan())
+
+    def test_persist(self):
+        db_path = self.root + '.db'
+        self.addCleanup(os.remove, db_path)
+        scanner = PollingScanner([self.root], SnapshotIndex(db_path))
+        scanner.scan(lambda *args: self.fail())
+        scanner.index.close()
+        os.remove(self.root + '/a/b/foo')
+        scanner = PollingScanner([self.root], SnapshotIndex(db_path))
+        events = []
+        scanner.scan(lambda *args: events.append(args))
+        self.assertListEqual([(IN_DELETE, self.root + '/a/b/', 'foo', 0)], events)
+        scanner.index.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+import threading
+import unittest
+
+from onedrived.common.scheduler import Scheduler
+
+
+class TestScheduler(unittest.TestCase):
+    def setUp(self):
+        self.scheduler = Scheduler()
+        self.scheduler.start()
+        self.calls = []
+        self.done = threading.Event()
+
+    def record(self, name):
+        self.calls.append(name)
+        if name == 'last':
+            self.done.set()
+
+    def test_order(self):
+        self.scheduler.call_later(0.03, self.record, 'last')
+        self.scheduler.call_later(0.02, self.record, 'b')
+        self.scheduler.call_later(0.01, self.record, 'a')
+        self.assertEqual(3, self.scheduler.pending_count)
+        self.assertTrue(self.done.wait(2))
+        self.assertListEqual(['a', 'b', 'last'], self.calls)
+        self.assertEqual(0, self.scheduler.pending_count)
+        self.assertEqual(3, self.scheduler.metrics.timer('lateness').count)
+
+    def test_cancel(self):
+        calls = [self.scheduler.call_later(0.01, self.record, i) for i in range(10)]
+        for call in calls[:8]:
+            call.cancel()
+        calls[0].cancel()
+        self.assertEqual(2, self.scheduler.pending_count)
+        self.scheduler.call_later(0.02, self.record, 'last')
+        self.assertTrue(self.done.wait(2))
+        self.assertListEqual([8, 9, 'last'], self.calls)
+        # Cancelling a call that ran does nothing.
+        calls[9].cancel()
+        self.assertEqual(0, self.scheduler.pending_count)
+
+    def test_error(self):
+        self.scheduler.call_later(0, lambda: 1 / 0)
+        self.scheduler.call_later(0.01, self.record, 'last')
+        self.assertTrue(self.done.wait(2))
+
+    def test_close(self):
+        self.scheduler.call_later(60, self.record, 'never')
+        self.scheduler.close()
+        self.scheduler.join(2)
+        self.assertFalse(self.scheduler.is_alive())
+        self.assertListEqual([], self.calls)
+
+    def test_get_instance(self):
+        self.assertIs(Scheduler.get_instance(), Scheduler.get_instance())
+        self.assertTrue(Scheduler.get_instance().is_alive())
+
+    def tearDown(self):
+        self.scheduler.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
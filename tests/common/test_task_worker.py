@@ -18,6 +18,7 @@ class TestTaskConsumer(unittest.TestCase):
         self.task.item_name = 'foo'
         self.mock_handler = mock.Mock(return_value=None)
         self.task.handle = self.mock_handler
+        self.pool.complete_task = mock.Mock(return_value=None)
 
     def test_exec(self):
         # Start worker.
@@ -26,6 +27,7 @@ class TestTaskConsumer(unittest.TestCase):
         self.pool.add_task(self.task)
         time.sleep(0.01)
         self.mock_handler.assert_called_once_with()
+        self.pool.complete_task.assert_called_once_with(self.task)
         self.assertFalse(self.pool.has_pending_task(self.task.local_path))
         # Worker should gracefully exit.
         self.worker.terminate_sign.set()
@@ -0,0 +1,139 @@
+import unittest
+
+from onedrived.api.errors import OneDriveError
+from onedrived.api.items import DeltaCollection, OneDriveItem
+from onedrived.common.tasks.delta_task import DeltaSyncTask
+from onedrived.common.tasks.down_task import DownloadFileTask
+from onedrived.common.tasks.merge_task import MergeDirTask
+from tests import get_data, mock
+from tests.factory.tasks_factory import get_sample_task_base
+
+
+class TestDeltaSyncTask(unittest.TestCase):
+    def setUp(self):
+        self.parent_task = get_sample_task_base()
+        self.drive = self.parent_task.drive
+        self.items_store = self.parent_task.items_store
+        self.task = DeltaSyncTask(self.parent_task)
+        self.root_data = {'id': 'root_id', 'name': 'root', 'root': {}, 'folder': {'childCount': 1}}
+        self.file_data = get_data('image_item.json')
+        self.file_data['parentReference'] = {'id': 'root_id', 'driveId': self.drive.drive_id}
+        # Merges of subdirectories queued by tests are not listed ahead.
+        patcher = mock.patch('onedrived.common.tree_walker.TreeWalker.get_instance')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def set_changes(self, *pages):
+        self.drive.get_changes = mock.Mock(side_effect=[DeltaCollection(self.drive, p) for p in pages])
+
+    def assert_token_after_walk(self, token):
+        """ A merge from root is queued, and the token is stored once it is handled, not before. """
+        t = self.task.task_pool.pop_task()
+        self.assertIsInstance(t, MergeDirTask)
+        self.assertIsNone(self.items_store.get_delta_token())
+        self.assertEqual(token, self.items_store.get_delta_token(pending=True))
+        with mock.patch.object(t, '_merge'):
+            t.handle()
+        self.assertEqual(token, self.items_store.get_delta_token())
+        self.assertIsNone(self.items_store.get_delta_token(pending=True))
+
+    def test_full_merge_without_token(self):
+        self.set_changes({'value': [], '@delta.token': 'latest_token'})
+        self.task.handle()
+        self.drive.get_changes.assert_called_once_with(token=DeltaSyncTask.LATEST_TOKEN)
+        self.assert_token_after_walk('latest_token')
+
+    def test_full_merge_waits_for_walk(self):
+        self.set_changes({'value': [], '@delta.token': 'latest_token'})
+        self.task.handle()
+        root = self.task.task_pool.pop_task()
+        with mock.patch.object(root, '_merge', side_effect=lambda: root._create_merge_dir_task('a', None)):
+            root.handle()
+        # The merge of the subdirectory is part of the walk.
+        self.assertIsNone(self.items_store.get_delta_token())
+        self.assert_token_after_walk('latest_token')
+
+    def test_one_walk_at_a_time(self):
+        """ Syncs while the drive is merged from root neither enumerate changes nor start another walk. """
+        self.set_changes({'value': [], '@delta.token': 'latest_token'})
+        self.task.handle()
+        DeltaSyncTask(self.parent_task).handle()
+        self.drive.get_changes.assert_called_once_with(token=DeltaSyncTask.LATEST_TOKEN)
+        self.assertEqual(1, len(self.task.task_pool))
+        self.assert_token_after_walk('latest_token')
+
+    def test_resume_pending_walk(self):
+        """ A walk that did not finish, e.g., because the daemon stopped, is started again with its token. """
+        self.items_store.update_delta_token('pending_token', pending=True)
+        self.drive.get_changes = mock.Mock(side_effect=AssertionError('Enumerating changes is not expected.'))
+        self.task.handle()
+        self.assert_token_after_walk('pending_token')
+
+    def test_root_already_queued(self):
+        """ If drive root is already queued, the walk is started by a later sync. """
+        self.task.task_pool.add_task(MergeDirTask(self.parent_task, '', ''))
+        self.set_changes({'value': [], '@delta.token': 'latest_token'})
+        self.task.handle()
+        self.assertEqual('latest_token', self.items_store.get_delta_token(pending=True))
+        self.assertIsNone(self.task.task_pool.pop_task().walk)
+        DeltaSyncTask(self.parent_task).handle()
+        self.assert_token_after_walk('latest_token')
+
+    def test_walk_task_removed(self):
+        """ Tasks of the walk removed from the pool, e.g., for their directory was deleted, do not hold it up. """
+        self.set_changes({'value': [], '@delta.token': 'latest_token'})
+        self.task.handle()
+        root = self.task.task_pool.pop_task()
+        with mock.patch.object(root, '_merge', side_effect=lambda: root._create_merge_dir_task('a', None)):
+            root.handle()
+        self.assertIsNone(self.items_store.get_delta_token())
+        self.task.task_pool.remove_children_tasks(root.local_path + '/a')
+        self.assertEqual('latest_token', self.items_store.get_delta_token())
+
+    def test_replay_new_file(self):
+        self.items_store.update_delta_token('old_token')
+        self.set_changes({'value': [self.root_data, self.file_data], '@delta.token': 'new_token'})
+        with mock.patch('os.path.isdir', return_value=True), mock.patch('os.path.exists', return_value=False):
+            self.task.handle()
+        self.drive.get_changes.assert_called_once_with(token='old_token')
+        t = self.task.task_pool.pop_task()
+        self.assertIsInstance(t, DownloadFileTask)
+        self.assertEqual(self.drive.config.local_root + '/' + self.file_data['name'], t.local_path)
+        self.assertIsNone(self.task.task_pool.pop_task())
+        self.assertEqual('new_token', self.items_store.get_delta_token())
+
+    def test_replay_deleted_file(self):
+        self.items_store.update_delta_token('old_token')
+        self.items_store.update_item(OneDriveItem(self.drive, get_data('image_item.json')))
+        deleted_data = {'id': self.file_data['id'], 'deleted': {}, 'file': {},
+                        'parentReference': self.file_data['parentReference']}
+        self.set_changes({'value': [deleted_data], '@delta.token': 'new_token'})
+        with mock.patch('os.path.isfile', return_value=False):
+            self.task.handle()
+        self.assertEqual(0, len(self.items_store.get_items_by_id(item_id=self.file_data['id'])))
+        self.assertIsNone(self.task.task_pool.pop_task())
+
+    def test_unresolved_parent(self):
+        self.items_store.update_delta_token('old_token')
+        self.set_changes({'value': [self.file_data], '@delta.token': 'new_token'})
+        self.task.handle()
+        self.assert_token_after_walk('new_token')
+
+    def test_token_rejected(self):
+        self.items_store.update_delta_token('old_token')
+        self.drive.get_changes = mock.Mock(side_effect=[
+            OneDriveError(get_data('error_resync_required.json')),
+            DeltaCollection(self.drive, {'value': [], '@delta.token': 'latest_token'})])
+        self.task.handle()
+        self.assert_token_after_walk('latest_token')
+
+    def test_handle_error(self):
+        self.items_store.update_delta_token('old_token')
+        self.drive.get_changes = mock.Mock(side_effect=OneDriveError(get_data('error_server_internal.json')))
+        self.task.handle()
+        self.assertIsNone(self.task.task_pool.pop_task())
+        self.assertEqual('old_token', self.items_store.get_delta_token())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,3 +1,6 @@
+import os
+import shutil
+import tempfile
 import unittest
 
 from requests import codes
@@ -5,11 +8,13 @@ from requests_mock import Mocker
 
 from onedrived import OS_USER_ID, OS_USER_GID
 from onedrived.api.items import OneDriveItem
+from onedrived.common import drive_config, hasher
 from onedrived.common.dateparser import datetime_to_timestamp
 from onedrived.common.tasks.down_task import get_tmp_filename, DownloadFileTask
 from tests import get_data
 from tests import mock
 from tests.common.test_tasks import setup_os_mock
+from tests.factory import server_factory
 from tests.factory.tasks_factory import get_sample_task_base
 
 
@@ -18,6 +23,7 @@ class TestDownloadFileTask(unittest.TestCase):
         self.data = get_data('image_item.json')
         self.data['name'] = 'test'
         self.data['size'] = 1
+        self.data['file']['hashes'] = {'sha1Hash': '356A192B7913B04C54574D18C28D46E6395428AB'}
         self.parent_task = get_sample_task_base()
         self.item = OneDriveItem(drive=self.parent_task.drive, data=self.data)
         # The '/' in relative path is generated by MergeDirTask at root. Merging root itself has rel parent path ''.
@@ -33,15 +39,122 @@ class TestDownloadFileTask(unittest.TestCase):
         mock_request.get(self.task.drive.drive_uri + self.task.drive.drive_path + '/items/' + self.item.id + '/content',
                          content=b'1', status_code=codes.ok)
         m = mock.mock_open()
-        with mock.patch('builtins.open', m, create=True):
+        st = mock.Mock(st_dev=1, st_ino=2, st_size=1, st_mtime_ns=3)
+        # Otherwise requests looks for ~/.netrc with the patched os.stat.
+        self.task.drive.root.account.session.session.trust_env = False
+        with mock.patch('builtins.open', m, create=True), mock.patch('os.stat', return_value=st):
             self.task.handle()
+        self.assertEqual(('B7EFDC83', '356A192B7913B04C54574D18C28D46E6395428AB'),
+                         self.task.items_store.get_cached_hashes(st))
         self.assertEqual([(tmp_path, dest_path)], self.calls_hist['os.rename'])
         self.assertEqual([(dest_path, OS_USER_ID, OS_USER_GID)], self.calls_hist['os.chown'])
         self.assertEqual([(dest_path, (ts, ts))], self.calls_hist['os.utime'])
         self.assertEqual(tmp_path, tmp_path2)
-        m.assert_called_once_with(tmp_path2, 'wb')
+        m.assert_called_once_with(tmp_path2, 'w+b')
         handle = m()
         handle.write.assert_called_once_with(b'1')
+        record = self.task.items_store.get_items_by_id(item_id=self.item.id)[self.item.id]
+        self.assertEqual('356A192B7913B04C54574D18C28D46E6395428AB', record.sha1_hash)
+        self.assertEqual('B7EFDC83', record.crc32_hash)
+
+    @Mocker()
+    def test_handle_hash_mismatch(self, mock_request):
+        mock_request.get(self.task.drive.drive_uri + self.task.drive.drive_path + '/items/' + self.item.id + '/content',
+                         content=b'2', status_code=codes.ok)
+        with mock.patch('builtins.open', mock.mock_open(), create=True), mock.patch('os.remove') as mock_remove:
+            self.task.handle()
+        mock_remove.assert_called_once_with(self.task.local_parent_path + get_tmp_filename('test'))
+        self.assertListEqual([], self.calls_hist['os.rename'])
+        self.assertEqual(0, len(self.task.items_store.get_items_by_id(item_id=self.item.id)))
+
+
+    @Mocker()
+    def test_handle_truncated(self, mock_request):
+        """ A body shorter than the item is not put in place, and the item is not recorded. """
+        self.data['size'] = 2
+        mock_request.get(self.task.drive.drive_uri + self.task.drive.drive_path + '/items/' + self.item.id + '/content',
+                         content=b'1', status_code=codes.ok)
+        with mock.patch('builtins.open', mock.mock_open(), create=True):
+            self.task.handle()
+        self.assertListEqual([], self.calls_hist['os.rename'])
+        self.assertEqual(0, len(self.task.items_store.get_items_by_id(item_id=self.item.id)))
+
+class TestResumeDownload(unittest.TestCase):
+    SIZE = (3 << 20) + 123
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.parent_task = get_sample_task_base()
+        self.drive = self.parent_task.drive
+        self.drive.root.account.session.session.trust_env = False
+        self.drive.config = drive_config.DriveConfig({'local_root': self.tmpdir, 'max_get_size_bytes': 1 << 20})
+        self.data = get_data('image_item.json')
+        self.data['name'] = 'test'
+        self.data['size'] = self.SIZE
+        self.data['file']['hashes'] = {'crc32Hash': server_factory.get_content_hashes(self.SIZE).crc32_hex}
+        self.item = OneDriveItem(drive=self.drive, data=self.data)
+        self.task = DownloadFileTask(self.parent_task, rel_parent_path='/', item=self.item)
+        self.tmp_path = self.tmpdir + '/' + get_tmp_filename('test')
+        self.resumed = DownloadFileTask.metrics.counter('resumed_bytes')
+        self.restarted = DownloadFileTask.metrics.counter('restarted_bytes')
+        self.metrics_before = self.resumed.value, self.restarted.value
+
+    def interrupt_download(self, done_bytes):
+        """ Leave the state of a download that stopped after done_bytes, with garbage past that point. """
+        with open(self.tmp_path, 'wb') as f:
+            for offset in range(0, done_bytes, 65536):
+                f.write(server_factory.generate_content(offset, min(65536, done_bytes - offset)))
+            f.write(b'\0' * 1000)
+        self.task.items_store.update_partial_download(self.item, done_bytes)
+
+    def run_task(self, concurrency):
+        self.drive.config = drive_config.DriveConfig({'local_root': self.tmpdir, 'max_get_size_bytes': 1 << 20,
+                                                      'max_get_concurrency': concurrency})
+        with server_factory.ContentServer(self.SIZE) as server, \
+                mock.patch('os.rename', os.replace), mock.patch('os.utime'), mock.patch('os.chown'), \
+                mock.patch('os.path.isfile', lambda p: p == self.tmp_path), \
+                mock.patch('os.path.getsize', lambda p: os.stat(p).st_size):
+            self.drive.drive_uri = server.url
+            self.task.handle()
+        with open(self.tmpdir + '/test', 'rb') as f:
+            written = hasher.StreamHasher()
+            written.update(f.read())
+        self.assertEqual(server_factory.get_content_hashes(self.SIZE).sha1, written.sha1)
+        self.assertIsNone(self.task.items_store.get_partial_download(self.item.id))
+        return server.requests
+
+    def assert_metrics(self, resumed, restarted):
+        self.assertEqual(self.metrics_before[0] + resumed, self.resumed.value)
+        self.assertEqual(self.metrics_before[1] + restarted, self.restarted.value)
+
+    def run_resume(self, concurrency):
+        self.interrupt_download(2 << 20)
+        requests = self.run_task(concurrency)
+        self.assertListEqual(['bytes=%d-%d' % (2 << 20, (3 << 20) - 1), 'bytes=%d-%d' % (3 << 20, self.SIZE - 1)],
+                             sorted(r[1] for r in requests))
+        self.assert_metrics(2 << 20, 0)
+
+    def test_resume(self):
+        self.run_resume(1)
+
+    def test_resume_parallel(self):
+        self.run_resume(2)
+
+    def test_restart_changed_item(self):
+        self.interrupt_download(1 << 20)
+        self.data['eTag'] = 'changed'
+        requests = self.run_task(1)
+        self.assertEqual(4, len(requests))
+        self.assertEqual('bytes=0-%d' % ((1 << 20) - 1), requests[0][1])
+        self.assert_metrics(0, 1 << 20)
+
+    def test_progress_saved(self):
+        with mock.patch.object(self.task.items_store, 'update_partial_download') as m:
+            self.run_task(1)
+        self.assertListEqual([mock.call(self.item, n) for n in (1 << 20, 2 << 20, 3 << 20)], m.call_args_list)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
 
 
 if __name__ == '__main__':
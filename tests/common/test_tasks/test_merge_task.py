@@ -1,43 +1,146 @@
+import datetime
 import os
+import shutil
+import tempfile
 import unittest
 
-from onedrived.common.tasks.merge_task import MergeDirTask
-from tests import mock
+from onedrived.api.items import ItemCollection, OneDriveItem
+from onedrived.common.dateparser import datetime_to_str
+from onedrived.common.tasks.down_task import DownloadFileTask
+from onedrived.common.tasks.merge_task import MergeDirTask, _have_equal_hash
+from onedrived.common.tasks.up_task import UploadFileTask
+from onedrived.store.items_db import ItemRecordStatuses
+from tests import get_data, mock
 from tests.factory.tasks_factory import get_sample_task_base
 
 
+def _sorted_scandir(path, reverse=False):
+    """ os.scandir() with entries sorted by name, so that tests do not depend on the order of the file system. """
+    return iter(sorted(_scandir(path), key=lambda ent: ent.name, reverse=reverse))
+
+
+_scandir = os.scandir
+
+
 class TestMergeTask(unittest.TestCase):
     def setUp(self):
-        self.task = MergeDirTask(get_sample_task_base(), '', '')
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        base = get_sample_task_base()
+        base.drive.config.data['local_root'] = self.tmpdir
+        self.task = MergeDirTask(base, '', '')
+
+    def make_entries(self, entries):
+        """
+        :param dict[str, True | False] entries: Names of entries to make in the task directory, and whether each is a
+        directory.
+        """
+        for name, is_dir in entries.items():
+            if is_dir:
+                os.mkdir(self.tmpdir + '/' + name)
+            else:
+                with open(self.tmpdir + '/' + name, 'w'):
+                    pass
 
     def test_list_local_items(self):
         """ list_local_items lists local items, renaming case-INsensitively duplicate ones and applying ignore list."""
-        files = {
+        self.make_entries({
             'dir1.xxx': True,
             'Dir1.xxx': True,  # Case conflict with 'dir1'.
             'dir2': True,
             'file1': False,
             '.file1.!od': False
-        }
+        })
         m = mock.Mock(return_value=None)
-        os.listdir = lambda path: sorted(files.keys())
-        os.path.isdir = lambda path: files[path.replace(self.task.local_path + '/', '', 1)]
-        os.rename = m
-        all_local_items = self.task._list_local_items()
+        with mock.patch('os.scandir', side_effect=lambda p: _sorted_scandir(p)), mock.patch('os.rename', m):
+            all_local_items = self.task._list_local_items()
         self.assertSetEqual({'Dir1.xxx', 'dir1 1 (case conflict).xxx', 'dir2', 'file1'}, all_local_items)
-        m.assert_called_once_with(self.task.drive.config.local_root + '/' + 'dir1.xxx',
-                                  self.task.drive.config.local_root + '/' + 'dir1 1 (case conflict).xxx')
+        m.assert_called_once_with(self.tmpdir + '/' + 'dir1.xxx', self.tmpdir + '/' + 'dir1 1 (case conflict).xxx')
 
     def test_list_local_items_error(self):
         """ If a file has naming conflict and fails, ignore it. """
-        files = ['foo', 'Foo']
-        os.listdir = lambda p: files
-        os.path.isdir = lambda p: False
-        m = mock.Mock(side_effect=OSError())
-        os.rename = m
-        all_local_items = self.task._list_local_items()
+        self.make_entries({'foo': False, 'Foo': False})
+        with mock.patch('os.scandir', side_effect=lambda p: _sorted_scandir(p, reverse=True)), \
+                mock.patch('os.rename', side_effect=OSError()):
+            all_local_items = self.task._list_local_items()
         self.assertSetEqual({'foo'}, all_local_items)
 
+    def test_analyze_stats_once(self):
+        """ Entries are statted in the listing, not again by path when the merge looks at them. """
+        data = get_data('image_item.json')
+        folder_data = get_data('folder_item.json')
+        self.make_entries({folder_data['name']: True})
+        with open(self.tmpdir + '/' + data['name'], 'wb') as f:
+            f.write(b'0' * data['size'])
+        # Same size and mtime on both sides.
+        mtime = os.path.getmtime(self.tmpdir + '/' + data['name'])
+        data['lastModifiedDateTime'] = datetime_to_str(datetime.datetime.fromtimestamp(mtime, datetime.timezone.utc))
+        self.task.drive.get_children = mock.Mock(
+            return_value=ItemCollection(self.task.drive, {'value': [data, folder_data]}))
+        with mock.patch('os.stat', wraps=os.stat) as m:
+            self.task.handle()
+        # Only handle() checks that the directory exists.
+        m.assert_called_once_with(self.tmpdir)
+        self.assertEqual(0, len(self.task.task_pool))
+        records = self.task.items_store.get_items_by_parent(parent_path=self.task.remote_path)
+        self.assertSetEqual({data['name'], folder_data['name']}, set(records.keys()))
+
+    def test_handle_queries_records_once(self):
+        """ Records of the directory are loaded once and reconciled with both remote and local items. """
+        remote_data = get_data('image_item.json')
+        self.make_entries({'local.txt': False})
+        self.task.drive.get_children = mock.Mock(
+            return_value=ItemCollection(self.task.drive, {'value': [remote_data]}))
+        self.task.items_store.get_items_by_id = mock.Mock(side_effect=AssertionError('Point query is not expected.'))
+        get_items_by_parent = mock.Mock(wraps=self.task.items_store.get_items_by_parent)
+        self.task.items_store.get_items_by_parent = get_items_by_parent
+        self.task.handle()
+        get_items_by_parent.assert_called_once_with(parent_path=self.task.remote_path)
+        task_types = {type(self.task.task_pool.pop_task()), type(self.task.task_pool.pop_task())}
+        self.assertSetEqual({DownloadFileTask, UploadFileTask}, task_types)
+
+    def test_handle_takes_listing(self):
+        """ A listing fetched ahead by the tree walker is used instead of listing the directory again. """
+        page = [OneDriveItem(self.task.drive, get_data('folder_item.json'))]
+        walker = mock.Mock(take=mock.Mock(return_value=iter([page])))
+        self.task.drive.get_children = mock.Mock(side_effect=AssertionError('Listing is not expected.'))
+        with mock.patch('onedrived.common.tree_walker.TreeWalker.get_instance', return_value=walker):
+            self.task.handle()
+        walker.take.assert_called_once_with(self.task.rel_path)
+        # The subdirectory is listed ahead once its merge is queued.
+        t = self.task.task_pool.pop_task()
+        self.assertIsInstance(t, MergeDirTask)
+        walker.add.assert_called_once_with(t.rel_path, t.remote_path)
+
+    def test_handle_lists_again_before_delete(self):
+        """ A local item missing from a listing taken from the tree walker is only deleted if it is still missing. """
+        folder_data = get_data('folder_item.json')
+        self.make_entries({folder_data['name']: True})
+        self.task.items_store.update_item(OneDriveItem(self.task.drive, folder_data), ItemRecordStatuses.OK)
+        for fresh_page, trashed in (([folder_data], False), ([], True)):
+            walker = mock.Mock(take=mock.Mock(return_value=iter([[]])))
+            self.task.drive.get_children = mock.Mock(return_value=ItemCollection(self.task.drive,
+                                                                                 {'value': fresh_page}))
+            with mock.patch('onedrived.common.tree_walker.TreeWalker.get_instance', return_value=walker), \
+                    mock.patch('onedrived.common.tasks.merge_task.send2trash') as m:
+                self.task.handle()
+            self.task.drive.get_children.assert_called_once_with(item_path=self.task.remote_path)
+            self.assertEqual(trashed, m.called)
+
+    def test_have_equal_hash(self):
+        data = get_data('image_item.json')
+        data['file']['hashes'] = {'crc32Hash': '6DC2B403'}
+        item = OneDriveItem(self.task.drive, data)
+        with mock.patch('onedrived.common.tasks.merge_task.get_file_hashes',
+                        return_value=('6DC2B403', '430CE34D020724ED75A196DFC2AD67C77772D169')) as m:
+            self.assertTrue(_have_equal_hash(self.task.items_store, '/foo', item))
+            m.assert_called_once_with(self.task.items_store, '/foo', None)
+            data['file']['hashes'] = {'sha1Hash': '0' * 40, 'crc32Hash': '6DC2B403'}
+            self.assertFalse(_have_equal_hash(self.task.items_store, '/foo', item))
+            data['file']['hashes'] = {}
+            self.assertFalse(_have_equal_hash(self.task.items_store, '/foo', item))
+            self.assertEqual(2, m.call_count)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -1,9 +1,12 @@
 import os
+import shutil
+import tempfile
 import unittest
 
 from onedrived import OS_HOSTNAME
 from onedrived.common.tasks import utils
 from tests import mock
+from tests.factory.tasks_factory import get_sample_task_base
 
 
 class TestAppendHostnameUtil(unittest.TestCase):
@@ -21,13 +24,62 @@ class TestAppendHostnameUtil(unittest.TestCase):
 
 class TestStatFileUtil(unittest.TestCase):
     def test_stat_file(self):
-        os.path.getsize = lambda p: 1
-        os.path.getmtime = lambda p: 123123
-        size, mtime = utils.stat_file('foobar')
+        with mock.patch('os.stat', return_value=mock.Mock(st_size=1, st_mtime=123123)):
+            size, mtime = utils.stat_file('foobar')
         self.assertEqual(1, size)
         self.assertEqual(123123, mtime)
 
 
+class TestLocalDir(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        os.mkdir(self.tmpdir + '/dir')
+        with open(self.tmpdir + '/file', 'wb') as f:
+            f.write(b'hello')
+        os.symlink(self.tmpdir + '/nowhere', self.tmpdir + '/broken')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def check_entries(self, local_dir):
+        self.assertTrue(utils.is_dir_entry(local_dir.get('dir')))
+        self.assertFalse(utils.is_dir_entry(local_dir.get('file')))
+        self.assertEqual(5, utils.stat_entry(local_dir.get('file')).st_size)
+        for name in ('broken', 'missing'):
+            self.assertFalse(utils.is_dir_entry(local_dir.get(name)))
+            self.assertIsNone(utils.stat_entry(local_dir.get(name)))
+
+    def test_listed(self):
+        local_dir = utils.LocalDir(self.tmpdir)
+        self.assertSetEqual({'dir', 'file', 'broken'}, set(local_dir.list()))
+        self.check_entries(local_dir)
+        self.assertIsNone(local_dir.get('missing'))
+        # Other tests may replace os.rename(), so the new entry is written instead.
+        with open(self.tmpdir + '/file2', 'wb') as f:
+            f.write(b'hello world')
+        local_dir.renamed('file', 'file2')
+        self.assertIsNone(local_dir.get('file'))
+        self.assertEqual(11, utils.stat_entry(local_dir.get('file2')).st_size)
+
+    def test_listed_without_scandir(self):
+        """ Where os.scandir() is missing, the directory is listed with os.listdir(). """
+        with mock.patch('os.scandir', None):
+            local_dir = utils.LocalDir(self.tmpdir)
+            self.assertSetEqual({'dir', 'file', 'broken'}, set(local_dir.list()))
+        self.check_entries(local_dir)
+        self.assertIsNone(local_dir.get('missing'))
+
+    def test_not_listed(self):
+        self.check_entries(utils.LocalDir(self.tmpdir))
+
+    def test_path_entry_stats_once(self):
+        ent = utils.PathEntry(self.tmpdir + '/missing')
+        with mock.patch('os.stat', side_effect=FileNotFoundError()) as m:
+            self.assertFalse(utils.is_dir_entry(ent))
+            self.assertIsNone(utils.stat_entry(ent))
+        m.assert_called_once_with(self.tmpdir + '/missing')
+
+
 class TestMergeTaskHelperFunctions(unittest.TestCase):
     def test_unpack_first_item(self):
         d = {'key': 'val'}
@@ -37,5 +89,31 @@ class TestMergeTaskHelperFunctions(unittest.TestCase):
         self.assertEqual(1, len(d))
 
 
+class TestGetFileHashes(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = self.tmpdir + '/foo'
+        with open(self.path, 'wb') as f:
+            f.write(b'hello world!')
+        self.items_store = get_sample_task_base().items_store
+
+    def test_cached(self):
+        expected = ('6DC2B403', '430CE34D020724ED75A196DFC2AD67C77772D169')
+        self.assertEqual(expected, utils.get_file_hashes(self.items_store, self.path))
+        with mock.patch('onedrived.common.hasher.get_file_values') as m:
+            self.assertEqual(expected, utils.get_file_hashes(self.items_store, self.path))
+            m.assert_not_called()
+
+    def test_changed(self):
+        utils.get_file_hashes(self.items_store, self.path)
+        with open(self.path, 'ab') as f:
+            f.write(b'!')
+        self.assertEqual('13CCCF0A41DE644625FAAD47EB59D388BC50E6C0',
+                         utils.get_file_hashes(self.items_store, self.path)[1])
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -4,6 +4,7 @@ import unittest
 
 from onedrived.api.errors import OneDriveError
 from onedrived.api.items import OneDriveItem
+from onedrived.common import hasher
 from onedrived.common.dateparser import timestamp_to_datetime
 from onedrived.common.tasks.up_task import UpdateMetadataTask
 from onedrived.common.tasks.up_task import UploadFileTask
@@ -30,6 +31,7 @@ class TestUploadFileTask(TestUpTaskBase):
         self.assertEqual(self.parent_task.drive.config.local_root + '/' + self.data['name'], self.task.local_path)
 
     def test_handle(self):
+        self.data['file']['hashes'] = {'sha1Hash': hasher.StreamHasher().sha1}
         os.path.getsize = lambda p: self.data['size']
         os.path.getmtime = lambda p: 123412341234
         m = mock.mock_open()
@@ -38,6 +40,51 @@ class TestUploadFileTask(TestUpTaskBase):
             self.task.handle()
         self.assertEqual(1, len(self.task.items_store.get_items_by_id(item_id=self.item.id)))
 
+    def test_handle_without_item(self):
+        """ If the upload returns no item, the item is looked up and recorded. """
+        self.data['file']['hashes'] = {'sha1Hash': hasher.StreamHasher().sha1}
+        self.parent_task.drive.upload_file.return_value = None
+        self.parent_task.drive.get_item = mock.Mock(return_value=self.item)
+        os.path.getsize = lambda p: self.data['size']
+        os.path.getmtime = lambda p: 123412341234
+        m = mock.mock_open()
+        m.return_value = io.BytesIO()
+        with mock.patch('builtins.open', m, create=True):
+            self.task.handle()
+        self.parent_task.drive.get_item.assert_called_once_with(item_path=self.task.remote_path, list_children=False)
+        self.assertEqual(1, len(self.task.items_store.get_items_by_id(item_id=self.item.id)))
+
+    def test_handle_hash_mismatch(self):
+        self.data['file']['hashes'] = {'crc32Hash': 'ABCDABCD'}
+        os.path.getsize = lambda p: self.data['size']
+        os.path.getmtime = lambda p: 123412341234
+        m = mock.mock_open()
+        m.return_value = io.BytesIO()
+        with mock.patch('builtins.open', m, create=True):
+            self.task.handle()
+        self.assertEqual(0, len(self.task.items_store.get_items_by_id(item_id=self.item.id)))
+        self.parent_task.drive.update_item.assert_not_called()
+
+    def run_with_saved_session(self, size, mtime):
+        os.path.getsize = lambda p: self.data['size']
+        os.path.getmtime = lambda p: 123412341234
+        self.task.items_store.update_upload_session(self.task.local_path, 'https://foo/bar', size, mtime, 4)
+        m = mock.mock_open()
+        m.return_value = io.BytesIO()
+        with mock.patch('builtins.open', m, create=True):
+            self.task.handle()
+        self.assertIsNone(self.task.items_store.get_upload_session(self.task.local_path))
+        return self.parent_task.drive.upload_file.call_args[1]['session']
+
+    def test_handle_resume(self):
+        session = self.run_with_saved_session(self.data['size'], 123412341234)
+        self.assertEqual('https://foo/bar', session.upload_url)
+        self.assertListEqual([(4, None)], session.next_ranges)
+
+    def test_handle_file_changed(self):
+        self.assertIsNone(self.run_with_saved_session(self.data['size'], 1))
+        self.assertIsNone(self.run_with_saved_session(1, 123412341234))
+
     def test_handle_error(self):
         m = mock.mock_open()
         m.side_effect = OSError()
@@ -0,0 +1,123 @@
+import threading
+import time
+import unittest
+
+from onedrived.api.items import ItemCollection
+from onedrived.common.tree_walker import TreeWalker
+from tests import get_data, mock
+from tests.factory import drive_factory
+
+ROOT = '/drive/root:/'
+
+
+class TestTreeWalker(unittest.TestCase):
+    # Directories of the remote tree, by remote path.
+    TREE = {
+        '/drive/root:/a': ['a1', 'a2'],
+        '/drive/root:/a/a1': ['a11'],
+        '/drive/root:/a/a1/a11': [],
+        '/drive/root:/a/a2': [],
+        '/drive/root:/b': [],
+    }
+
+    def setUp(self):
+        self.drive = drive_factory.get_sample_drive_object()
+        self.drive.get_children = mock.Mock(side_effect=self.get_children)
+        self.drive.config.data['max_list_concurrency'] = 2
+        self.walker = TreeWalker(self.drive, self.drive.config.max_list_concurrency)
+        self.lock = threading.Lock()
+        self.running = 0
+        self.max_running = 0
+        self.gate = threading.Event()
+        self.gate.set()
+
+    def get_children(self, item_path):
+        with self.lock:
+            self.running += 1
+            self.max_running = max(self.running, self.max_running)
+        self.gate.wait()
+        time.sleep(0.01)
+        with self.lock:
+            self.running -= 1
+        return ItemCollection(self.drive, {'value': [self.folder(n) for n in self.TREE[item_path]]})
+
+    def folder(self, name):
+        return dict(get_data('folder_item.json'), name=name)
+
+    def add(self, *rel_paths):
+        for rel_path in rel_paths:
+            self.walker.add(rel_path, ROOT + rel_path.lstrip('/'))
+
+    def take(self, rel_path):
+        pages = self.walker.take(rel_path)
+        return None if pages is None else [[item.name for item in page] for page in pages]
+
+    def wait_idle(self):
+        while len(self.walker._queue) > 0 or self.walker._running > 0:
+            time.sleep(0.01)
+
+    def listed_paths(self):
+        return sorted(c[1]['item_path'] for c in self.drive.get_children.call_args_list)
+
+    def test_walk(self):
+        self.add('/a', '/a/a1', '/a/a1/a11', '/a/a2', '/b')
+        self.wait_idle()
+        self.assertListEqual([['a1', 'a2']], self.take('/a'))
+        self.assertListEqual([['a11']], self.take('/a/a1'))
+        self.assertListEqual([[]], self.take('/a/a1/a11'))
+        self.assertListEqual([[]], self.take('/a/a2'))
+        self.assertListEqual([[]], self.take('/b'))
+        self.assertListEqual(sorted(self.TREE), self.listed_paths())
+        self.assertLessEqual(self.max_running, 2)
+        self.assertEqual(5, self.walker.metrics.counter('hits').value)
+
+    def test_no_recursion(self):
+        """ Only directories added are listed, not the subdirectories found in their listings. """
+        self.add('/a')
+        self.wait_idle()
+        self.assertListEqual([['a1', 'a2']], self.take('/a'))
+        self.assertListEqual(['/drive/root:/a'], self.listed_paths())
+        self.assertIsNone(self.take('/a/a1'))
+
+    def test_take_queued(self):
+        self.walker.concurrency = 1
+        self.gate.clear()
+        self.add('/a', '/b')
+        while self.running == 0:
+            time.sleep(0.01)
+        # 'a' is being listed, and 'b' waits for the only thread, so its merge lists it instead.
+        self.assertIsNone(self.take('/b'))
+        self.gate.set()
+        self.assertListEqual([['a1', 'a2']], self.take('/a'))
+        self.wait_idle()
+        self.assertNotIn('/drive/root:/b', self.listed_paths())
+        self.assertEqual(1, self.walker.metrics.counter('misses').value)
+
+    def test_expire(self):
+        self.walker.READY_TTL_SEC = 0.05
+        self.add('/b')
+        while not self.drive.get_children.called:
+            time.sleep(0.01)
+        time.sleep(0.3)
+        self.assertIsNone(self.take('/b'))
+        self.assertEqual(1, self.walker.metrics.counter('expired').value)
+
+    def test_threads_exit(self):
+        """ Idle threads exit, and new ones are started for directories added afterwards. """
+        self.walker.IDLE_EXIT_SEC = 0.05
+        self.add('/a')
+        self.wait_idle()
+        while self.walker._num_threads > 0:
+            time.sleep(0.01)
+        self.add('/b')
+        self.wait_idle()
+        self.assertListEqual([[]], self.take('/b'))
+
+    def test_disabled(self):
+        self.walker.concurrency = 0
+        self.add('/a')
+        self.assertIsNone(self.take('/a'))
+        self.drive.get_children.assert_not_called()
+
+if __name__ == '__main__':
+    unittest.main()
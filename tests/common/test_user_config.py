@@ -22,6 +22,7 @@ class TestUserConfig(unittest.TestCase):
         load = self.user_conf.load(dump)
         self.assertIsInstance(load, user_config.UserConfig)
         self.assertEqual(self.user_conf.http_retry_after_seconds, load.http_retry_after_seconds)
+        self.assertEqual(self.user_conf.use_poll_snapshot, load.use_poll_snapshot)
         self.assertDictEqual(self.user_conf.default_drive_config.dump(), load.default_drive_config.dump())
 
     def test_take_effect(self):
@@ -0,0 +1,220 @@
+"""
+Local HTTP servers for tests and benchmarks that need a real connection, e.g., to check memory use of streaming.
+ContentServer serves generated file content, with support of byte ranges. Content is generated on the fly, so serving
+a large file does not take memory on the server side. UploadServer accepts upload sessions.
+"""
+
+import http.server
+import json
+import re
+import socketserver
+import threading
+import time
+
+from onedrived.common import hasher
+from tests import get_data
+
+_PATTERN = bytes(range(251)) * 300
+_CHUNK_SIZE = 65536
+
+
+def generate_content(offset, length):
+    """
+    Generate the piece of content at the given offset. Byte i of the content is i % 251.
+    :param int offset:
+    :param int length: At most _CHUNK_SIZE.
+    :rtype: bytes
+    """
+    start = offset % 251
+    return _PATTERN[start:start + length]
+
+
+def get_content_hashes(size):
+    """
+    :param int size: Size of the content.
+    :return onedrived.common.hasher.StreamHasher: Hash values of the first `size` bytes of content.
+    """
+    h = hasher.StreamHasher()
+    for offset in range(0, size, _CHUNK_SIZE):
+        h.update(generate_content(offset, min(_CHUNK_SIZE, size - offset)))
+    return h
+
+
+class _ContentHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        server = self.server
+        size = server.content_size
+        m = re.match(r'bytes=(\d+)-(\d*)$', self.headers.get('Range', ''))
+        with server.lock:
+            server.requests.append((self.path, self.headers.get('Range')))
+            server.num_active += 1
+            server.max_active = max(server.max_active, server.num_active)
+        try:
+            self._send_content(server, size, m)
+        finally:
+            with server.lock:
+                server.num_active -= 1
+
+    def _send_content(self, server, size, m):
+        if m is None:
+            first, last = 0, size - 1
+            self.send_response(200)
+        else:
+            first = int(m.group(1))
+            last = min(int(m.group(2)), size - 1) if m.group(2) else size - 1
+            self.send_response(206)
+            self.send_header('Content-Range', 'bytes %d-%d/%d' % (first, last, size))
+        self.send_header('Content-Type', 'application/octet-stream')
+        self.send_header('Content-Length', str(last - first + 1))
+        self.end_headers()
+        offset = first
+        start = time.perf_counter()
+        while offset <= last:
+            data = generate_content(offset, min(_CHUNK_SIZE, last - offset + 1))
+            self.wfile.write(data)
+            offset += len(data)
+            if server.bytes_per_sec is not None:
+                # Throttle each connection, as a remote server does, so that parallel requests pay off.
+                delay = (offset - first) / server.bytes_per_sec - (time.perf_counter() - start)
+                if delay > 0:
+                    time.sleep(delay)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _ThreadingHTTPServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+
+
+class ContentServer:
+    def __init__(self, content_size, bytes_per_sec=None):
+        """
+        :param int content_size: Size of the file served on every path.
+        :param int | None bytes_per_sec: (Optional) Maximum speed of each connection.
+        """
+        self._server = _ThreadingHTTPServer(('127.0.0.1', 0), _ContentHandler)
+        self._server.content_size = content_size
+        self._server.bytes_per_sec = bytes_per_sec
+        self._server.requests = []
+        self._server.num_active = 0
+        self._server.max_active = 0
+        self._server.lock = threading.Lock()
+        self._thread = threading.Thread(target=self._server.serve_forever)
+        self._thread.daemon = True
+
+    @property
+    def url(self):
+        return 'http://%s:%d' % self._server.server_address
+
+    @property
+    def requests(self):
+        """
+        :return [(str, str | None)]: Path and Range header of each request received.
+        """
+        return self._server.requests
+
+    @property
+    def max_active(self):
+        """
+        :return int: Maximum number of requests served at the same time.
+        """
+        return self._server.max_active
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+class _UploadHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Response headers and body are written separately, which would otherwise stall on delayed ACK of the client.
+    disable_nagle_algorithm = True
+
+    def _send_json(self, status_code, data):
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(status_code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _wait_rtt(self):
+        if self.server.rtt_sec > 0:
+            time.sleep(self.server.rtt_sec)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self._wait_rtt()
+        self.server.received = 0
+        self._send_json(200, {'uploadUrl': 'http://%s:%d/session' % self.server.server_address,
+                              'nextExpectedRanges': ['0-']})
+
+    def do_PUT(self):
+        server = self.server
+        first, last, size = map(int, re.match(r'(\d+)-(\d+)/(\d+)$', self.headers['Content-Range']).groups())
+        length = int(self.headers['Content-Length'])
+        server.fragments.append(length)
+        self._wait_rtt()
+        start = time.perf_counter()
+        remaining = length
+        while remaining > 0:
+            remaining -= len(self.rfile.read(min(_CHUNK_SIZE, remaining)))
+            if server.bytes_per_sec is not None:
+                delay = (length - remaining) / server.bytes_per_sec - (time.perf_counter() - start)
+                if delay > 0:
+                    time.sleep(delay)
+        if first != server.received or last - first + 1 != length:
+            self._send_json(416, {'error': {'code': 'invalidRange', 'message': 'Unexpected fragment.'}})
+            return
+        server.received = last + 1
+        if server.received < size:
+            self._send_json(202, {'nextExpectedRanges': ['%d-' % server.received]})
+        else:
+            item = get_data('image_item.json')
+            item['size'] = size
+            self._send_json(201, item)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class UploadServer:
+    def __init__(self, rtt_sec=0, bytes_per_sec=None):
+        """
+        A server that accepts one upload session at a time on every path.
+        :param float rtt_sec: (Optional) Delay before handling each request, as latency of the network.
+        :param int | None bytes_per_sec: (Optional) Maximum speed of receiving a fragment.
+        """
+        self._server = _ThreadingHTTPServer(('127.0.0.1', 0), _UploadHandler)
+        self._server.rtt_sec = rtt_sec
+        self._server.bytes_per_sec = bytes_per_sec
+        self._server.received = 0
+        self._server.fragments = []
+        self._thread = threading.Thread(target=self._server.serve_forever)
+        self._thread.daemon = True
+
+    @property
+    def url(self):
+        return 'http://%s:%d' % self._server.server_address
+
+    @property
+    def fragments(self):
+        """
+        :return [int]: Size of each fragment received.
+        """
+        return self._server.fragments
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._server.shutdown()
+        self._server.server_close()
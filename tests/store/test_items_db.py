@@ -1,8 +1,11 @@
+import shutil
+import tempfile
+import threading
 import unittest
 
 from onedrived.api import items
 from onedrived.store import items_db
-from tests import get_data
+from tests import get_data, mock
 from tests.factory import drive_factory, db_factory, mock_factory
 
 mock_factory.mock_register()
@@ -81,6 +84,14 @@ class TestItemStorage(unittest.TestCase):
     def test_get_item_by_remote_path(self):
         self.run_get_item(1, parent_path='AUTO', item_name='AUTO')
 
+    def test_get_items_by_parent(self):
+        records = self.itemdb.get_items_by_parent(parent_path='/drive/root:/')
+        self.assertSetEqual({self.all_items[0].name, self.all_items[1].name}, set(records.keys()))
+        self.assert_item_record(self.all_items[1], {self.all_items[1].id: records[self.all_items[1].name]})
+        records = self.itemdb.get_items_by_parent(local_parent_path=self.drive.config.local_root + '/Public')
+        self.assert_item_record(self.all_items[2], {r.item_id: r for r in records.values()})
+        self.assertDictEqual({}, self.itemdb.get_items_by_parent(parent_path='/drive/root:/foo'))
+
     def run_delete_item(self, index, **kwargs):
         item = self.all_items[index]
         self._process_kwargs(item, kwargs)
@@ -134,6 +145,75 @@ class TestItemStorage(unittest.TestCase):
         records = self.itemdb.get_items_by_id(**q)
         self.assert_item_record(item, records, items_db.ItemRecordStatuses.MOVING)
 
+    def test_move_folder(self):
+        data = self.all_items_data[1]
+        old_parent_path, old_name = data['parentReference']['path'], data['name']
+        data['parentReference']['path'] = '/drive/root:/foo'
+        data['name'] = 'bar'
+        item = items.OneDriveItem(self.drive, data)
+        self.itemdb.move_item(item, old_parent_path, old_name)
+        self.assert_item_record(item, self.itemdb.get_items_by_id(item_id=item.id))
+        child = self.all_items[2]
+        records = self.itemdb.get_items_by_id(item_id=child.id)
+        self.assertEqual('/drive/root:/foo/bar', records[child.id].parent_path)
+
+    def test_delta_token(self):
+        self.assertIsNone(self.itemdb.get_delta_token())
+        self.itemdb.update_delta_token('abc')
+        self.assertEqual('abc', self.itemdb.get_delta_token())
+        self.itemdb.update_delta_token(None)
+        self.assertIsNone(self.itemdb.get_delta_token())
+        self.itemdb.update_delta_token('def', pending=True)
+        self.assertEqual('def', self.itemdb.get_delta_token(pending=True))
+        self.assertIsNone(self.itemdb.get_delta_token())
+
+    def test_partial_download(self):
+        item = self.all_items[0]
+        self.assertIsNone(self.itemdb.get_partial_download(item.id))
+        self.itemdb.update_partial_download(item, 10)
+        self.itemdb.update_partial_download(item, 20)
+        self.assertEqual((item.e_tag, item.size, 20), self.itemdb.get_partial_download(item.id))
+        self.itemdb.delete_partial_download(item.id)
+        self.assertIsNone(self.itemdb.get_partial_download(item.id))
+
+    def test_upload_session(self):
+        self.assertIsNone(self.itemdb.get_upload_session('/tmp/foo'))
+        self.itemdb.update_upload_session('/tmp/foo', 'https://foo/bar', 10, 1.5, 0)
+        self.itemdb.update_upload_session('/tmp/foo', 'https://foo/bar', 10, 1.5, 4)
+        self.assertEqual(('https://foo/bar', 10, 1.5, 4), self.itemdb.get_upload_session('/tmp/foo'))
+        self.itemdb.delete_upload_session('/tmp/foo')
+        self.assertIsNone(self.itemdb.get_upload_session('/tmp/foo'))
+
+    def test_hash_cache(self):
+        st = mock.Mock(st_dev=1, st_ino=2, st_size=3, st_mtime_ns=4)
+        self.assertIsNone(self.itemdb.get_cached_hashes(st))
+        self.itemdb.update_cached_hashes('/a/b', st, 'C', 'S')
+        self.assertEqual(('C', 'S'), self.itemdb.get_cached_hashes(st))
+        st.st_mtime_ns = 5
+        self.assertIsNone(self.itemdb.get_cached_hashes(st))
+
+    def test_evict_cached_hashes(self):
+        paths = ['/a/b', '/a/b/c', '/a/b/c/d', '/a/bc', '/a/b0']
+        for i, path in enumerate(paths):
+            self.itemdb.update_cached_hashes(path, mock.Mock(st_dev=1, st_ino=i, st_size=0, st_mtime_ns=0), 'C', 'S')
+        self.itemdb.evict_cached_hashes('/a/b')
+        left = [path for i, path in enumerate(paths)
+                if self.itemdb.get_cached_hashes(mock.Mock(st_dev=1, st_ino=i, st_size=0, st_mtime_ns=0))]
+        self.assertListEqual(['/a/bc', '/a/b0'], left)
+        self.itemdb.prune_cached_hashes('/a', {'bc'})
+        self.assertIsNotNone(self.itemdb.get_cached_hashes(mock.Mock(st_dev=1, st_ino=3, st_size=0, st_mtime_ns=0)))
+        self.assertIsNone(self.itemdb.get_cached_hashes(mock.Mock(st_dev=1, st_ino=4, st_size=0, st_mtime_ns=0)))
+
+    def test_batch(self):
+        item = self.all_items[0]
+        self.itemdb.flush()
+        with self.itemdb.batch():
+            self.itemdb.update_status(items_db.ItemRecordStatuses.MOVING, item_id=item.id)
+            self.assertEqual(1, self.itemdb._batcher.pending_rows)
+            self.assert_item_record(item, self.itemdb.get_items_by_id(item_id=item.id),
+                                    items_db.ItemRecordStatuses.MOVING)
+        self.assertEqual(0, self.itemdb._batcher.pending_rows)
+
     def test_create_item_db_name(self):
         name = items_db.create_item_db_name(self.drive)
         self.assertIsInstance(name, str)
@@ -142,5 +222,66 @@ class TestItemStorage(unittest.TestCase):
         self.itemdb.close()
 
 
+class TestItemStorageFile(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.drive = drive_factory.get_sample_drive_object()
+        self.itemdb = items_db.ItemStorage(self.tmpdir + '/items.db', self.drive)
+        self.item = items.OneDriveItem(self.drive, get_data('image_item.json'))
+
+    def read_in_thread(self):
+        ret = []
+        t = threading.Thread(target=lambda: ret.append(self.itemdb.get_items_by_id(item_id=self.item.id)))
+        t.start()
+        t.join(5)
+        self.assertFalse(t.is_alive())
+        return ret[0]
+
+    def test_wal_mode(self):
+        self.assertEqual('wal', self.itemdb._conn.execute('PRAGMA journal_mode').fetchone()[0])
+
+    def test_read_your_writes(self):
+        self.itemdb.update_item(self.item)
+        self.assertIn(self.item.id, self.itemdb.get_items_by_id(item_id=self.item.id))
+        # Other threads see the write once it is committed.
+        self.assertDictEqual({}, self.read_in_thread())
+        self.itemdb.flush()
+        self.assertIn(self.item.id, self.read_in_thread())
+
+    def test_read_not_blocked_by_writer(self):
+        self.itemdb.update_item(self.item)
+        self.itemdb.flush()
+        self.itemdb.lock.acquire_write()
+        try:
+            self.assertIn(self.item.id, self.read_in_thread())
+        finally:
+            self.itemdb.lock.release_write()
+
+    def test_read_conns_bounded(self):
+        """ Threads that come and go leave at most MAX_IDLE_READ_CONNS connections open. """
+        self.itemdb.update_item(self.item)
+        self.itemdb.flush()
+        for _ in range(10):
+            self.assertIn(self.item.id, self.read_in_thread())
+        self.assertEqual(1, len(self.itemdb._idle_read_conns))
+        conns = [self.itemdb._get_read_conn() for _ in range(self.itemdb.MAX_IDLE_READ_CONNS + 2)]
+        for conn in conns:
+            self.itemdb._put_read_conn(conn)
+        self.assertEqual(self.itemdb.MAX_IDLE_READ_CONNS, len(self.itemdb._idle_read_conns))
+
+    def test_metrics(self):
+        self.itemdb.update_item(self.item)
+        self.itemdb.get_items_by_id(item_id=self.item.id)
+        self.itemdb.get_items_by_id(item_id=self.item.id)
+        metrics = self.itemdb.metrics.snapshot()
+        self.assertEqual(1, metrics['update_item.lock_wait']['count'])
+        self.assertEqual(2, metrics['get_items.query']['count'])
+        self.assertGreaterEqual(metrics['get_items.lock_wait']['total_sec'], 0)
+
+    def tearDown(self):
+        self.itemdb.close()
+        shutil.rmtree(self.tmpdir)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,68 @@
+import sqlite3
+import unittest
+
+from onedrived.store import items_db
+from onedrived.store import schema
+from tests import mock
+
+
+class TestSchemaUpgrade(unittest.TestCase):
+    def setUp(self):
+        self.conn = sqlite3.connect(':memory:', isolation_level=None)
+
+    def get_index_names(self):
+        return {row[0] for row in self.conn.execute("SELECT name FROM sqlite_master WHERE type='index'")}
+
+    def test_upgrade_new_database(self):
+        self.assertEqual(0, schema.get_version(self.conn))
+        version = schema.upgrade(self.conn, items_db.SCHEMA_SCRIPTS)
+        self.assertEqual(len(items_db.SCHEMA_SCRIPTS), version)
+        self.assertEqual(version, schema.get_version(self.conn))
+        self.assertIn('items_by_parent_path', self.get_index_names())
+
+    def test_upgrade_unversioned_database(self):
+        """ Databases created before versioning have the base tables but no version. """
+        self.conn.execute('CREATE TABLE items (item_id TEXT UNIQUE PRIMARY KEY ON CONFLICT REPLACE, type TEXT, '
+                          'item_name TEXT, parent_id TEXT, parent_path TEXT, etag TEXT, ctag TEXT, size INT, '
+                          'created_time TEXT, modified_time TEXT, status TEXT, crc32_hash TEXT, sha1_hash TEXT)')
+        self.conn.execute("INSERT INTO items (item_id, item_name) VALUES ('a', 'b')")
+        schema.upgrade(self.conn, items_db.SCHEMA_SCRIPTS)
+        self.assertIn('items_by_parent_id', self.get_index_names())
+        self.assertEqual(1, self.conn.execute('SELECT COUNT(*) FROM items').fetchone()[0])
+
+    def test_upgrade_is_idempotent(self):
+        schema.upgrade(self.conn, items_db.SCHEMA_SCRIPTS)
+        with mock.patch('onedrived.store.schema.get_content') as m:
+            schema.upgrade(self.conn, items_db.SCHEMA_SCRIPTS)
+            m.assert_not_called()
+
+    def test_failed_upgrade_rolls_back(self):
+        schema.upgrade(self.conn, items_db.SCHEMA_SCRIPTS[:1])
+        with mock.patch('onedrived.store.schema.get_content', return_value='CREATE INDEX foo ON bar (baz);'):
+            self.assertRaises(sqlite3.Error, schema.upgrade, self.conn, items_db.SCHEMA_SCRIPTS)
+        self.assertEqual(1, schema.get_version(self.conn))
+        self.assertFalse(self.conn.in_transaction)
+
+    def test_newer_database(self):
+        self.conn.execute('PRAGMA user_version = %d' % (len(items_db.SCHEMA_SCRIPTS) + 1))
+        self.assertRaises(ValueError, schema.upgrade, self.conn, items_db.SCHEMA_SCRIPTS)
+
+    def test_lookups_use_indexes(self):
+        schema.upgrade(self.conn, items_db.SCHEMA_SCRIPTS)
+        queries = [
+            ('SELECT * FROM items WHERE parent_path=? AND item_name=?', ('a', 'b')),
+            ('SELECT * FROM items WHERE parent_id=?', ('a',)),
+            ('SELECT * FROM items WHERE crc32_hash=? OR sha1_hash=?', ('a', 'b')),
+            ('SELECT * FROM items WHERE parent_path>=? AND parent_path<?', items_db.get_descendant_range('a')),
+        ]
+        for sql, args in queries:
+            plan = ' '.join(str(row[-1]) for row in self.conn.execute('EXPLAIN QUERY PLAN ' + sql, args))
+            self.assertIn('INDEX', plan, sql)
+            self.assertNotIn('SCAN', plan, sql)
+
+    def tearDown(self):
+        self.conn.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
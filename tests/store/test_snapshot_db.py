@@ -0,0 +1,47 @@
+import os
+import tempfile
+import unittest
+
+from onedrived.store.snapshot_db import SnapshotIndex
+
+
+class TestSnapshotIndex(unittest.TestCase):
+    def setUp(self):
+        fd, self.db_path = tempfile.mkstemp()
+        os.close(fd)
+        self.index = SnapshotIndex(self.db_path)
+        self.index.put('/a', 1, {'b': [2, 0, 0, 1], 'foo': [3, 10, 100, 0]})
+        self.index.put('/a/b', 2, {'c': [4, 0, 0, 1]})
+        self.index.put('/a/b/c', 4, {})
+        self.index.put('/ab', 5, {})
+
+    def tearDown(self):
+        self.index.close()
+        os.remove(self.db_path)
+
+    def reload(self):
+        self.index.close()
+        self.index = SnapshotIndex(self.db_path)
+
+    def test_reload(self):
+        self.reload()
+        self.assertEqual(4, len(self.index))
+        self.assertTupleEqual((1, {'b': [2, 0, 0, 1], 'foo': [3, 10, 100, 0]}), self.index.get('/a'))
+
+    def test_pop_subtree(self):
+        self.index.commit()
+        self.assertListEqual(['/a/b', '/a/b/c'], sorted(self.index.pop_subtree('/a/b')))
+        self.reload()
+        self.assertIsNone(self.index.get('/a/b/c'))
+        self.assertIsNotNone(self.index.get('/ab'))
+
+    def test_discard_bad_record(self):
+        self.index.commit()
+        self.index._conn.execute('UPDATE dirs SET entries=? WHERE path=?', ('{', '/ab'))
+        self.reload()
+        self.assertIsNone(self.index.get('/ab'))
+        self.assertEqual(3, len(self.index))
+
+
+if __name__ == '__main__':
+    unittest.main()
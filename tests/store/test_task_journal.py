@@ -0,0 +1,91 @@
+import shutil
+import tempfile
+import unittest
+
+from onedrived.api import items
+from onedrived.common.tasks.delete_task import DeleteItemTask
+from onedrived.common.tasks.down_task import DownloadFileTask
+from onedrived.common.tasks.merge_task import MergeDirTask
+from onedrived.common.tasks.up_task import UpdateMetadataTask, UploadFileTask
+from onedrived.store.task_journal import TaskJournal
+from tests import get_data
+from tests.factory import mock_factory
+from tests.factory.tasks_factory import get_sample_task_base
+
+mock_factory.mock_register()
+
+
+class TestTaskJournal(unittest.TestCase):
+    TASK_TYPES = [DeleteItemTask, DownloadFileTask, MergeDirTask, UpdateMetadataTask, UploadFileTask]
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.db_path = self.tmpdir + '/tasks.db'
+        self.base = get_sample_task_base()
+        self.journal = TaskJournal(self.db_path, self.TASK_TYPES)
+        self.item = items.OneDriveItem(self.base.drive, get_data('image_item.json'))
+        self.tasks = [
+            MergeDirTask(self.base, '/', 'Public'),
+            DownloadFileTask(self.base, '/', self.item),
+            UploadFileTask(self.base, '/Public/', 'foo.txt'),
+            DeleteItemTask(self.base, '/', 'bar', True),
+            UpdateMetadataTask(self.base, '/', 'baz', 1443400000)
+        ]
+
+    def reload(self):
+        self.journal.close()
+        self.journal = TaskJournal(self.db_path, self.TASK_TYPES)
+        return self.journal.load_tasks({self.base.drive.drive_id: self.base}.get)
+
+    def test_replay(self):
+        for t in self.tasks:
+            self.journal.record(t)
+        loaded = self.reload()
+        self.assertListEqual([type(t) for t in self.tasks], [type(t) for t in loaded])
+        for t, u in zip(self.tasks, loaded):
+            self.assertEqual(t.local_path, u.local_path)
+            self.assertEqual(t.dump(), u.dump())
+            self.assertIsNotNone(u.journal_id)
+        self.assertEqual(self.item.id, loaded[1].item_obj.id)
+        self.assertTrue(loaded[3].is_folder)
+
+    def test_complete(self):
+        for t in self.tasks:
+            self.journal.record(t)
+        self.journal.complete(self.tasks[0])
+        self.assertIsNone(self.tasks[0].journal_id)
+        # Recording a loaded task again does not duplicate it.
+        loaded = self.reload()
+        self.journal.record(loaded[0])
+        self.assertEqual(len(self.tasks) - 1, len(self.reload()))
+
+    def test_skip_unjournaled(self):
+        self.journal.record(self.base)
+        self.assertFalse(hasattr(self.base, 'journal_id'))
+        self.assertListEqual([], self.reload())
+
+    def test_discard_unknown_drive(self):
+        self.journal.record(self.tasks[0])
+        self.journal.close()
+        self.journal = TaskJournal(self.db_path, self.TASK_TYPES)
+        self.assertListEqual([], self.journal.load_tasks(lambda drive_id: None))
+        self.assertListEqual([], self.reload())
+
+    def test_task_pool(self):
+        pool = self.base.task_pool
+        pool.journal = self.journal
+        for t in self.tasks:
+            pool.add_task(t)
+        self.assertFalse(pool.add_task(MergeDirTask(self.base, '/', 'Public')))
+        pool.complete_task(pool.pop_task())
+        pool.remove_children_tasks(self.tasks[2].local_parent_path)
+        loaded = self.reload()
+        self.assertSetEqual({t.local_path for t in self.tasks[1:2] + self.tasks[3:]}, {t.local_path for t in loaded})
+
+    def tearDown(self):
+        self.journal.close()
+        shutil.rmtree(self.tmpdir)
+
+
+if __name__ == '__main__':
+    unittest.main()
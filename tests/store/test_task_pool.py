@@ -1,6 +1,10 @@
 import unittest
 
+from onedrived.api import items
+from onedrived.common.tasks import TaskBase, TaskPriorities
+from onedrived.common.tasks.down_task import DownloadFileTask
 from onedrived.store import task_pool
+from tests import get_data, mock
 from tests.factory.tasks_factory import get_sample_task_base
 
 
@@ -38,6 +42,110 @@ class TestTaskPool(unittest.TestCase):
         self.task_pool.remove_children_tasks(self.task_base.drive.config.local_root)
         self.assertFalse(self.task_pool.has_pending_task(self.task_base.local_path))
 
+    def make_task(self, rel_parent_path, item_name, task_class=TaskBase):
+        t = task_class(self.task_base)
+        t.rel_parent_path = rel_parent_path
+        t.item_name = item_name
+        return t
+
+    def test_pop_order(self):
+        class OtherTask(TaskBase):
+            pass
+
+        tasks = [self.make_task('/', 'a'), self.make_task('/', 'b', OtherTask), self.make_task('/', 'c'),
+                 self.make_task('/', 'd', OtherTask)]
+        for t in tasks:
+            self.task_pool.add_task(t)
+        self.assertEqual(4, len(self.task_pool))
+        self.assertIs(tasks[1], self.task_pool.pop_task(OtherTask))
+        # A subclass is an instance of its base class.
+        self.assertIs(tasks[0], self.task_pool.pop_task(TaskBase))
+        self.assertIs(tasks[2], self.task_pool.pop_task())
+        self.assertIs(tasks[3], self.task_pool.pop_task())
+        self.assertIsNone(self.task_pool.pop_task())
+
+    def test_remove_children_by_path_component(self):
+        tasks = [self.make_task('/foo/', 'bar'), self.make_task('/foo/bar/', 'baz'), self.make_task('/foo/', 'barn'),
+                 self.make_task('/', 'foo')]
+        for t in tasks:
+            self.task_pool.add_task(t)
+        self.task_pool.remove_children_tasks(tasks[0].local_path)
+        self.assertFalse(self.task_pool.has_pending_task(tasks[0].local_path))
+        self.assertFalse(self.task_pool.has_pending_task(tasks[1].local_path))
+        self.assertEqual(2, len(self.task_pool))
+        # Removed tasks are skipped, and the semaphore counts only the remaining ones.
+        self.assertIs(tasks[2], self.task_pool.pop_task())
+        self.assertIs(tasks[3], self.task_pool.pop_task())
+        self.assertIsNone(self.task_pool.pop_task())
+        self.assertTrue(self.task_pool.semaphore.acquire(blocking=False))
+        self.assertTrue(self.task_pool.semaphore.acquire(blocking=False))
+        self.assertFalse(self.task_pool.semaphore.acquire(blocking=False))
+
+    def test_paths_with_empty_components(self):
+        """ Paths that differ only in a trailing or repeated '/' are one path. """
+        tasks = [self.make_task('/foo/', 'bar'), self.make_task('/foo/bar/', ''), self.make_task('/foo//', 'bar')]
+        self.assertTrue(self.task_pool.add_task(tasks[0]))
+        self.assertFalse(self.task_pool.add_task(tasks[1]))
+        self.assertFalse(self.task_pool.add_task(tasks[2]))
+        self.assertTrue(self.task_pool.has_pending_task(tasks[1].local_path))
+        self.assertIs(tasks[0], self.task_pool.pop_task())
+        self.assertFalse(self.task_pool.has_pending_task(tasks[1].local_path))
+        self.assertTrue(self.task_pool.add_task(tasks[1]))
+        self.task_pool.remove_children_tasks(tasks[0].local_path)
+        self.assertEqual(0, len(self.task_pool))
+        self.assertFalse(self.task_pool.has_pending_task(tasks[1].local_path))
+
+    def test_hold(self):
+        self.task_base.should_hold = True
+        self.task_pool.add_task(self.task_base)
+        self.assertIs(self.task_base, self.task_pool.pop_task())
+        self.assertTrue(self.task_pool.has_pending_task(self.task_base.local_path))
+        self.task_pool.add_task(self.task_base)
+        self.assertIsNone(self.task_pool.pop_task())
+        self.task_pool.clear_hold(self.task_base)
+        self.assertFalse(self.task_pool.has_pending_task(self.task_base.local_path))
+
+    def make_download_task(self, name, size):
+        data = get_data('image_item.json')
+        data['name'] = name
+        data['size'] = size
+        return DownloadFileTask(self.task_base, '/', items.OneDriveItem(self.task_base.drive, data))
+
+    def test_priority_class(self):
+        self.assertEqual(TaskPriorities.METADATA, self.task_base.priority_class)
+        self.assertEqual(0, self.task_base.priority_delay)
+        small_task = self.make_download_task('small', 100)
+        large_task = self.make_download_task('large', 1 << 30)
+        self.assertEqual(TaskPriorities.SMALL_TRANSFER, small_task.priority_class)
+        self.assertEqual(TaskPriorities.LARGE_TRANSFER, large_task.priority_class)
+        self.assertLess(small_task.priority_delay, large_task.priority_delay)
+        # The delay grows with the logarithm of the size, so huge files are not starved.
+        self.assertLess(self.make_download_task('huge', 10 << 30).priority_delay, 120)
+
+    def test_metadata_first(self):
+        large_task = self.make_download_task('large', 1 << 30)
+        small_task = self.make_download_task('small', 100)
+        self.task_pool.add_task(large_task)
+        self.task_pool.add_task(small_task)
+        self.task_pool.add_task(self.task_base)
+        self.assertIs(self.task_base, self.task_pool.pop_task())
+        self.assertIs(small_task, self.task_pool.pop_task())
+        self.assertIs(large_task, self.task_pool.pop_task())
+        metrics = self.task_pool.metrics.snapshot()
+        for priority_class in [TaskPriorities.METADATA, TaskPriorities.SMALL_TRANSFER, TaskPriorities.LARGE_TRANSFER]:
+            self.assertEqual(1, metrics['wait.' + priority_class]['count'])
+
+    def test_aging(self):
+        large_task = self.make_download_task('large', 1 << 30)
+        with mock.patch('time.monotonic', return_value=1000.0):
+            self.task_pool.add_task(large_task)
+        # A metadata task queued after the delay of the large task does not overtake it.
+        with mock.patch('time.monotonic', return_value=1001.0 + large_task.priority_delay):
+            self.task_pool.add_task(self.task_base)
+            self.assertIs(large_task, self.task_pool.pop_task())
+            self.assertAlmostEqual(large_task.priority_delay + 1,
+                                   self.task_pool.metrics.timer('wait.' + TaskPriorities.LARGE_TRANSFER).max_sec)
+
 
 if __name__ == '__main__':
     unittest.main()
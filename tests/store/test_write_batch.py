@@ -0,0 +1,152 @@
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import unittest
+
+from onedrived.store.write_batch import WriteBatcher
+from onedrived.vendor.rwlock import ReadWriteLock
+
+
+class TestWriteBatcher(unittest.TestCase):
+    def setUp(self):
+        fd, self.db_path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        self.conn = sqlite3.connect(self.db_path, isolation_level=None, check_same_thread=False)
+        self.conn.execute('CREATE TABLE t (k INT PRIMARY KEY, v TEXT)')
+        self.observer = sqlite3.connect(self.db_path, isolation_level=None)
+        self.lock = ReadWriteLock()
+        self.batcher = WriteBatcher(self.conn, self.lock, max_rows=3, interval_sec=60)
+
+    def write(self, k):
+        with self.batcher.locked():
+            self.batcher.execute('INSERT OR REPLACE INTO t (k, v) VALUES (?, ?)', (k, str(k)))
+
+    def count_committed(self):
+        return self.observer.execute('SELECT COUNT(*) FROM t').fetchone()[0]
+
+    def test_commit_by_rows(self):
+        self.write(1)
+        self.write(2)
+        self.assertEqual(0, self.count_committed())
+        self.assertEqual(2, self.batcher.pending_rows)
+        # Writes are visible on the writing connection before commit.
+        self.assertEqual(2, self.conn.execute('SELECT COUNT(*) FROM t').fetchone()[0])
+        self.write(3)
+        self.assertEqual(3, self.count_committed())
+        self.assertEqual(0, self.batcher.pending_rows)
+        self.assertEqual(1, self.batcher.num_commits)
+
+    def test_commit_by_timer(self):
+        self.batcher.interval_sec = 0.01
+        self.write(1)
+        deadline = time.time() + 2
+        while self.count_committed() == 0 and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(1, self.count_committed())
+
+    def test_stale_timer(self):
+        """ A timer firing after its transaction was committed leaves the transaction opened since, and its timer. """
+        self.write(1)
+        stale_gen = self.batcher._timer_gen
+        self.batcher.flush()
+        self.write(2)
+        self.batcher._on_timer(stale_gen)
+        self.assertIsNotNone(self.batcher._timer)
+        self.assertEqual(1, self.batcher.pending_rows)
+        self.assertEqual(1, self.count_committed())
+
+    def test_flush(self):
+        self.write(1)
+        self.batcher.flush()
+        self.assertEqual(1, self.count_committed())
+        self.batcher.flush()
+        self.assertEqual(1, self.batcher.num_commits)
+
+    def test_batch(self):
+        with self.batcher.batch():
+            for i in range(10):
+                self.write(i)
+            with self.batcher.batch():
+                self.write(10)
+            self.assertEqual(0, self.count_committed())
+        self.assertEqual(11, self.count_committed())
+        self.assertEqual(1, self.batcher.num_commits)
+
+    def test_batch_rolls_back_on_error(self):
+        self.write(1)
+        try:
+            with self.batcher.batch():
+                self.write(2)
+                try:
+                    with self.batcher.batch():
+                        self.write(3)
+                        raise ValueError()
+                except ValueError:
+                    pass
+                self.write(4)
+                raise ValueError()
+        except ValueError:
+            pass
+        # Writes made before the batch are committed, and those in it are not.
+        self.assertEqual([(1,)], self.observer.execute('SELECT k FROM t').fetchall())
+        self.assertEqual(0, self.batcher.pending_rows)
+        with self.batcher.batch():
+            self.write(2)
+            try:
+                with self.batcher.batch():
+                    self.write(3)
+                    raise ValueError()
+            except ValueError:
+                pass
+        self.assertEqual([(1,), (2,)], self.observer.execute('SELECT k FROM t ORDER BY k').fetchall())
+
+    def test_batch_excludes_other_writers(self):
+        with self.batcher.batch():
+            self.write(1)
+            t = threading.Thread(target=self.write, args=(2,))
+            t.start()
+            t.join(0.05)
+            self.assertTrue(t.is_alive())
+        t.join()
+        self.assertEqual(1, self.count_committed())
+        self.batcher.flush()
+        self.assertEqual(2, self.count_committed())
+
+    def test_concurrent_writers(self):
+        self.batcher.max_rows = 50
+        threads = [threading.Thread(target=lambda n=n: [self.write(n * 100 + i) for i in range(100)])
+                   for n in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.batcher.flush()
+        self.assertEqual(400, self.count_committed())
+        self.assertLessEqual(self.batcher.num_commits, 9)
+
+    def test_commit_every_row(self):
+        self.batcher.max_rows = 1
+        self.write(1)
+        self.assertEqual(1, self.count_committed())
+        self.assertIsNone(self.batcher._timer)
+
+    def test_has_pending_writes(self):
+        self.write(1)
+        self.assertTrue(self.batcher.has_pending_writes())
+        t = threading.Thread(target=lambda: self.assertFalse(self.batcher.has_pending_writes()))
+        t.start()
+        t.join()
+        self.batcher.flush()
+        self.assertFalse(self.batcher.has_pending_writes())
+
+    def tearDown(self):
+        self.batcher.flush()
+        self.observer.close()
+        self.conn.close()
+        os.remove(self.db_path)
+
+
+if __name__ == '__main__':
+    unittest.main()